@@ -0,0 +1,154 @@
+"""
+Run a parse script's methods as child-process jobs, several at a time, each
+killed past its timeout.
+
+Each docs-* skill is installed on its own, so each carries this module next to
+its parse script; keep the copies identical.
+"""
+
+import io
+import os
+import sys
+import time
+import signal
+import resource
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+
+
+DEFAULT_TIMEOUT_SECONDS = 600
+
+
+def _peak_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def job_usage():
+    """Peak resident memory of this process and of its largest child, in MiB.
+
+    A child counts only once it has been waited for, so call this after any
+    process pool has shut down. Jobs that started no children report None.
+    """
+    return {
+        "peak_rss_mb": _peak_mb(resource.RUSAGE_SELF),
+        "peak_child_rss_mb": _peak_mb(resource.RUSAGE_CHILDREN) or None,
+    }
+
+
+def timed(parse, *args):
+    """Run one parse method and return its status and wall time."""
+    start = time.perf_counter()
+    success = bool(parse(*args))
+    return {
+        "success": success,
+        "status": "ok" if success else "failed",
+        "wall_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _job_process(conn, job_fn, args):
+    """Child process body: run a job with stdout captured, send its results.
+
+    Sends (stats, usage, log); usage is measured once the job has returned.
+    """
+    # Own process group, so a timeout also stops anything the job started.
+    os.setpgid(0, 0)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        stats = job_fn(*args)
+    conn.send((stats, job_usage(), log.getvalue()))
+    conn.close()
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+    proc.join()
+
+
+def run_jobs(jobs, max_jobs, timeout):
+    """Run jobs in child processes, at most max_jobs at a time.
+
+    Each job is (method keys, job_fn, args); job_fn returns stats keyed by the
+    methods it ran. A job gets `timeout` seconds per method (0 disables) and is
+    killed past that. Each job's output is printed as it finishes.
+
+    Memory is measured per job, so every method of a job gets the job's peaks;
+    when a job ran more than one method, each lists them under `job`.
+    """
+    ctx = multiprocessing.get_context()
+    pending = list(jobs)
+    running = {}
+    stats = {}
+    try:
+        while pending or running:
+            while pending and len(running) < max_jobs:
+                keys, job_fn, args = pending.pop(0)
+                recv, send = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_job_process, args=(send, job_fn, args))
+                proc.start()
+                send.close()
+                limit = timeout * len(keys) if timeout else None
+                running[recv] = (proc, keys, time.monotonic(), limit)
+
+            now = time.monotonic()
+            deadlines = [
+                started + limit
+                for _, _, started, limit in running.values()
+                if limit is not None
+            ]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+            for conn in multiprocessing.connection.wait(list(running), wait_for):
+                proc, keys, started, _ = running.pop(conn)
+                try:
+                    job_stats, usage, log = conn.recv()
+                except EOFError:
+                    job_stats, usage, log = None, None, ""
+                conn.close()
+                proc.join()
+                print(log, end="")
+                if job_stats is None:
+                    names = ", ".join(keys)
+                    print(f"    ⚠ Crashed (exit code {proc.exitcode}): {names}")
+                    wall = round(time.monotonic() - started, 3)
+                    for key in keys:
+                        stats[key] = {
+                            "success": False,
+                            "status": "crashed",
+                            "wall_seconds": wall,
+                            "peak_rss_mb": None,
+                            "peak_child_rss_mb": None,
+                        }
+                else:
+                    ran = [key for key in keys if key in job_stats]
+                    for key in ran:
+                        job_stats[key].update(usage)
+                        if len(ran) > 1:
+                            job_stats[key]["job"] = ran
+                    stats.update(job_stats)
+
+            now = time.monotonic()
+            for conn, (proc, keys, started, limit) in list(running.items()):
+                if limit is None or now < started + limit:
+                    continue
+                del running[conn]
+                _kill(proc)
+                conn.close()
+                print(f"    ⚠ Timed out after {limit:g}s: {', '.join(keys)}")
+                for key in keys:
+                    stats[key] = {
+                        "success": False,
+                        "status": "timeout",
+                        "wall_seconds": round(now - started, 3),
+                        "peak_rss_mb": None,
+                        "peak_child_rss_mb": None,
+                    }
+    finally:
+        for proc, _, _, _ in running.values():
+            _kill(proc)
+    return stats
@@ -9,41 +9,335 @@
 # ]
 # ///
 """
-Parse PDF files using 4 extraction methods: basic text with metadata, advanced with tables,
-fast text-only, and layout-aware extraction.
-
-Usage: ./parse_pdf.py <file_path> <output_dir>
+Parse PDF files using up to 4 extraction methods: basic text with metadata, advanced
+with tables, fast text-only, and layout-aware extraction.
+
+By default only pypdf runs, falling back to pdfplumber and then markitdown when a
+method fails or finds no text. pdfplumber is built on pdfminer, so when both run
+they share one parse: a single page walk feeds pdfplumber's text and tables and
+pdfminer's layout analysis.
+
+On large files the pypdf and pdfplumber page loops are split into page ranges
+run across a process pool (`--workers`, by default the CPU count capped by
+available memory); each worker opens the file itself and results are merged in
+page order.
+
+Selected methods run concurrently in their own processes (`--jobs`), except
+that pdfplumber and pdfminer share one process and parse, and the default
+fallback chain runs as one job. A job is killed past `--timeout` seconds per
+method, and parsing_summary.json records each method's status and wall time,
+plus the peak RSS of its job and of the job's largest page worker.
+
+Page text is streamed to disk as it is produced. Each page-based method writes
+pages/page_NNNNN.<ext> per page, appends to its content file in page order,
+and indexes each page's byte offset and length in pages.jsonl. Only the page
+being processed is held in memory.
+
+Usage: ./parse_pdf.py <file_path> <output_dir> [--methods auto|all|name,name,...]
+                      [--workers N] [--jobs N] [--timeout SECONDS]
 """
 
+import os
 import sys
 import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from pypdf import PdfReader
 import pdfplumber
 from markitdown import MarkItDown
-from pdfminer.high_level import extract_text_to_fp
-from pdfminer.layout import LAParams
-from io import StringIO
+from pdfminer.layout import LTContainer, LTText, LTTextBox
+from job_runner import DEFAULT_TIMEOUT_SECONDS, run_jobs, timed
+
+
+METHOD_NAMES = ("pypdf", "pdfplumber", "markitdown", "pdfminer")
+FALLBACK_ORDER = ("pypdf", "pdfplumber", "markitdown")
+
+# Shards smaller than this cost more in worker start-up than they save.
+MIN_SHARD_PAGES = 8
+SHARDS_PER_WORKER = 4
+# Rough resident size of one worker: interpreter plus libraries, plus the parsed
+# document, which grows with the file.
+WORKER_BASE_BYTES = 150 * 1024 * 1024
+WORKER_BYTES_PER_FILE_BYTE = 8
+
+
+def layout_text(ltpage):
+    """Render a pdfminer layout page the way pdfminer's TextConverter does.
+
+    The page-break form feed TextConverter writes after each page is added by
+    `layout_section` when pages are joined.
+    """
+    parts = []
+
+    def render(item):
+        if isinstance(item, LTContainer):
+            for child in item:
+                render(child)
+        elif isinstance(item, LTText):
+            parts.append(item.get_text())
+        if isinstance(item, LTTextBox):
+            parts.append("\n")
+
+    render(ltpage)
+    return "".join(parts)
+
+
+def markdown_section(page_num, text):
+    """A page's section in content.md, or None to leave an empty page out."""
+    if text and text.strip():
+        return f"\n## Page {page_num}\n\n{text}"
+    return None
+
+
+def layout_section(page_num, text):
+    return text + "\f"
+
+
+def page_file(pages_dir, page_num, ext):
+    return pages_dir / f"page_{page_num:05d}.{ext}"
+
+
+def reset_pages_dir(pages_dir):
+    """Empty pages_dir so a shorter re-parse leaves no stale page files."""
+    shutil.rmtree(pages_dir, ignore_errors=True)
+    pages_dir.mkdir(parents=True)
+
+
+class PageStream:
+    """Builds a method's content file from its page files, one page at a time.
+
+    Pages are added in page order as they are produced. Each page's section is
+    appended to the content file, and pages.jsonl records its byte offset and
+    length there. Empty pages get length 0 and no section.
+    """
+
+    def __init__(self, method_dir, content_name, ext, section, separator):
+        self.pages_dir = method_dir / "pages"
+        self.ext = ext
+        self.section = section
+        self.separator = separator.encode("utf-8")
+        self.content = open(method_dir / content_name, "wb")
+        self.index = open(method_dir / "pages.jsonl", "w")
+        self.offset = 0
+        self.pages = 0
+        self.sections = 0
+        self.text_pages = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.content.close()
+        self.index.close()
+
+    def add(self, page_num):
+        path = page_file(self.pages_dir, page_num, self.ext)
+        text = path.read_text(encoding="utf-8")
+        if text.strip():
+            self.text_pages += 1
+        chunk = self.section(page_num, text)
+        data = b"" if chunk is None else chunk.encode("utf-8")
+        if data:
+            if self.sections:
+                self.content.write(self.separator)
+                self.offset += len(self.separator)
+            self.content.write(data)
+            self.sections += 1
+        entry = {
+            "page": page_num,
+            "offset": self.offset,
+            "length": len(data),
+            "file": f"pages/{path.name}",
+        }
+        self.index.write(json.dumps(entry) + "\n")
+        self.offset += len(data)
+        self.pages += 1
+
+
+def available_memory():
+    """Bytes of memory available to new processes, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_workers(source_file):
+    """CPU count, capped by how many workers' documents fit in memory."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    memory = available_memory()
+    if memory is None:
+        return cpus
+    per_worker = (
+        WORKER_BASE_BYTES + WORKER_BYTES_PER_FILE_BYTE * source_file.stat().st_size
+    )
+    return max(1, min(cpus, memory // per_worker))
+
+
+def page_shards(page_count, workers):
+    """Split pages 1..page_count into contiguous (start, stop) ranges, inclusive."""
+    shards = min(workers * SHARDS_PER_WORKER, page_count // MIN_SHARD_PAGES)
+    if workers <= 1 or shards <= 1:
+        return [(1, page_count)] if page_count else []
+    size = -(-page_count // shards)
+    return [
+        (start, min(start + size - 1, page_count))
+        for start in range(1, page_count + 1, size)
+    ]
+
+
+def pypdf_range(reader, start, stop, pages_dir):
+    """Write pages start..stop of an open PdfReader to pages_dir; yield page_num."""
+    for page_num in range(start, stop + 1):
+        text = reader.pages[page_num - 1].extract_text()
+        page_file(pages_dir, page_num, "md").write_text(text, encoding="utf-8")
+        yield page_num
+
+
+def plumber_range(pdf, start, stop, pages_dir, tables_dir, layout_dir):
+    """Write pages start..stop to disk; yield (page_num, table_count).
+
+    Text goes to pages_dir and tables to tables_dir; with pages_dir None only
+    the pdfminer layout text is written, to layout_dir. Pages are closed once
+    written, so parsed objects never accumulate.
+    """
+    for page_num in range(start, stop + 1):
+        page = pdf.pages[page_num - 1]
+        table_count = 0
+        if pages_dir is not None:
+            text = page.extract_text() or ""
+            page_file(pages_dir, page_num, "md").write_text(text, encoding="utf-8")
+            tables = page.extract_tables()
+            for table_idx, table in enumerate(tables, 1):
+                table_file = tables_dir / f"page_{page_num}_table_{table_idx}.json"
+                with open(table_file, "w") as f:
+                    json.dump(table, f, indent=2)
+            table_count = len(tables)
+        if layout_dir is not None:
+            page_file(layout_dir, page_num, "txt").write_text(
+                layout_text(page.layout), encoding="utf-8"
+            )
+        page.close()
+        yield page_num, table_count
+
+
+def _pypdf_shard(source_file, start, stop, pages_dir):
+    return list(pypdf_range(PdfReader(source_file), start, stop, pages_dir))
+
+
+def _plumber_shard(source_file, start, stop, pages_dir, tables_dir, layout_dir):
+    laparams = {} if layout_dir is not None else None
+    with pdfplumber.open(source_file, laparams=laparams) as pdf:
+        return list(
+            plumber_range(pdf, start, stop, pages_dir, tables_dir, layout_dir)
+        )
+
+
+class ParseSession:
+    """One parse of the source file shared by the selected methods.
+
+    The pdfplumber document is opened once, with pdfminer layout analysis
+    enabled only when the pdfminer method is selected. Each page is walked once;
+    the walk also writes the page's layout text into the pdfminer method's
+    pages directory. Page loops over more than one shard run on a process pool
+    kept for the session; shards write their pages and return only page numbers.
+    """
+
+    def __init__(self, source_file, methods, output_dir, workers=1):
+        self.source_file = source_file
+        self.want_layout = "pdfminer" in methods
+        self.layout_dir = output_dir / "pdfminer" / "pages"
+        self.workers = workers
+        self.pdf = None
+        self.pool = None
+        self.layout_done = False
+
+    def plumber(self):
+        if self.pdf is None:
+            self.pdf = pdfplumber.open(
+                self.source_file, laparams={} if self.want_layout else None
+            )
+        return self.pdf
+
+    def run_shards(self, shards, shard_fn, *args):
+        """Yield shard_fn's per-page results for every shard, in page order."""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [
+            self.pool.submit(shard_fn, self.source_file, start, stop, *args)
+            for start, stop in shards
+        ]
+        for future in futures:
+            yield from future.result()
+
+    def pypdf_pages(self, reader, pages_dir):
+        """Write every page's text to pages_dir, yielding page numbers in order."""
+        shards = page_shards(len(reader.pages), self.workers)
+        if len(shards) <= 1:
+            yield from pypdf_range(reader, 1, len(reader.pages), pages_dir)
+        else:
+            yield from self.run_shards(shards, _pypdf_shard, pages_dir)
+
+    def plumber_pages(self, pages_dir, tables_dir):
+        """Write every page to disk, yielding (page_num, table_count) in order.
+
+        With pages_dir None, only the layout text for the pdfminer method is
+        written.
+        """
+        page_count = len(self.plumber().pages)
+        shards = page_shards(page_count, self.workers)
+        layout_dir = self.layout_dir if self.want_layout else None
+        if layout_dir is not None:
+            reset_pages_dir(layout_dir)
+        if len(shards) <= 1:
+            yield from plumber_range(
+                self.plumber(), 1, page_count, pages_dir, tables_dir, layout_dir
+            )
+        else:
+            yield from self.run_shards(
+                shards, _plumber_shard, pages_dir, tables_dir, layout_dir
+            )
+        self.layout_done = layout_dir is not None
+
+    def close(self):
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
 
 
-def parse_method1_pypdf(source_file, output_dir):
+def parse_method1_pypdf(session, output_dir):
     """Basic text extraction with PDF metadata using pypdf."""
     print("    Method 1: pypdf...")
     method_dir = output_dir / "pypdf"
     method_dir.mkdir(exist_ok=True)
 
     try:
-        reader = PdfReader(source_file)
+        reader = PdfReader(session.source_file)
+        pages_dir = method_dir / "pages"
+        reset_pages_dir(pages_dir)
 
-        text_content = []
-        for page_num, page in enumerate(reader.pages, 1):
-            text = page.extract_text()
-            if text.strip():
-                text_content.append(f"\n## Page {page_num}\n\n{text}")
-
-        with open(method_dir / "content.md", "w") as f:
-            f.write("\n\n".join(text_content))
+        with PageStream(
+            method_dir, "content.md", "md", markdown_section, "\n\n"
+        ) as stream:
+            for page_num in session.pypdf_pages(reader, pages_dir):
+                stream.add(page_num)
 
         metadata = {
             "pages": len(reader.pages),
@@ -55,6 +349,9 @@ def parse_method1_pypdf(source_file, output_dir):
         with open(method_dir / "metadata.json", "w") as f:
             json.dump(metadata, f, indent=2)
 
+        if not stream.sections:
+            print(f"      ⚠ No text found in {len(reader.pages)} pages")
+            return False
         print(f"      ✓ Extracted text from {len(reader.pages)} pages")
         return True
     except Exception as e:
@@ -62,7 +359,7 @@ def parse_method1_pypdf(source_file, output_dir):
         return False
 
 
-def parse_method2_pdfplumber(source_file, output_dir):
+def parse_method2_pdfplumber(session, output_dir):
     """Advanced extraction with table parsing using pdfplumber."""
     print("    Method 2: pdfplumber...")
     method_dir = output_dir / "pdfplumber"
@@ -71,35 +368,31 @@ def parse_method2_pdfplumber(source_file, output_dir):
     tables_dir.mkdir(exist_ok=True)
 
     try:
-        with pdfplumber.open(source_file) as pdf:
-            text_content = []
-            table_count = 0
-
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text()
-                if text and text.strip():
-                    text_content.append(f"\n## Page {page_num}\n\n{text}")
-
-                tables = page.extract_tables()
-                for table_idx, table in enumerate(tables, 1):
-                    table_count += 1
-                    table_file = tables_dir / f"page_{page_num}_table_{table_idx}.json"
-                    with open(table_file, "w") as f:
-                        json.dump(table, f, indent=2)
-
-            with open(method_dir / "content.md", "w") as f:
-                f.write("\n\n".join(text_content))
-
-            print(
-                f"      ✓ Extracted text from {len(pdf.pages)} pages and {table_count} tables"
-            )
-            return True
+        pages_dir = method_dir / "pages"
+        reset_pages_dir(pages_dir)
+        table_count = 0
+
+        with PageStream(
+            method_dir, "content.md", "md", markdown_section, "\n\n"
+        ) as stream:
+            for page_num, page_tables in session.plumber_pages(pages_dir, tables_dir):
+                stream.add(page_num)
+                table_count += page_tables
+
+        page_count = stream.pages
+        if not stream.sections and not table_count:
+            print(f"      ⚠ No text or tables found in {page_count} pages")
+            return False
+        print(
+            f"      ✓ Extracted text from {page_count} pages and {table_count} tables"
+        )
+        return True
     except Exception as e:
         print(f"      ⚠ Failed: {str(e)[:100]}")
         return False
 
 
-def parse_method3_markitdown(source_file, output_dir):
+def parse_method3_markitdown(session, output_dir):
     """Fast text-only extraction using Microsoft's markitdown."""
     print("    Method 3: markitdown...")
     method_dir = output_dir / "markitdown"
@@ -107,7 +400,7 @@ def parse_method3_markitdown(source_file, output_dir):
 
     try:
         md = MarkItDown()
-        result = md.convert(str(source_file))
+        result = md.convert(str(session.source_file))
 
         with open(method_dir / "content.md", "w") as f:
             f.write(result.text_content)
@@ -119,58 +412,166 @@ def parse_method3_markitdown(source_file, output_dir):
         return False
 
 
-def parse_method4_pdfminer(source_file, output_dir):
-    """Layout-aware text extraction for complex multi-column PDFs."""
+def parse_method4_pdfminer(session, output_dir):
+    """Layout-aware text extraction for complex multi-column PDFs.
+
+    Reuses the layout from the pdfplumber walk when that method already ran.
+    """
     print("    Method 4: pdfminer.six...")
     method_dir = output_dir / "pdfminer"
     method_dir.mkdir(exist_ok=True)
 
     try:
-        output_string = StringIO()
+        if not session.layout_done:
+            for _ in session.plumber_pages(None, None):
+                pass
+
+        with PageStream(method_dir, "content.txt", "txt", layout_section, "") as stream:
+            for page_num in range(1, len(session.plumber().pages) + 1):
+                stream.add(page_num)
+
+        page_count = stream.pages
+        if not stream.text_pages:
+            print(f"      ⚠ No text found in {page_count} pages")
+            return False
+        print(f"      ✓ Extracted layout-aware text from {page_count} pages")
+        return True
+    except Exception as e:
+        print(f"      ⚠ Failed: {str(e)[:100]}")
+        return False
 
-        with open(source_file, "rb") as fin:
-            extract_text_to_fp(
-                fin, output_string, laparams=LAParams(), output_type="text", codec=None
-            )
 
-        text = output_string.getvalue()
+METHODS = {
+    "pypdf": ("method1_pypdf", parse_method1_pypdf),
+    "pdfplumber": ("method2_pdfplumber", parse_method2_pdfplumber),
+    "markitdown": ("method3_markitdown", parse_method3_markitdown),
+    "pdfminer": ("method4_pdfminer", parse_method4_pdfminer),
+}
 
-        with open(method_dir / "content.txt", "w") as f:
-            f.write(text)
 
-        page_count = text.count("\f") + 1 if text else 0
+def run_pdf_job(names, fallback, source_file, output_dir, workers):
+    """Run methods sharing one ParseSession; a fallback chain stops at a success.
 
-        print(f"      ✓ Extracted layout-aware text (approx. {page_count} pages)")
-        return True
-    except Exception as e:
-        print(f"      ⚠ Failed: {str(e)[:100]}")
-        return False
+    When pdfminer reuses the layout from pdfplumber's page walk, the walk's cost
+    is in pdfplumber's wall time and pdfminer's covers only writing its output;
+    both entries name the other under `shared_parse`.
+    """
+    session = ParseSession(source_file, names, output_dir, workers)
+    stats = {}
+    try:
+        for name in names:
+            key, parse = METHODS[name]
+            reused = name == "pdfminer" and session.layout_done
+            stats[key] = timed(parse, session, output_dir)
+            if reused:
+                plumber_key = METHODS["pdfplumber"][0]
+                stats[key]["shared_parse"] = plumber_key
+                stats[plumber_key]["shared_parse"] = key
+            if fallback and stats[key]["success"]:
+                break
+    finally:
+        session.close()
+    return stats
+
+
+def plan_jobs(methods, fallback):
+    """Group method names into jobs, keeping methods that share a parse together."""
+    if fallback:
+        return [methods]
+    shared = [name for name in methods if name in ("pdfplumber", "pdfminer")]
+    groups = [[name] for name in methods if name not in shared]
+    if shared:
+        groups.insert(0, shared)
+    return groups
+
+
+def select_methods(spec):
+    """Return (methods, fallback) for a --methods value."""
+    if spec == "auto":
+        return list(FALLBACK_ORDER), True
+    if spec == "all":
+        return list(METHOD_NAMES), False
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in METHODS]
+    if unknown or not names:
+        raise ValueError(
+            f"Unknown method(s): {', '.join(unknown) or repr(spec)}; "
+            f"choose from auto, all, {', '.join(METHOD_NAMES)}"
+        )
+    # Keep the canonical order so pdfplumber's walk runs before pdfminer reuses it.
+    return [name for name in METHOD_NAMES if name in names], False
 
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: ./parse_pdf.py <file_path> <output_dir>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Parse a PDF into text artifacts")
+    parser.add_argument("file_path")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--methods",
+        default="auto",
+        help="auto (pypdf, falling back to pdfplumber then markitdown), all, "
+        "or a comma-separated list of: " + ", ".join(METHOD_NAMES),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Processes for page-range sharding of pypdf and pdfplumber, split "
+        "across concurrent jobs (default: CPU count capped by available memory)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Method jobs run at once (default: all, up to the CPU count)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT_SECONDS,
+        help="Seconds per method before its job is killed (0 disables)",
+    )
+    args = parser.parse_args()
+
+    source_file = Path(args.file_path)
+    output_dir = Path(args.output_dir)
 
-    source_file = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
+    try:
+        methods, fallback = select_methods(args.methods)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     if not source_file.exists():
         print(f"Error: File not found: {source_file}")
         sys.exit(1)
 
+    groups = plan_jobs(methods, fallback)
+    max_jobs = args.jobs if args.jobs > 0 else min(len(groups), os.cpu_count() or 1)
+    workers = args.workers if args.workers > 0 else default_workers(source_file)
+    job_workers = max(1, workers // min(max_jobs, len(groups)))
+
     print(f"Parsing PDF: {source_file.name}")
     print(f"Output directory: {output_dir}")
+    print(f"Jobs: {max_jobs}, page workers per job: {job_workers}")
     print()
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    methods_success = {
-        "method1_pypdf": parse_method1_pypdf(source_file, output_dir),
-        "method2_pdfplumber": parse_method2_pdfplumber(source_file, output_dir),
-        "method3_markitdown": parse_method3_markitdown(source_file, output_dir),
-        "method4_pdfminer": parse_method4_pdfminer(source_file, output_dir),
-    }
+    jobs = [
+        (
+            [METHODS[name][0] for name in names],
+            run_pdf_job,
+            (names, fallback, source_file, output_dir, job_workers),
+        )
+        for names in groups
+    ]
+    start = time.perf_counter()
+    method_stats = run_jobs(jobs, max_jobs, args.timeout)
+    wall_seconds = round(time.perf_counter() - start, 3)
+    # Canonical order; fallback methods that never ran are left out.
+    ran = [METHODS[name][0] for name in methods if METHODS[name][0] in method_stats]
+    methods_success = {key: method_stats[key]["success"] for key in ran}
 
     success_count = sum(methods_success.values())
     print(f"\n  ✓ Completed: {success_count}/{len(methods_success)} methods successful")
@@ -179,8 +580,14 @@ def main():
         "timestamp": datetime.now().isoformat(),
         "source_file": str(source_file),
         "output_dir": str(output_dir),
+        "requested_methods": args.methods,
+        "workers": job_workers,
         "methods": methods_success,
         "success_count": success_count,
+        "jobs": max_jobs,
+        "timeout_seconds": args.timeout,
+        "wall_seconds": wall_seconds,
+        "method_stats": {key: method_stats[key] for key in ran},
     }
 
     with open(output_dir / "parsing_summary.json", "w") as f:
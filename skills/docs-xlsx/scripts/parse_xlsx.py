@@ -10,15 +10,23 @@
 Parse Excel files using 4 extraction methods: basic CSV export, structure with JSON,
 detailed analysis with statistics, and formula extraction.
 
-Usage: ./parse_xlsx.py <file_path> <output_dir>
+The methods are independent, so each runs in its own process, several at a time
+(`--jobs`), and is killed if it runs past `--timeout` seconds.
+parsing_summary.json records each method's status, wall time and peak RSS.
+
+Usage: ./parse_xlsx.py <file_path> <output_dir> [--jobs N] [--timeout SECONDS]
 """
 
+import os
 import sys
 import json
+import time
+import argparse
 from pathlib import Path
 from datetime import datetime
 import pandas as pd
 from openpyxl import load_workbook
+from job_runner import DEFAULT_TIMEOUT_SECONDS, run_jobs, timed
 
 
 def parse_method1_pandas(source_file, output_dir):
@@ -201,13 +209,40 @@ def parse_method4_openpyxl_formulas(source_file, output_dir):
         return False
 
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: ./parse_xlsx.py <file_path> <output_dir>")
-        sys.exit(1)
+METHODS = [
+    ("method1_pandas_basic", parse_method1_pandas),
+    ("method2_openpyxl_structure", parse_method2_openpyxl),
+    ("method3_pandas_detailed", parse_method3_pandas_detailed),
+    ("method4_openpyxl_formulas", parse_method4_openpyxl_formulas),
+]
+
 
-    source_file = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
+def run_method(key, parse, source_file, output_dir):
+    return {key: timed(parse, source_file, output_dir)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parse an Excel workbook into text artifacts"
+    )
+    parser.add_argument("file_path")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Methods run at once (default: all, up to the CPU count)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT_SECONDS,
+        help="Seconds per method before it is killed (0 disables)",
+    )
+    args = parser.parse_args()
+
+    source_file = Path(args.file_path)
+    output_dir = Path(args.output_dir)
 
     if not source_file.exists():
         print(f"Error: File not found: {source_file}")
@@ -219,16 +254,15 @@ def main():
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    methods_success = {
-        "method1_pandas_basic": parse_method1_pandas(source_file, output_dir),
-        "method2_openpyxl_structure": parse_method2_openpyxl(source_file, output_dir),
-        "method3_pandas_detailed": parse_method3_pandas_detailed(
-            source_file, output_dir
-        ),
-        "method4_openpyxl_formulas": parse_method4_openpyxl_formulas(
-            source_file, output_dir
-        ),
-    }
+    jobs = [
+        ([key], run_method, (key, parse, source_file, output_dir))
+        for key, parse in METHODS
+    ]
+    max_jobs = args.jobs if args.jobs > 0 else min(len(jobs), os.cpu_count() or 1)
+    start = time.perf_counter()
+    method_stats = run_jobs(jobs, max_jobs, args.timeout)
+    wall_seconds = round(time.perf_counter() - start, 3)
+    methods_success = {key: method_stats[key]["success"] for key, _ in METHODS}
 
     success_count = sum(methods_success.values())
     print(f"\n  ✓ Completed: {success_count}/{len(methods_success)} methods successful")
@@ -239,6 +273,10 @@ def main():
         "output_dir": str(output_dir),
         "methods": methods_success,
         "success_count": success_count,
+        "jobs": max_jobs,
+        "timeout_seconds": args.timeout,
+        "wall_seconds": wall_seconds,
+        "method_stats": {key: method_stats[key] for key, _ in METHODS},
     }
 
     with open(output_dir / "parsing_summary.json", "w") as f:
@@ -0,0 +1,307 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+
+"""Scale teammate sessions with the ready-task queue.
+
+Each tick counts unassigned ready tasks and busy teammates, spawns through
+spawn.sh while demand exceeds live teammates (up to --max), and retires
+teammates idle for --idle-timeout through the shutdown_request flow (down to
+--min). A retiring teammate is removed with --reset-tasks --cleanup-session once
+it answers `shutdown_approved` or the grace period runs out; `shutdown_rejected`,
+or picking up work while retiring, keeps it. Bookkeeping lives in
+`teams/<team>/autoscale.json`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import profiling
+from common import (
+    assert_lead_only,
+    autoscale_state_path,
+    emit,
+    file_lock,
+    load_config,
+    lock_path_for_autoscale,
+    now_ms,
+    profile_command,
+    read_json,
+    run_command,
+    write_json_atomic,
+)
+from inbox import shutdown_request
+from inbox_store import headers
+from opencode_api import OpenCodeAPIError, session_statuses
+from task_store import read_index
+from tasks import open_blockers
+from team import remove_member
+
+
+SPAWN_SCRIPT = Path(__file__).resolve().parent / "spawn.sh"
+DEFAULT_PROMPT = (
+    "Work on the tasks team-lead assigns to you and report progress to team-lead."
+)
+
+
+def load_state(team: str) -> dict[str, Any]:
+    state = read_json(autoscale_state_path(team), {})
+    if not isinstance(state, dict):
+        state = {}
+    state.setdefault("lastActive", {})
+    state.setdefault("retiring", {})
+    return state
+
+
+def observe(team: str, state: dict[str, Any], now: int) -> dict[str, Any]:
+    """Demand and per-teammate activity, updating lastActive in state."""
+    cfg = load_config(team)
+    index_tasks = read_index(team)["tasks"]
+    open_by_owner = Counter(
+        str(entry.get("owner"))
+        for entry in index_tasks.values()
+        if entry.get("owner") and entry.get("status") in {"pending", "in_progress"}
+    )
+    ready = sum(
+        1
+        for tid, entry in index_tasks.items()
+        if entry.get("status") == "pending"
+        and not entry.get("owner")
+        and not open_blockers(index_tasks, tid)
+    )
+    try:
+        statuses = session_statuses()
+    except OpenCodeAPIError:
+        statuses = {}
+
+    last_message: dict[str, int] = {}
+    replies: dict[str, tuple[str, int]] = {}
+    for header in headers(team, "team-lead"):
+        sender = str(header.get("from") or "")
+        stamp = header.get("timestampMs") or 0
+        last_message[sender] = max(last_message.get(sender, 0), stamp)
+        if header.get("summary") in {"shutdown_approved", "shutdown_rejected"}:
+            replies[sender] = (str(header["summary"]), stamp)
+
+    teammates: list[dict[str, Any]] = []
+    for member in cfg.get("members", []):
+        if not isinstance(member, dict) or member.get("name") == "team-lead":
+            continue
+        name = str(member.get("name"))
+        busy = bool(open_by_owner.get(name)) or (
+            statuses.get(str(member.get("opencodeSessionId") or "")) == "busy"
+        )
+        last = max(
+            int(state["lastActive"].get(name) or member.get("joinedAt") or now),
+            last_message.get(name, 0),
+        )
+        if busy:
+            last = now
+        state["lastActive"][name] = last
+        teammates.append(
+            {
+                "name": name,
+                "busy": busy,
+                "openTasks": open_by_owner.get(name, 0),
+                "idleMs": now - last,
+                "reply": replies.get(name),
+            }
+        )
+    return {"ready": ready, "teammates": teammates}
+
+
+def plan(
+    observed: dict[str, Any], state: dict[str, Any], args: argparse.Namespace, now: int
+) -> list[dict[str, Any]]:
+    actions: list[dict[str, Any]] = []
+    retiring = state["retiring"]
+    present = {t["name"] for t in observed["teammates"]}
+    for name in list(retiring):
+        if name not in present:
+            del retiring[name]
+
+    live = [t for t in observed["teammates"] if t["name"] not in retiring]
+    for teammate in observed["teammates"]:
+        request = retiring.get(teammate["name"])
+        if request is None:
+            continue
+        reply = teammate["reply"]
+        answered = reply is not None and reply[1] >= request["requestedAt"]
+        if teammate["busy"] or (answered and reply[0] == "shutdown_rejected"):
+            actions.append({"action": "keep", "name": teammate["name"]})
+        elif (answered and reply[0] == "shutdown_approved") or (
+            now - request["requestedAt"] >= args.grace * 1000
+        ):
+            actions.append({"action": "remove", "name": teammate["name"]})
+
+    busy = sum(1 for t in live if t["busy"])
+    desired = min(args.max, max(args.min, busy + observed["ready"]))
+    if desired > len(live):
+        taken = present | set(retiring)
+        candidate = 1
+        for _ in range(min(args.step, desired - len(live))):
+            while f"{args.name_prefix}-{candidate}" in taken:
+                candidate += 1
+            name = f"{args.name_prefix}-{candidate}"
+            taken.add(name)
+            actions.append({"action": "spawn", "name": name})
+    elif desired < len(live):
+        idle = sorted(
+            (
+                t
+                for t in live
+                if not t["busy"] and t["idleMs"] >= args.idle_timeout * 1000
+            ),
+            key=lambda t: -t["idleMs"],
+        )
+        for teammate in idle[: min(args.step, len(live) - desired)]:
+            actions.append({"action": "retire", "name": teammate["name"]})
+    return actions
+
+
+def spawn(team: str, name: str, args: argparse.Namespace) -> dict[str, Any]:
+    cmd = [str(SPAWN_SCRIPT), "--team", team, "--name", name, "--prompt", args.prompt]
+    if args.model:
+        cmd += ["--model", args.model]
+    if args.agent_type:
+        cmd += ["--agent-type", args.agent_type]
+    if args.runtime:
+        cmd += ["--runtime", args.runtime]
+    proc = run_command(cmd)
+    if proc.returncode != 0:
+        return {"ok": False, "error": (proc.stderr or proc.stdout).strip()[-300:]}
+    return {"ok": True}
+
+
+def has_open_tasks(team: str, name: str) -> bool:
+    return any(
+        entry.get("owner") == name and entry.get("status") in {"pending", "in_progress"}
+        for entry in read_index(team)["tasks"].values()
+    )
+
+
+def apply(
+    team: str, state: dict[str, Any], action: dict[str, Any], args: argparse.Namespace
+) -> dict[str, Any]:
+    name = action["name"]
+    now = now_ms()
+    if action["action"] == "spawn":
+        outcome = spawn(team, name, args)
+        if outcome["ok"]:
+            state["lastActive"][name] = now
+        return outcome
+    if action["action"] == "retire":
+        result = shutdown_request(team, name, "autoscale: idle")
+        state["retiring"][name] = {
+            "requestedAt": now,
+            "requestId": result.get("request_id"),
+        }
+        return {"ok": True}
+    if action["action"] == "keep":
+        state["retiring"].pop(name, None)
+        state["lastActive"][name] = now
+        return {"ok": True}
+    if has_open_tasks(team, name):
+        # Work assigned after observe() cancels the removal.
+        state["retiring"].pop(name, None)
+        state["lastActive"][name] = now
+        return {"ok": True, "action": "keep", "reason": "open tasks"}
+    result = remove_member(team, name, reset_tasks=True, cleanup_session=True)
+    state["retiring"].pop(name, None)
+    state["lastActive"].pop(name, None)
+    return {"ok": True, "resetTasks": result.get("reset_tasks", 0)}
+
+
+def tick(team: str, args: argparse.Namespace) -> dict[str, Any]:
+    with file_lock(lock_path_for_autoscale(team)):
+        state = load_state(team)
+        now = now_ms()
+        observed = observe(team, state, now)
+        actions = plan(observed, state, args, now)
+        if not args.dry_run:
+            for action in actions:
+                try:
+                    action.update(apply(team, state, action, args))
+                except Exception as exc:
+                    action.update({"ok": False, "error": str(exc)})
+            state["lastTick"] = now
+            write_json_atomic(autoscale_state_path(team), state)
+    removed = {a["name"] for a in actions if a["action"] == "remove" and a.get("ok")}
+    teammates = [t for t in observed["teammates"] if t["name"] not in removed]
+    live = [t for t in teammates if t["name"] not in state["retiring"]]
+    return {
+        "success": True,
+        "team": team,
+        "dryRun": args.dry_run,
+        "ready": observed["ready"],
+        "teammates": len(teammates),
+        "live": len(live),
+        "busy": sum(1 for t in live if t["busy"]),
+        "retiring": sorted(state["retiring"]),
+        "actions": actions,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Spawn and retire teammates from ready-queue depth"
+    )
+    parser.add_argument("--team", required=True)
+    parser.add_argument("--min", type=int, default=0, help="Teammates to keep")
+    parser.add_argument("--max", type=int, default=4, help="Teammate ceiling")
+    parser.add_argument(
+        "--idle-timeout", type=int, default=300, help="Seconds idle before retiring"
+    )
+    parser.add_argument(
+        "--grace", type=int, default=120, help="Seconds to await shutdown approval"
+    )
+    parser.add_argument("--interval", type=float, default=30.0, help="Seconds")
+    parser.add_argument("--step", type=int, default=2, help="Max changes per tick")
+    parser.add_argument("--once", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--name-prefix", default="worker")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--model", default="")
+    parser.add_argument("--agent-type", default="")
+    parser.add_argument("--runtime", default="", choices=["", "headless", "tui"])
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    profile_command("autoscale.py", "tick", args.team)
+    try:
+        assert_lead_only("autoscale", args.team)
+        if args.min < 0 or args.max < args.min or args.step < 1:
+            raise ValueError("Need 0 <= --min <= --max and --step >= 1")
+        if args.once:
+            emit(tick(args.team, args))
+            return 0
+        while True:
+            # Each tick is its own profiled command so spans never pile up.
+            profile_command("autoscale.py", "tick", args.team)
+            try:
+                result = tick(args.team, args)
+            except Exception as exc:
+                result = {"success": False, "error": str(exc)}
+            finally:
+                profiling.end_command()
+            print(json.dumps(result, ensure_ascii=True), flush=True)
+            time.sleep(max(1.0, args.interval))
+    except KeyboardInterrupt:
+        return 0
+    except Exception as exc:
+        emit({"success": False, "error": str(exc)})
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
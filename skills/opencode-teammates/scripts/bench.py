@@ -0,0 +1,358 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+
+"""Scale benchmark for the teammate scripts against synthetic teams.
+
+Each scale builds a throwaway OPENCODE_TEAM_HOME, points OPENCODE_SERVER_URL at
+opencode_stub, and times the script entry points in-process.
+
+Async pushes run with OPENCODE_TEAM_DELIVERY=manual, so no detached worker
+outlives the run: `send` and `broadcast` time what the caller waits for, and
+`deliver` times one in-process worker pass draining what they queued. The
+coalescing window defaults to 0 here so push timings measure work, not waiting.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from opencode_stub import start_stub
+from profiling import percentile
+
+
+SCALES: dict[str, list[tuple[int, int, int]]] = {
+    "small": [(5, 200, 1000)],
+    "medium": [(1, 100, 100), (20, 2000, 10000), (50, 10000, 20000)],
+    "large": [(1, 100, 100), (50, 10000, 20000), (200, 50000, 100000)],
+}
+TEAM = "bench"
+
+
+def build_team(members: int, tasks: int, messages: int, rng: random.Random) -> None:
+    from common import (
+        ensure_dirs,
+        inbox_path,
+        now_iso,
+        now_ms,
+        tasks_dir,
+        write_config,
+        write_json_atomic,
+    )
+    from opencode_api import create_session
+
+    ensure_dirs(TEAM)
+    now = now_ms()
+    roster: list[dict[str, Any]] = [
+        {"agentId": f"team-lead@{TEAM}", "name": "team-lead", "joinedAt": now}
+    ]
+    for i in range(1, members + 1):
+        name = f"worker-{i}"
+        roster.append(
+            {
+                "agentId": f"{name}@{TEAM}",
+                "name": name,
+                "agentType": "build",
+                "model": "",
+                "prompt": "bench",
+                "joinedAt": now,
+                "tmuxPaneId": "",
+                "backendType": "opencode",
+                "opencodeSessionId": create_session(f"{name}@{TEAM}"),
+                "isActive": True,
+            }
+        )
+    write_config(TEAM, {"name": TEAM, "createdAt": now, "members": roster})
+    names = [m["name"] for m in roster[1:]]
+
+    # Random DAG: tasks only depend on lower ids, so the graph is acyclic.
+    graph: list[dict[str, Any]] = []
+    for i in range(1, tasks + 1):
+        deps: set[str] = set()
+        if i > 1:
+            for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+                deps.add(str(rng.randint(max(1, i - 200), i - 1)))
+        graph.append(
+            {
+                "id": str(i),
+                "subject": f"Task {i}",
+                "description": "x" * rng.randint(50, 600),
+                "activeForm": f"Working on task {i}",
+                "status": rng.choice(
+                    ["pending", "pending", "in_progress", "completed"]
+                ),
+                "blocks": [],
+                "blockedBy": sorted(deps, key=int),
+                "owner": rng.choice(names) if names and rng.random() < 0.6 else None,
+                "metadata": None,
+            }
+        )
+    for task in graph:
+        for dep in task["blockedBy"]:
+            graph[int(dep) - 1]["blocks"].append(task["id"])
+    tdir = tasks_dir(TEAM)
+    for task in graph:
+        write_json_atomic(tdir / f"{task['id']}.json", task)
+
+    # Lead inbox carries the bulk of the traffic; teammates get an assignment each.
+    stamp = now_iso()
+    lead_inbox = [
+        {
+            "from": rng.choice(names) if names else "team-lead",
+            "text": "progress " * rng.randint(5, 60),
+            "timestamp": stamp,
+            "read": rng.random() < 0.9,
+            "summary": rng.choice(["progress", "worker_done", "blocked"]),
+        }
+        for _ in range(messages)
+    ]
+    write_json_atomic(inbox_path(TEAM, "team-lead"), lead_inbox, indent=None)
+    for name in names:
+        write_json_atomic(
+            inbox_path(TEAM, name),
+            [
+                {
+                    "from": "team-lead",
+                    "text": "bootstrap",
+                    "timestamp": stamp,
+                    "read": True,
+                    "summary": "task-assignment",
+                }
+            ],
+            indent=None,
+        )
+
+
+def time_op(fn: Callable[[int], Any], repeat: int) -> dict[str, Any]:
+    samples: list[float] = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(samples)
+    return {
+        "runs": repeat,
+        "meanMs": round(statistics.fmean(ordered), 3),
+        "p50Ms": round(percentile(ordered, 50), 3),
+        "p90Ms": round(percentile(ordered, 90), 3),
+        "maxMs": round(ordered[-1], 3),
+    }
+
+
+def run_scale(
+    members: int, tasks: int, messages: int, repeat: int, seed: int
+) -> dict[str, Any]:
+    import doctor
+    import inbox
+    import lead
+    from common import list_tasks
+    from delivery import run_worker
+    from task_store import read_changes, read_index
+    from tasks import (
+        analyze,
+        create_task,
+        import_plan,
+        list_filtered,
+        update_task,
+    )
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    build_team(members, tasks, messages, rng)
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    worker = "worker-1" if members else "team-lead"
+
+    def blank_update(task_id: str, **changes: Any) -> dict:
+        fields: dict[str, Any] = {
+            "status": "",
+            "owner": "",
+            "subject": "",
+            "description": "",
+            "active_form": "",
+            "add_blocks": [],
+            "add_blocked_by": [],
+            "metadata_json": "",
+        }
+        fields.update(changes)
+        return update_task(team=TEAM, task_id=task_id, **fields)
+
+    def create(_: int) -> None:
+        create_task(TEAM, "bench task", "created by bench", "", "")
+
+    created: list[str] = []
+
+    def create_for_update(_: int) -> None:
+        created.append(create_task(TEAM, "bench update", "", "", "")["id"])
+
+    def update(i: int) -> None:
+        blank_update(created[i], owner=worker)
+
+    def complete(i: int) -> None:
+        blank_update(created[i], status="in_progress")
+        blank_update(created[i], status="completed")
+
+    results: dict[str, Any] = {}
+    results["list"] = time_op(lambda _: list_tasks(TEAM), repeat)
+    results["list-ready"] = time_op(
+        lambda _: list_filtered(TEAM, [], "", False, True, ["id", "subject"]), repeat
+    )
+    results["create"] = time_op(create, repeat)
+    for i in range(repeat):
+        create_for_update(i)
+    results["update"] = time_op(update, repeat)
+    results["complete"] = time_op(complete, repeat)
+    plan = [
+        {"key": f"p{n}", "subject": f"Plan step {n}", "blockedBy": [f"p{n - 1}"]}
+        for n in range(40)
+    ]
+    plan[0]["blockedBy"] = []
+    results["import-40"] = time_op(lambda _: import_plan(TEAM, plan), repeat)
+    results["analyze"] = time_op(lambda _: analyze(TEAM, 1.0), repeat)
+    since = max(0, read_index(TEAM)["seq"] - 20)
+    results["changes"] = time_op(lambda _: read_changes(TEAM, since), repeat)
+    results["send"] = time_op(
+        lambda i: inbox.send(
+            TEAM, "team-lead", worker, f"bench message {i}", f"bench-{i}", "", True
+        ),
+        repeat,
+    )
+    results["broadcast"] = time_op(
+        lambda i: inbox.broadcast(TEAM, "team-lead", "bench broadcast", "bench", True),
+        repeat,
+    )
+    results["deliver"] = time_op(lambda _: run_worker(TEAM, 0.0, 1), 1)
+    results["send-sync"] = time_op(
+        lambda i: inbox.send(
+            TEAM, "team-lead", worker, f"bench sync {i}", f"sync-{i}", "", True, True
+        ),
+        repeat,
+    )
+    results["read"] = time_op(
+        lambda _: inbox.read(TEAM, "team-lead", True, False), repeat
+    )
+    results["status-report"] = time_op(
+        lambda _: lead.status_report(TEAM, 10), repeat
+    )
+    results["doctor-check"] = time_op(lambda _: doctor.check(TEAM), repeat)
+    return {
+        "members": members,
+        "tasks": tasks,
+        "messages": messages,
+        "setupMs": round(setup_ms, 3),
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[dict]:
+    def key(scale: dict) -> tuple[int, int, int]:
+        return (scale["members"], scale["tasks"], scale["messages"])
+
+    previous = {key(scale): scale for scale in baseline.get("scales", [])}
+    regressions = []
+    for scale in report["scales"]:
+        old = previous.get(key(scale))
+        if not old:
+            continue
+        for op, stats in scale["results"].items():
+            before = old.get("results", {}).get(op, {}).get("p50Ms")
+            if not before:
+                continue
+            ratio = stats["p50Ms"] / before
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    {
+                        "scale": list(key(scale)),
+                        "op": op,
+                        "baselineP50Ms": before,
+                        "p50Ms": stats["p50Ms"],
+                        "ratio": round(ratio, 3),
+                    }
+                )
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark teammate scripts on synthetic teams"
+    )
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--members", type=int, default=-1)
+    parser.add_argument("--tasks", type=int, default=-1)
+    parser.add_argument("--messages", type=int, default=-1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--output", default="", help="Write JSON report here")
+    parser.add_argument("--baseline", default="", help="Previous JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    scales = SCALES[args.scale]
+    if min(args.members, args.tasks, args.messages) >= 0:
+        scales = [(args.members, args.tasks, args.messages)]
+    elif max(args.members, args.tasks, args.messages) >= 0:
+        print(
+            "--members, --tasks and --messages must be given together",
+            file=sys.stderr,
+        )
+        return 1
+
+    server, _, url = start_stub(latency_ms=args.stub_latency_ms)
+    os.environ["OPENCODE_SERVER_URL"] = url
+    os.environ["OPENCODE_TEAM_DELIVERY"] = "manual"
+    os.environ.setdefault("OPENCODE_TEAM_COALESCE_MS", "0")
+    for key in ("OPENCODE_TEAM_ROLE", "OPENCODE_TEAM_TEAM", "OPENCODE_TEAM_MEMBER"):
+        os.environ.pop(key, None)
+
+    report: dict[str, Any] = {
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "stubLatencyMs": args.stub_latency_ms,
+        "scales": [],
+    }
+    try:
+        for members, tasks, messages in scales:
+            with tempfile.TemporaryDirectory(prefix="opencode-team-bench-") as home:
+                os.environ["OPENCODE_TEAM_HOME"] = home
+                report["scales"].append(
+                    run_scale(members, tasks, messages, max(1, args.repeat), args.seed)
+                )
+    finally:
+        server.shutdown()
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        report["regressions"] = compare(report, baseline, args.tolerance)
+        status = 2 if report["regressions"] else 0
+
+    text = json.dumps(report, ensure_ascii=True, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
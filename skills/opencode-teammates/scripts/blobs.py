@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from common import blob_dir, inbox_dir, outbox_dir, read_json
+
+
+BLOB_THRESHOLD_ENV = "OPENCODE_TEAM_BLOB_THRESHOLD"
+DEFAULT_BLOB_THRESHOLD = 1024
+DEFAULT_GC_GRACE_SECONDS = 600
+DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def blob_threshold() -> int:
+    raw = os.environ.get(BLOB_THRESHOLD_ENV, "").strip()
+    try:
+        value = int(raw) if raw else DEFAULT_BLOB_THRESHOLD
+    except ValueError:
+        return DEFAULT_BLOB_THRESHOLD
+    return value if value > 0 else DEFAULT_BLOB_THRESHOLD
+
+
+def blob_path(team: str, digest: str) -> Path:
+    return blob_dir(team) / f"{digest}.txt"
+
+
+def put_text(team: str, text: str) -> str:
+    raw = text.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    path = blob_path(team, digest)
+    if path.exists():
+        # Refresh mtime so a concurrent gc grace window covers the new reference.
+        os.utime(path)
+        return digest
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(raw)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return digest
+
+
+def message_body(team: str, text: str) -> dict[str, Any]:
+    """Inline small texts; store large ones once and reference them by sha256."""
+    size = len(text.encode("utf-8"))
+    if size < blob_threshold():
+        return {"text": text}
+    return {"textRef": put_text(team, text), "textBytes": size}
+
+
+def read_blob(team: str, digest: str) -> str | None:
+    """Blob text, or None when the ref is malformed or the blob is gone."""
+    if not DIGEST_RE.fullmatch(digest):
+        return None
+    try:
+        return blob_path(team, digest).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def resolve_message(
+    team: str, message: dict, cache: dict[str, str | None] | None = None
+) -> dict:
+    """Swap textRef for the blob's text.
+
+    A malformed ref or a missing blob leaves the ref in place and marks the
+    message `textMissing: true` rather than passing it off as empty text.
+    """
+    digest = message.get("textRef")
+    if not isinstance(digest, str) or "text" in message:
+        return message
+    if cache is not None and digest in cache:
+        text = cache[digest]
+    else:
+        text = read_blob(team, digest)
+        if cache is not None:
+            cache[digest] = text
+    if text is None:
+        return {**message, "textMissing": True}
+    resolved: dict = {}
+    for key, value in message.items():
+        if key == "textRef":
+            resolved["text"] = text
+        elif key != "textBytes":
+            resolved[key] = value
+    return resolved
+
+
+def resolve_messages(team: str, messages: list[dict]) -> list[dict]:
+    cache: dict[str, str | None] = {}
+    return [resolve_message(team, item, cache) for item in messages]
+
+
+def gc(team: str, grace_seconds: int = DEFAULT_GC_GRACE_SECONDS) -> dict:
+    """Delete blobs no inbox, queued push or dead letter refers to."""
+    bdir = blob_dir(team)
+    if not bdir.exists():
+        return {"success": True, "kept": 0, "deleted": 0, "freedBytes": 0}
+
+    referenced: set[str] = set()
+    sources = [*inbox_dir(team).glob("*.json"), *outbox_dir(team).glob("*.json")]
+    for path in sources:
+        messages = read_json(path, [])
+        if not isinstance(messages, list):
+            continue
+        for item in messages:
+            if isinstance(item, dict) and isinstance(item.get("textRef"), str):
+                referenced.add(item["textRef"])
+
+    cutoff = time.time() - max(0, grace_seconds)
+    kept = 0
+    deleted = 0
+    freed = 0
+    for path in bdir.glob("*.txt"):
+        stat = path.stat()
+        if path.stem in referenced or stat.st_mtime > cutoff:
+            kept += 1
+            continue
+        path.unlink(missing_ok=True)
+        deleted += 1
+        freed += stat.st_size
+    return {"success": True, "kept": kept, "deleted": deleted, "freedBytes": freed}
@@ -6,18 +6,21 @@ import contextlib
 import json
 import os
 import re
+import subprocess
 import tempfile
 import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Iterator
+from typing import Any, Iterable, Iterator
 
 try:
     import fcntl
 except ImportError:  # pragma: no cover
     fcntl = None
 
+import profiling
+
 
 VALID_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
 COLOR_PALETTE = ["blue", "green", "yellow", "purple", "orange", "pink", "cyan", "red"]
@@ -73,6 +76,18 @@ def tasks_dir(team: str) -> Path:
     return tasks_root() / team
 
 
+def task_path(team: str, task_id: str) -> Path:
+    return tasks_dir(team) / f"{task_id}.json"
+
+
+def task_index_path(team: str) -> Path:
+    return tasks_dir(team) / ".index.json"
+
+
+def task_changes_path(team: str) -> Path:
+    return tasks_dir(team) / "changes.jsonl"
+
+
 def config_path(team: str) -> Path:
     return team_dir(team) / "config.json"
 
@@ -85,14 +100,74 @@ def inbox_path(team: str, agent: str) -> Path:
     return inbox_dir(team) / f"{agent}.json"
 
 
+def inbox_index_path(team: str, agent: str) -> Path:
+    return inbox_dir(team) / f"{agent}.idx"
+
+
+def blob_dir(team: str) -> Path:
+    return team_dir(team) / "blobs"
+
+
 def lock_path_for_team(team: str) -> Path:
     return inbox_dir(team) / ".lock"
 
 
+def lock_path_for_inbox(team: str, agent: str) -> Path:
+    return inbox_dir(team) / f"{agent}.lock"
+
+
 def lock_path_for_tasks(team: str) -> Path:
     return tasks_dir(team) / ".lock"
 
 
+def outbox_dir(team: str) -> Path:
+    return team_dir(team) / "outbox"
+
+
+def outbox_path(team: str, agent: str) -> Path:
+    return outbox_dir(team) / f"{agent}.json"
+
+
+def dead_letter_path(team: str, agent: str) -> Path:
+    return outbox_dir(team) / f"{agent}.dead.json"
+
+
+def lock_path_for_outbox(team: str, agent: str) -> Path:
+    return outbox_dir(team) / f"{agent}.lock"
+
+
+def lock_path_for_delivery(team: str, agent: str) -> Path:
+    return outbox_dir(team) / f"{agent}.deliver.lock"
+
+
+def lock_path_for_delivery_worker(team: str) -> Path:
+    return outbox_dir(team) / ".worker.lock"
+
+
+def delivery_stop_path(team: str) -> Path:
+    return outbox_dir(team) / ".worker.stop"
+
+
+def delivery_stats_path(team: str) -> Path:
+    return outbox_dir(team) / ".stats.json"
+
+
+def lock_path_for_delivery_stats(team: str) -> Path:
+    return outbox_dir(team) / ".stats.lock"
+
+
+def autoscale_state_path(team: str) -> Path:
+    return team_dir(team) / "autoscale.json"
+
+
+def lock_path_for_autoscale(team: str) -> Path:
+    return team_dir(team) / "autoscale.lock"
+
+
+def metrics_path(team: str) -> Path:
+    return team_dir(team) / "metrics.jsonl"
+
+
 def now_ms() -> int:
     return int(time.time() * 1000)
 
@@ -102,6 +177,21 @@ def now_iso() -> str:
     return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
 
 
+def parse_timestamp_ms(value: str) -> int | None:
+    text = (value or "").strip()
+    if not text:
+        return None
+    try:
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        dt = datetime.fromisoformat(text)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+    except Exception:
+        return None
+
+
 def new_session_id() -> str:
     return str(uuid.uuid4())
 
@@ -123,42 +213,120 @@ def ensure_dirs(team: str) -> None:
     lock_path_for_tasks(team).touch(exist_ok=True)
 
 
+def profile_label(path: Path) -> str:
+    try:
+        parts = list(path.relative_to(claude_root()).parts)
+    except ValueError:
+        return path.name
+    if len(parts) >= 2:
+        parts[1] = "{team}"
+    stem, dot, suffix = parts[-1].partition(".")
+    if stem.isdigit():
+        parts[-1] = "{id}" + dot + suffix
+    return "/".join(parts)
+
+
+def profile_command(script: str, cmd: str, team: str) -> None:
+    if team:
+        profiling.begin_command(script, cmd, metrics_path(team))
+
+
 def read_json(path: Path, default: Any) -> Any:
-    if not path.exists():
-        return default
-    text = path.read_text().strip()
-    if not text:
-        return default
-    return json.loads(text)
+    with profiling.span("json.read", profile_label(path)) as span:
+        if not path.exists():
+            return default
+        raw = path.read_bytes()
+        span["bytes"] = len(raw)
+        text = raw.decode("utf-8").strip()
+        if not text:
+            return default
+        return json.loads(text)
 
 
 def write_json_atomic(path: Path, payload: Any, indent: int | None = 2) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as handle:
-            json.dump(payload, handle, ensure_ascii=True, indent=indent)
-            handle.write("\n")
-        os.replace(tmp, path)
-    except Exception:
-        if os.path.exists(tmp):
-            os.unlink(tmp)
-        raise
+    with profiling.span("json.write", profile_label(path)) as span:
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle, ensure_ascii=True, indent=indent)
+                handle.write("\n")
+                span["bytes"] = handle.tell()
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with profiling.span("json.write", profile_label(path), bytes=len(data)):
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
 
 
 @contextlib.contextmanager
 def file_lock(lock_path: Path) -> Iterator[None]:
     lock_path.parent.mkdir(parents=True, exist_ok=True)
+    label = profile_label(lock_path)
     with open(lock_path, "a+", encoding="utf-8") as handle:
-        if fcntl is not None:
-            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        with profiling.span("lock.wait", label):
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
         try:
-            yield
+            with profiling.span("lock.hold", label):
+                yield
         finally:
             if fcntl is not None:
                 fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
 
 
+@contextlib.contextmanager
+def try_file_lock(lock_path: Path) -> Iterator[bool]:
+    """Non-blocking variant of file_lock; yields whether the lock was taken."""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+", encoding="utf-8") as handle:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            acquired = False
+        else:
+            acquired = True
+        if not acquired:
+            yield False
+            return
+        try:
+            with profiling.span("lock.hold", profile_label(lock_path)):
+                yield True
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def file_locks(lock_paths: Iterable[Path]) -> Iterator[None]:
+    """Hold several locks at once, always acquired in sorted order to avoid deadlock."""
+    with contextlib.ExitStack() as stack:
+        for lock_path in sorted(set(lock_paths)):
+            stack.enter_context(file_lock(lock_path))
+        yield
+
+
+def run_command(cmd: list[str]) -> subprocess.CompletedProcess[str]:
+    with profiling.span("subprocess", " ".join(cmd[:2])):
+        return subprocess.run(cmd, capture_output=True, text=True, check=False)
+
+
 def load_config(team: str) -> dict[str, Any]:
     path = config_path(team)
     if not path.exists():
@@ -188,16 +356,6 @@ def list_tasks(team: str) -> list[dict[str, Any]]:
     return items
 
 
-def next_task_id(team: str) -> str:
-    max_id = 0
-    for file in tasks_dir(team).glob("*.json"):
-        try:
-            max_id = max(max_id, int(file.stem))
-        except ValueError:
-            continue
-    return str(max_id + 1)
-
-
 def ensure_inbox(team: str, agent: str) -> Path:
     path = inbox_path(team, agent)
     if not path.exists():
@@ -0,0 +1,521 @@
+"""Durable per-recipient push queue with a background delivery worker.
+
+Session pushes go through `outbox/<agent>.json` instead of calling prompt_async
+directly. Queued items carry the message's `message_body()`, so a large text is
+a blob ref resolved at push time rather than a copy per recipient. Senders only
+append to the queue and make sure the team's delivery
+worker (`inbox.py deliver`) is running, so they never wait on the opencode HTTP
+round-trip. The worker is a singleton per team (it holds `outbox/.worker.lock`):
+it waits out the coalescing window (`OPENCODE_TEAM_COALESCE_MS`) from a queue's
+oldest item, pushes everything queued as a single prompt, oldest first, and
+drops items only after the push succeeds. Failed pushes stay queued and are
+retried with jittered exponential backoff, so delivery is at-least-once and
+ordered. A batch the server rejects outright (4xx) or that fails
+`DEAD_LETTER_ATTEMPTS` times in a row moves to `outbox/<agent>.dead.json`, so
+one bad push cannot pin the worker or block the recipient's later pushes. The
+worker exits after a quiet period and the next sender restarts it;
+`stop_worker` asks it to exit early through `outbox/.worker.stop`.
+
+`OPENCODE_TEAM_DELIVERY` picks what happens after an async enqueue: `worker`
+(default) starts the worker, `sync` pushes inline as if `sync=True` was passed,
+and `manual` leaves items queued until `inbox.py deliver` runs.
+
+`push(..., sync=True)` keeps the inline path for callers that need to know the
+text reached the session (spawn.sh bootstrap): whoever takes the recipient's
+delivery lock drains the queue, and senders that find the lock taken leave their
+item to the current holder, which re-checks the queue after releasing the lock.
+
+Both paths record enqueue-to-push latency in `outbox/.stats.json`.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+from blobs import resolve_message
+from common import (
+    VALID_NAME_RE,
+    dead_letter_path,
+    delivery_stats_path,
+    delivery_stop_path,
+    file_lock,
+    load_config,
+    lock_path_for_delivery,
+    lock_path_for_delivery_stats,
+    lock_path_for_delivery_worker,
+    lock_path_for_outbox,
+    now_ms,
+    outbox_dir,
+    outbox_path,
+    read_json,
+    try_file_lock,
+    write_json_atomic,
+)
+from opencode_api import OpenCodeAPIError, prompt_async
+from profiling import percentile
+
+
+COALESCE_ENV = "OPENCODE_TEAM_COALESCE_MS"
+DELIVERY_ENV = "OPENCODE_TEAM_DELIVERY"
+DELIVERY_MODES = ("worker", "sync", "manual")
+DEFAULT_COALESCE_MS = 200
+SEPARATOR = "\n\n---\n\n"
+INBOX_SCRIPT = Path(__file__).resolve().parent / "inbox.py"
+WORKER_IDLE_EXIT_SECONDS = 30.0
+WORKER_POLL_MS = 50
+RETRY_BASE_MS = 500
+RETRY_MAX_MS = 30_000
+DEAD_LETTER_ATTEMPTS = 8
+LATENCY_SAMPLES = 256
+
+
+def coalesce_ms() -> int:
+    raw = os.environ.get(COALESCE_ENV, "").strip()
+    try:
+        value = int(raw) if raw else DEFAULT_COALESCE_MS
+    except ValueError:
+        return DEFAULT_COALESCE_MS
+    return max(0, value)
+
+
+def delivery_mode() -> str:
+    raw = os.environ.get(DELIVERY_ENV, "").strip().lower()
+    return raw if raw in DELIVERY_MODES else "worker"
+
+
+def session_of(member: dict[str, Any]) -> str:
+    session_id = member.get("opencodeSessionId")
+    return session_id if isinstance(session_id, str) else ""
+
+
+def pending(team: str, agent: str) -> list[dict[str, Any]]:
+    items = read_json(outbox_path(team, agent), [])
+    return items if isinstance(items, list) else []
+
+
+def enqueue(team: str, agent: str, body: dict[str, Any], key: str = "") -> str:
+    """Queue a message_body() for agent's session.
+
+    A queued item with the same key is replaced.
+    """
+    item = {"id": uuid.uuid4().hex, **body, "enqueuedAt": now_ms()}
+    if key:
+        item["key"] = key
+    with file_lock(lock_path_for_outbox(team, agent)):
+        items = pending(team, agent)
+        if key:
+            items = [other for other in items if other.get("key") != key]
+        items.append(item)
+        write_json_atomic(outbox_path(team, agent), items, indent=None)
+    return item["id"]
+
+
+def _ack(team: str, agent: str, ids: set[str]) -> None:
+    with file_lock(lock_path_for_outbox(team, agent)):
+        items = [item for item in pending(team, agent) if item.get("id") not in ids]
+        write_json_atomic(outbox_path(team, agent), items, indent=None)
+
+
+def dead_letter(team: str, agent: str, ids: set[str], error: str) -> int:
+    """Move the given queued items to the recipient's dead-letter file."""
+    with file_lock(lock_path_for_outbox(team, agent)):
+        items = pending(team, agent)
+        dead = [item for item in items if item.get("id") in ids]
+        if not dead:
+            return 0
+        path = dead_letter_path(team, agent)
+        letters = read_json(path, [])
+        if not isinstance(letters, list):
+            letters = []
+        stamp = now_ms()
+        letters += [{**item, "error": error, "deadAt": stamp} for item in dead]
+        write_json_atomic(path, letters, indent=None)
+        items = [item for item in items if item.get("id") not in ids]
+        write_json_atomic(outbox_path(team, agent), items, indent=None)
+    return len(dead)
+
+
+def merge(texts: list[str]) -> str:
+    if len(texts) == 1:
+        return texts[0]
+    header = f"{len(texts)} queued messages from the team, oldest first:"
+    return header + SEPARATOR + SEPARATOR.join(texts)
+
+
+def _drain(team: str, member: dict[str, Any]) -> dict[str, Any]:
+    """Push the whole queue, batch by batch, while holding the delivery lock."""
+    agent = str(member.get("name"))
+    agent_type = member.get("agentType")
+    if not isinstance(agent_type, str) or not agent_type:
+        agent_type = "build"
+    model = member.get("model")
+    if not isinstance(model, str):
+        model = ""
+    result: dict[str, Any] = {
+        "delivered": set(),
+        "pushes": 0,
+        "latencyMs": [],
+        "error": "",
+        "failed": set(),
+        "permanent": False,
+        "deadLettered": 0,
+    }
+    cache: dict[str, str | None] = {}
+    while True:
+        items = [resolve_message(team, item, cache) for item in pending(team, agent)]
+        missing = {str(item.get("id")) for item in items if item.get("textMissing")}
+        if missing:
+            result["deadLettered"] += dead_letter(
+                team, agent, missing, "message blob is missing"
+            )
+            items = [item for item in items if str(item.get("id")) not in missing]
+        if not items:
+            return result
+        text = merge([str(item.get("text", "")) for item in items])
+        ids = {str(item.get("id")) for item in items}
+        try:
+            prompt_async(session_of(member), text, agent=agent_type, model=model)
+        except OpenCodeAPIError as exc:
+            result["error"] = str(exc)
+            result["failed"] = ids
+            # A response that is not worth retrying means this batch never will be.
+            result["permanent"] = exc.status is not None and not exc.retry
+            return result
+        _ack(team, agent, ids)
+        pushed_at = now_ms()
+        result["delivered"] |= ids
+        result["pushes"] += 1
+        result["latencyMs"] += [
+            pushed_at - int(item.get("enqueuedAt") or pushed_at) for item in items
+        ]
+
+
+def _record(team: str, agent: str, result: dict[str, Any]) -> None:
+    """Fold one delivery attempt into the team's delivery stats."""
+    if not result["pushes"] and not result["error"]:
+        return
+    with file_lock(lock_path_for_delivery_stats(team)):
+        stats = read_json(delivery_stats_path(team), {})
+        if not isinstance(stats, dict):
+            stats = {}
+        entry = stats.setdefault(
+            agent, {"delivered": 0, "pushes": 0, "failures": 0, "latencyMs": []}
+        )
+        entry["delivered"] += len(result["delivered"])
+        entry["pushes"] += result["pushes"]
+        entry["latencyMs"] = (entry["latencyMs"] + result["latencyMs"])[
+            -LATENCY_SAMPLES:
+        ]
+        if result["error"]:
+            entry["failures"] += 1
+            entry["lastError"] = result["error"]
+            entry["lastErrorAt"] = now_ms()
+        if result["pushes"]:
+            entry["lastDeliveredAt"] = now_ms()
+        write_json_atomic(delivery_stats_path(team), stats, indent=None)
+
+
+def deliver(team: str, member: dict[str, Any], wait_ms: int) -> dict[str, Any]:
+    """Deliver the recipient's queue unless another process already is.
+
+    Returns the ids this call pushed, the number of prompt_async calls, the
+    enqueue-to-push latency of each delivered item, the last push error with
+    the ids of the batch that failed, how many items were dead-lettered, and
+    whether the queue was left to another deliverer. A batch rejected with a
+    non-retryable error is dead-lettered here, on both the sync and worker paths.
+    """
+    agent = str(member.get("name"))
+    result: dict[str, Any] = {
+        "delivered": set(),
+        "pushes": 0,
+        "latencyMs": [],
+        "error": "",
+        "failed": set(),
+        "deadLettered": 0,
+        "handedOff": False,
+    }
+    if not session_of(member):
+        result["error"] = "no opencode session"
+        return result
+    while True:
+        with try_file_lock(lock_path_for_delivery(team, agent)) as acquired:
+            if not acquired:
+                result["handedOff"] = True
+                break
+            if wait_ms > 0:
+                time.sleep(wait_ms / 1000.0)
+                wait_ms = 0
+            drained = _drain(team, member)
+        result["delivered"] |= drained["delivered"]
+        result["pushes"] += drained["pushes"]
+        result["latencyMs"] += drained["latencyMs"]
+        result["error"] = drained["error"]
+        result["failed"] = drained["failed"]
+        result["deadLettered"] += drained["deadLettered"]
+        if drained["permanent"]:
+            result["deadLettered"] += dead_letter(
+                team, agent, drained["failed"], drained["error"]
+            )
+        # Items queued while we held the lock may have been handed to us.
+        if result["error"] or not pending(team, agent):
+            break
+    _record(team, agent, result)
+    return result
+
+
+def start_worker(team: str) -> bool:
+    """Spawn a detached delivery worker unless one is already running."""
+    with try_file_lock(lock_path_for_delivery_worker(team)) as free:
+        if not free:
+            return False
+    # Two senders racing here both spawn; the loser exits on the worker lock.
+    subprocess.Popen(
+        [sys.executable, str(INBOX_SCRIPT), "deliver", "--team", team],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+def schedule(team: str) -> bool:
+    """Hand freshly queued pushes to delivery; False means push them inline."""
+    mode = delivery_mode()
+    if mode == "sync":
+        return False
+    if mode == "worker":
+        try:
+            start_worker(team)
+        except OSError:
+            return False
+    return True
+
+
+def stop_worker(team: str, timeout: float = 10.0) -> dict[str, Any]:
+    """Ask the team's delivery worker to exit and wait until it has.
+
+    The worker checks for the stop file between deliveries, so a push in flight
+    finishes first. Queued items stay queued for the next worker.
+    """
+    stop = delivery_stop_path(team)
+    deadline = time.monotonic() + timeout
+    requested = False
+    while True:
+        with try_file_lock(lock_path_for_delivery_worker(team)) as free:
+            if free:
+                stop.unlink(missing_ok=True)
+                return {"success": True, "team": team, "stopped": requested}
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Delivery worker for {team!r} still running")
+        if not stop.exists():
+            # Rewritten if a worker consumed it and another took over meanwhile.
+            stop.write_text(str(now_ms()), encoding="utf-8")
+            requested = True
+        time.sleep(WORKER_POLL_MS / 1000.0)
+
+
+def push(
+    team: str,
+    member: dict[str, Any],
+    body: dict[str, Any],
+    key: str = "",
+    sync: bool = False,
+) -> dict[str, Any]:
+    """Queue one message_body() for the recipient's session.
+
+    By default the worker delivers it and the call returns once the item is on
+    disk (`queued`). With `sync`, deliver inline; `pushed` is True once the text
+    reached the session.
+    """
+    if not session_of(member):
+        return {"pushed": False, "queued": False, "batched": 0}
+    item_id = enqueue(team, str(member.get("name")), body, key)
+    if not sync and schedule(team):
+        return {"pushed": False, "queued": True, "batched": 0}
+    result = deliver(team, member, coalesce_ms())
+    dead = result["failed"] if result["deadLettered"] else set()
+    return {
+        "pushed": item_id in result["delivered"],
+        "queued": item_id not in result["delivered"] and item_id not in dead,
+        "batched": len(result["delivered"]),
+    }
+
+
+def _queued(team: str) -> dict[str, int]:
+    """Agent -> oldest enqueuedAt, for every non-empty outbox."""
+    queued: dict[str, int] = {}
+    root = outbox_dir(team)
+    if not root.exists():
+        return queued
+    with os.scandir(root) as entries:
+        for item in entries:
+            stem, _, suffix = item.name.partition(".")
+            if suffix != "json" or not VALID_NAME_RE.match(stem):
+                continue
+            # An empty queue is written as "[]\n".
+            if item.stat().st_size <= 3:
+                continue
+            items = pending(team, stem)
+            if items:
+                queued[stem] = min(int(i.get("enqueuedAt") or 0) for i in items)
+    return queued
+
+
+def _deliverable(team: str) -> dict[str, tuple[int, dict[str, Any]]]:
+    """Queued agents that still have a session -> (oldest enqueuedAt, member).
+
+    Queues of removed or sessionless members wait for a sync push.
+    """
+    queued = _queued(team)
+    if not queued:
+        return {}
+    result: dict[str, tuple[int, dict[str, Any]]] = {}
+    for member in load_config(team).get("members", []):
+        if not isinstance(member, dict) or not session_of(member):
+            continue
+        name = str(member.get("name"))
+        if name in queued:
+            result[name] = (queued[name], member)
+    return result
+
+
+def _serve(team: str, idle_exit: float, poll_ms: int, totals: dict[str, Any]) -> bool:
+    """Deliver due queues until nothing deliverable is left for idle_exit seconds.
+
+    Returns True when it stopped because stop_worker asked it to.
+    """
+    window = coalesce_ms()
+    stop = delivery_stop_path(team)
+    failures: dict[str, int] = {}
+    retry_at: dict[str, int] = {}
+    idle_since = time.monotonic()
+    while True:
+        if stop.exists():
+            stop.unlink(missing_ok=True)
+            return True
+        queued = _deliverable(team)
+        if not queued:
+            if time.monotonic() - idle_since >= idle_exit:
+                return False
+            time.sleep(poll_ms / 1000.0)
+            continue
+        idle_since = time.monotonic()
+        now = now_ms()
+        for agent, (oldest, member) in queued.items():
+            if now < retry_at.get(agent, 0) or now - oldest < window:
+                continue
+            result = deliver(team, member, 0)
+            totals["delivered"] += len(result["delivered"])
+            totals["pushes"] += result["pushes"]
+            if result["error"]:
+                totals["failures"] += 1
+                totals["lastError"] = result["error"]
+                failures[agent] = failures.get(agent, 0) + 1
+                if failures[agent] >= DEAD_LETTER_ATTEMPTS:
+                    result["deadLettered"] += dead_letter(
+                        team, agent, result["failed"], result["error"]
+                    )
+            totals["deadLettered"] += result["deadLettered"]
+            if result["error"] and not result["deadLettered"]:
+                delay = min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** (failures[agent] - 1))
+                retry_at[agent] = now_ms() + int(random.uniform(delay / 2, delay))
+            else:
+                failures.pop(agent, None)
+                retry_at.pop(agent, None)
+        time.sleep(poll_ms / 1000.0)
+
+
+def run_worker(
+    team: str,
+    idle_exit: float = WORKER_IDLE_EXIT_SECONDS,
+    poll_ms: int = WORKER_POLL_MS,
+) -> dict[str, Any]:
+    """Run the team's delivery worker in the foreground until it goes idle."""
+    totals: dict[str, Any] = {
+        "delivered": 0,
+        "pushes": 0,
+        "failures": 0,
+        "deadLettered": 0,
+    }
+    started = False
+    while True:
+        with try_file_lock(lock_path_for_delivery_worker(team)) as acquired:
+            if not acquired:
+                return {
+                    "success": True,
+                    "team": team,
+                    "started": started,
+                    "stopped": False,
+                    **totals,
+                }
+            started = True
+            stopped = _serve(team, idle_exit, poll_ms, totals)
+        # A sender may have seen the lock still held just before we let go.
+        if stopped or not _deliverable(team):
+            return {
+                "success": True,
+                "team": team,
+                "started": started,
+                "stopped": stopped,
+                **totals,
+            }
+
+
+def _dead_letters(team: str) -> dict[str, dict[str, Any]]:
+    """Agent -> count and last error of pushes given up on."""
+    found: dict[str, dict[str, Any]] = {}
+    root = outbox_dir(team)
+    if not root.exists():
+        return found
+    for path in sorted(root.glob("*.dead.json")):
+        letters = read_json(path, [])
+        if not isinstance(letters, list) or not letters:
+            continue
+        last = letters[-1] if isinstance(letters[-1], dict) else {}
+        found[path.name[: -len(".dead.json")]] = {
+            "count": len(letters),
+            "lastError": last.get("error", ""),
+            "lastDeadAt": last.get("deadAt"),
+            "file": str(path),
+        }
+    return found
+
+
+def outbox_status(team: str) -> dict[str, Any]:
+    """Queued pushes per recipient, worker liveness, dead letters and latency."""
+    now = now_ms()
+    queued = {
+        agent: {"pending": len(pending(team, agent)), "oldestAgeMs": now - oldest}
+        for agent, oldest in sorted(_queued(team).items())
+    }
+    with try_file_lock(lock_path_for_delivery_worker(team)) as free:
+        worker_running = not free
+    stats = read_json(delivery_stats_path(team), {})
+    recipients: dict[str, Any] = {}
+    for agent, entry in sorted((stats if isinstance(stats, dict) else {}).items()):
+        samples = sorted(entry.get("latencyMs") or [])
+        summary = {k: v for k, v in entry.items() if k != "latencyMs"}
+        if samples:
+            summary["latencyMs"] = {
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "max": samples[-1],
+                "samples": len(samples),
+            }
+        recipients[agent] = summary
+    return {
+        "success": True,
+        "team": team,
+        "workerRunning": worker_running,
+        "queued": queued,
+        "deadLetters": _dead_letters(team),
+        "recipients": recipients,
+    }
@@ -8,11 +8,28 @@ from __future__ import annotations
 
 import argparse
 from datetime import datetime, timezone
+import json
 import os
-import subprocess
 
-from common import emit, ensure_inbox, inbox_path, list_tasks, load_config
-from opencode_api import OpenCodeAPIError, session_status
+from common import (
+    emit,
+    ensure_inbox,
+    inbox_path,
+    list_tasks,
+    load_config,
+    metrics_path,
+    profile_command,
+    run_command,
+)
+from inbox_store import headers
+from opencode_api import (
+    COUNTERS,
+    OpenCodeAPIError,
+    breaker_state,
+    server_url,
+    session_status,
+)
+from profiling import percentile
 
 
 def tmux_target_exists(target: str) -> bool:
@@ -23,7 +40,7 @@ def tmux_target_exists(target: str) -> bool:
     else:
         cmd = ["tmux", "list-panes", "-a", "-F", "#{pane_id}"]
     try:
-        proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        proc = run_command(cmd)
         if proc.returncode != 0:
             return False
         return target in {line.strip() for line in proc.stdout.splitlines()}
@@ -42,33 +59,12 @@ def env_int(name: str, default: int) -> int:
     return parsed if parsed >= 0 else default
 
 
-def parse_timestamp_ms(value: str) -> int | None:
-    text = (value or "").strip()
-    if not text:
-        return None
-    try:
-        if text.endswith("Z"):
-            text = text[:-1] + "+00:00"
-        dt = datetime.fromisoformat(text)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return int(dt.timestamp() * 1000)
-    except Exception:
-        return None
-
-
 def read_inbox_messages(team: str, agent: str) -> list[dict]:
-    path = ensure_inbox(team, agent)
-    payload = []
+    ensure_inbox(team, agent)
     try:
-        from common import read_json
-
-        data = read_json(path, [])
-        if isinstance(data, list):
-            payload = [item for item in data if isinstance(item, dict)]
+        return headers(team, agent)
     except Exception:
-        payload = []
-    return payload
+        return []
 
 
 def check(team: str) -> dict:
@@ -159,7 +155,7 @@ def check(team: str) -> dict:
         ]
         latest_assignment_ms = None
         for msg in assignment_msgs:
-            ts = parse_timestamp_ms(str(msg.get("timestamp", "")))
+            ts = msg.get("timestampMs")
             if ts is None:
                 continue
             if latest_assignment_ms is None or ts > latest_assignment_ms:
@@ -168,7 +164,7 @@ def check(team: str) -> dict:
         teammate_reports = [msg for msg in lead_inbox if str(msg.get("from")) == name]
         latest_report_ms = None
         for msg in teammate_reports:
-            ts = parse_timestamp_ms(str(msg.get("timestamp", "")))
+            ts = msg.get("timestampMs")
             if ts is None:
                 continue
             if latest_report_ms is None or ts > latest_report_ms:
@@ -278,6 +274,80 @@ def check(team: str) -> dict:
     }
 
 
+def metrics(team: str, kind: str, cmd: str) -> dict:
+    _ = load_config(team)
+    path = metrics_path(team)
+    groups: dict[tuple[str, str], dict] = {}
+    span_count = 0
+    if path.exists():
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(row, dict):
+                    continue
+                if kind and row.get("kind") != kind:
+                    continue
+                if cmd and f"{row.get('script')} {row.get('cmd')}" != cmd:
+                    continue
+                key = (str(row.get("kind")), str(row.get("name")))
+                group = groups.setdefault(key, {"ms": [], "bytes": 0})
+                group["ms"].append(float(row.get("ms", 0.0)))
+                group["bytes"] += int(row.get("bytes", 0) or 0)
+                span_count += 1
+
+    rows = []
+    for (span_kind, name), group in groups.items():
+        values = sorted(group["ms"])
+        rows.append(
+            {
+                "kind": span_kind,
+                "name": name,
+                "count": len(values),
+                "p50Ms": percentile(values, 50),
+                "p90Ms": percentile(values, 90),
+                "p99Ms": percentile(values, 99),
+                "maxMs": values[-1],
+                "totalMs": round(sum(values), 3),
+                "bytes": group["bytes"],
+            }
+        )
+    rows.sort(key=lambda item: item["totalMs"], reverse=True)
+    return {
+        "ok": True,
+        "team": team,
+        "path": str(path),
+        "spanCount": span_count,
+        "spans": rows,
+    }
+
+
+def api_status(probe: bool) -> dict:
+    """Circuit breaker state and retry counters for the configured server."""
+    result: dict = {"ok": True, "server": server_url()}
+    if probe:
+        try:
+            session_status("")
+            result["probe"] = "ok"
+        except OpenCodeAPIError as exc:
+            result["probe"] = str(exc)
+    state = breaker_state()
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    result["breaker"] = {
+        "open": state["openUntilMs"] > now_ms,
+        "openForMs": max(0, state["openUntilMs"] - now_ms),
+        "halfOpen": 0 < state["openUntilMs"] <= now_ms,
+        "probing": state.get("probeUntilMs", 0) > now_ms,
+        "consecutiveFailures": state["consecutiveFailures"],
+        "counters": state["counters"],
+    }
+    result["processCounters"] = dict(COUNTERS)
+    result["ok"] = not result["breaker"]["open"]
+    return result
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Health checks for opencode teammate skill state"
@@ -287,14 +357,31 @@ def parse_args() -> argparse.Namespace:
     p_check = sub.add_parser("check")
     p_check.add_argument("--team", required=True)
 
+    p_metrics = sub.add_parser("metrics")
+    p_metrics.add_argument("--team", required=True)
+    p_metrics.add_argument("--kind", default="")
+    p_metrics.add_argument(
+        "--cmd", dest="cmd_filter", default="", help="e.g. 'inbox.py send'"
+    )
+
+    p_api = sub.add_parser("api")
+    p_api.add_argument(
+        "--probe", action="store_true", help="Make one request before reporting"
+    )
+
     return parser.parse_args()
 
 
 def main() -> int:
     args = parse_args()
+    profile_command("doctor.py", args.cmd, getattr(args, "team", ""))
     try:
         if args.cmd == "check":
             result = check(args.team)
+        elif args.cmd == "metrics":
+            result = metrics(args.team, args.kind, args.cmd_filter)
+        elif args.cmd == "api":
+            result = api_status(args.probe)
         else:
             raise ValueError(f"Unsupported command: {args.cmd}")
         emit(result)
@@ -9,22 +9,42 @@ from __future__ import annotations
 import argparse
 import json
 import time
-
-from opencode_api import OpenCodeAPIError, prompt_async
+from pathlib import Path
+
+import inbox_store
+from blobs import DEFAULT_GC_GRACE_SECONDS, gc, message_body, resolve_messages
+from delivery import (
+    WORKER_IDLE_EXIT_SECONDS,
+    WORKER_POLL_MS,
+    coalesce_ms,
+    deliver,
+    enqueue,
+    outbox_status,
+    push,
+    run_worker,
+    schedule,
+    session_of,
+    stop_worker,
+)
 
 from common import (
+    assert_lead_only,
     assert_team_scope,
     current_member_name,
     current_role,
     emit,
     ensure_inbox,
     file_lock,
-    inbox_path,
+    file_locks,
     load_config,
-    lock_path_for_team,
+    lock_path_for_inbox,
     now_iso,
-    read_json,
-    write_json_atomic,
+    parse_timestamp_ms,
+    profile_command,
+)
+
+SHUTDOWN_TEMPLATE = (
+    Path(__file__).resolve().parent.parent / "templates" / "shutdown-request.md"
 )
 
 
@@ -33,12 +53,17 @@ def ensure(team: str, agent: str) -> dict:
     return {"success": True, "path": str(path)}
 
 
+def _append_locked(team: str, agent: str, message: dict) -> None:
+    inbox_store.append(team, agent, message)
+
+
+def _upsert_locked(team: str, agent: str, message: dict) -> bool:
+    return inbox_store.upsert_by_summary(team, agent, message)
+
+
 def append(team: str, agent: str, message: dict) -> None:
-    path = ensure_inbox(team, agent)
-    with file_lock(lock_path_for_team(team)):
-        messages = read_json(path, [])
-        messages.append(message)
-        write_json_atomic(path, messages, indent=None)
+    with file_lock(lock_path_for_inbox(team, agent)):
+        _append_locked(team, agent, message)
 
 
 def upsert_by_summary(team: str, agent: str, message: dict) -> bool:
@@ -46,28 +71,8 @@ def upsert_by_summary(team: str, agent: str, message: dict) -> bool:
 
     Returns True when a prior message was replaced, False when appended is needed.
     """
-    path = ensure_inbox(team, agent)
-    with file_lock(lock_path_for_team(team)):
-        messages = read_json(path, [])
-        replaced = False
-        target_from = message.get("from")
-        target_summary = message.get("summary")
-        if target_from and target_summary:
-            for item in reversed(messages):
-                if (
-                    item.get("from") == target_from
-                    and item.get("summary") == target_summary
-                    and not item.get("read", False)
-                ):
-                    item.update(message)
-                    replaced = True
-                    break
-        if replaced:
-            write_json_atomic(path, messages, indent=None)
-            return True
-        messages.append(message)
-        write_json_atomic(path, messages, indent=None)
-        return False
+    with file_lock(lock_path_for_inbox(team, agent)):
+        return _upsert_locked(team, agent, message)
 
 
 def send(
@@ -78,6 +83,7 @@ def send(
     summary: str,
     color: str,
     replace_summary: bool,
+    sync: bool = False,
 ) -> dict:
     assert_team_scope(team)
     cfg = load_config(team)
@@ -105,9 +111,10 @@ def send(
         if to != "team-lead":
             raise PermissionError("Teammate session can only message team-lead")
 
+    body = message_body(team, text)
     msg = {
         "from": from_name,
-        "text": text,
+        **body,
         "timestamp": now_iso(),
         "read": False,
         "summary": summary,
@@ -119,32 +126,27 @@ def send(
         if replace_summary
         else (append(team, to, msg) or False)
     )
-    pushed = False
+    delivery = {"pushed": False, "queued": False}
     if isinstance(target_member, dict):
-        session_id = target_member.get("opencodeSessionId")
-        if isinstance(session_id, str) and session_id:
-            agent_type = target_member.get("agentType")
-            if not isinstance(agent_type, str) or not agent_type:
-                agent_type = "build"
-            model = target_member.get("model")
-            if not isinstance(model, str):
-                model = ""
-            try:
-                prompt_async(session_id, text, agent=agent_type, model=model)
-                pushed = True
-            except OpenCodeAPIError:
-                pushed = False
+        key = f"{from_name}:{summary}" if replace_summary else ""
+        delivery = push(team, target_member, body, key, sync=sync)
     return {
         "success": True,
         "to": to,
         "summary": summary,
-        "pushed_to_session": pushed,
+        "pushed_to_session": delivery["pushed"],
+        "push_queued": delivery["queued"],
         "replaced_unread": replaced,
     }
 
 
 def broadcast(
-    team: str, from_name: str, text: str, summary: str, replace_summary: bool
+    team: str,
+    from_name: str,
+    text: str,
+    summary: str,
+    replace_summary: bool,
+    sync: bool = False,
 ) -> dict:
     assert_team_scope(team)
     if from_name != "team-lead":
@@ -152,74 +154,131 @@ def broadcast(
     if current_role() == "teammate":
         raise PermissionError("Teammate session cannot broadcast")
     cfg = load_config(team)
-    count = 0
-    pushed = 0
+    recipients = [
+        member
+        for member in cfg.get("members", [])
+        if isinstance(member, dict)
+        and isinstance(member.get("name"), str)
+        and member.get("name") != "team-lead"
+    ]
+    body = message_body(team, text)
     replaced = 0
-    for member in cfg.get("members", []):
-        if not isinstance(member, dict):
-            continue
-        name = member.get("name")
-        if not isinstance(name, str) or name == "team-lead":
-            continue
-        payload = {
-            "from": "team-lead",
-            "text": text,
-            "timestamp": now_iso(),
-            "read": False,
-            "summary": summary,
-        }
-        if replace_summary:
-            if upsert_by_summary(team, name, payload):
-                replaced += 1
-        else:
-            append(team, name, payload)
-        session_id = member.get("opencodeSessionId")
-        if isinstance(session_id, str) and session_id:
-            agent_type = member.get("agentType")
-            if not isinstance(agent_type, str) or not agent_type:
-                agent_type = "build"
-            model = member.get("model")
-            if not isinstance(model, str):
-                model = ""
-            try:
-                prompt_async(session_id, text, agent=agent_type, model=model)
+    with file_locks(lock_path_for_inbox(team, m["name"]) for m in recipients):
+        for member in recipients:
+            payload = {
+                "from": "team-lead",
+                **body,
+                "timestamp": now_iso(),
+                "read": False,
+                "summary": summary,
+            }
+            if replace_summary:
+                if _upsert_locked(team, member["name"], payload):
+                    replaced += 1
+            else:
+                _append_locked(team, member["name"], payload)
+
+    # Queue for everyone first so one coalescing window covers all recipients.
+    key = f"{from_name}:{summary}" if replace_summary else ""
+    targets = [
+        (member, enqueue(team, member["name"], body, key))
+        for member in recipients
+        if session_of(member)
+    ]
+    pushed = 0
+    dropped = 0
+    if targets and not sync:
+        sync = not schedule(team)
+    if targets and sync:
+        time.sleep(coalesce_ms() / 1000.0)
+        for member, item_id in targets:
+            result = deliver(team, member, 0)
+            if item_id in result["delivered"]:
                 pushed += 1
-            except OpenCodeAPIError:
-                pass
-        count += 1
+            elif result["deadLettered"] and item_id in result["failed"]:
+                dropped += 1
     return {
         "success": True,
-        "count": count,
+        "count": len(recipients),
         "pushed_to_sessions": pushed,
+        "push_queued": len(targets) - pushed - dropped,
         "replaced_unread": replaced,
     }
 
 
-def read(team: str, agent: str, unread_only: bool, mark_as_read: bool) -> dict:
+def read(
+    team: str,
+    agent: str,
+    unread_only: bool,
+    mark_as_read: bool,
+    sender: str = "",
+    summary: str = "",
+    since: str = "",
+    until: str = "",
+    cursor: int = 0,
+    limit: int = 0,
+    latest: bool = False,
+) -> dict:
+    """Return matching messages in seq order.
+
+    Filters are evaluated against the inbox index; only returned messages are
+    decoded. `limit` keeps the oldest matches (or the newest with `latest`), and
+    `nextCursor` is the highest seq returned, to pass back as `cursor`.
+    """
     assert_team_scope(team)
     _ = load_config(team)
     if current_role() == "teammate":
         member = current_member_name()
         if not member or agent != member:
             raise PermissionError("Teammate session can only read its own inbox")
-    path = ensure_inbox(team, agent)
-    with file_lock(lock_path_for_team(team)):
-        messages = read_json(path, [])
-        selected = (
-            [m for m in messages if not m.get("read", False)]
-            if unread_only
-            else list(messages)
-        )
+    since_ms = parse_timestamp_ms(since) if since else None
+    until_ms = parse_timestamp_ms(until) if until else None
+    if since and since_ms is None:
+        raise ValueError(f"Invalid --since timestamp {since!r}")
+    if until and until_ms is None:
+        raise ValueError(f"Invalid --until timestamp {until!r}")
+
+    with file_lock(lock_path_for_inbox(team, agent)):
+        index = inbox_store.open_index(team, agent)
+        entries = index["entries"]
+        matches: list[int] = []
+        for pos, entry in enumerate(entries):
+            if entry[inbox_store.SEQ] <= cursor:
+                continue
+            if unread_only and entry[inbox_store.READ]:
+                continue
+            if sender and entry[inbox_store.SENDER] != sender:
+                continue
+            if summary and entry[inbox_store.SUMMARY] != summary:
+                continue
+            ts = entry[inbox_store.TS_MS]
+            if since_ms is not None and (ts is None or ts < since_ms):
+                continue
+            if until_ms is not None and (ts is None or ts > until_ms):
+                continue
+            matches.append(pos)
+        matches.sort(key=lambda pos: entries[pos][inbox_store.SEQ])
+        selected = matches
+        if limit > 0 and len(matches) > limit:
+            selected = matches[-limit:] if latest else matches[:limit]
+        messages = inbox_store.fetch(team, agent, [entries[pos] for pos in selected])
         if mark_as_read and selected:
-            selected_ids = {id(item) for item in selected}
+            inbox_store.mark_read(team, agent, index, selected)
             for item in messages:
-                if id(item) in selected_ids:
-                    item["read"] = True
-            write_json_atomic(path, messages, indent=None)
-    return {"messages": selected, "count": len(selected)}
+                item["read"] = True
+    next_cursor = max((m["seq"] for m in messages), default=cursor)
+    return {
+        "messages": resolve_messages(team, messages),
+        "count": len(messages),
+        "matched": len(matches),
+        "hasMore": len(matches) > len(selected),
+        "nextCursor": next_cursor,
+    }
 
 
-def shutdown_request(team: str, recipient: str, reason: str) -> dict:
+def shutdown_request(
+    team: str, recipient: str, reason: str, sync: bool = False
+) -> dict:
     assert_team_scope(team)
     if current_role() == "teammate":
         raise PermissionError("Teammate session cannot request shutdown")
@@ -233,48 +292,68 @@ def shutdown_request(team: str, recipient: str, reason: str) -> dict:
         raise ValueError(f"Unknown recipient {recipient!r}")
 
     request_id = f"shutdown-{int(time.time() * 1000)}@{recipient}"
+    instructions = (
+        SHUTDOWN_TEMPLATE.read_text(encoding="utf-8")
+        .replace("{{TEAM}}", team)
+        .replace("{{REQUEST_ID}}", request_id)
+        .replace("{{RECIPIENT}}", recipient)
+        .replace("{{REASON}}", reason or "-")
+    )
     payload = {
         "type": "shutdown_request",
         "requestId": request_id,
         "from": "team-lead",
         "reason": reason,
+        "replySummaries": ["shutdown_approved", "shutdown_rejected"],
+        "instructions": instructions,
         "timestamp": now_iso(),
     }
+    body = message_body(team, json.dumps(payload, ensure_ascii=True))
     append(
         team,
         recipient,
         {
             "from": "team-lead",
-            "text": json.dumps(payload, ensure_ascii=True),
+            **body,
             "timestamp": now_iso(),
             "read": False,
             "summary": "shutdown_request",
         },
     )
-    pushed = False
-    session_id = target_member.get("opencodeSessionId")
-    if isinstance(session_id, str) and session_id:
-        model = target_member.get("model")
-        if not isinstance(model, str):
-            model = ""
-        try:
-            prompt_async(
-                session_id,
-                json.dumps(payload, ensure_ascii=True),
-                target_member.get("agentType", "build"),
-                model,
-            )
-            pushed = True
-        except OpenCodeAPIError:
-            pushed = False
+    delivery = push(team, target_member, body, sync=sync)
     return {
         "success": True,
         "request_id": request_id,
         "recipient": recipient,
-        "pushed_to_session": pushed,
+        "pushed_to_session": delivery["pushed"],
+        "push_queued": delivery["queued"],
     }
 
 
+def run_delivery(team: str, idle_exit: float, poll_ms: int) -> dict:
+    assert_team_scope(team)
+    _ = load_config(team)
+    return run_worker(team, idle_exit, poll_ms)
+
+
+def stop_delivery(team: str, timeout: float) -> dict:
+    assert_team_scope(team)
+    _ = load_config(team)
+    return stop_worker(team, timeout)
+
+
+def outbox(team: str) -> dict:
+    assert_team_scope(team)
+    _ = load_config(team)
+    return outbox_status(team)
+
+
+def gc_blobs(team: str, grace_seconds: int) -> dict:
+    assert_lead_only("gc-blobs", team)
+    _ = load_config(team)
+    return gc(team, grace_seconds)
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Inbox operations for teammate orchestration"
@@ -293,6 +372,9 @@ def parse_args() -> argparse.Namespace:
     p_send.add_argument("--summary", required=True)
     p_send.add_argument("--color", default="")
     p_send.add_argument("--no-replace-summary", action="store_true")
+    p_send.add_argument(
+        "--sync", action="store_true", help="Push inline instead of via the worker"
+    )
 
     p_bcast = sub.add_parser("broadcast")
     p_bcast.add_argument("--team", required=True)
@@ -300,23 +382,58 @@ def parse_args() -> argparse.Namespace:
     p_bcast.add_argument("--text", required=True)
     p_bcast.add_argument("--summary", required=True)
     p_bcast.add_argument("--no-replace-summary", action="store_true")
+    p_bcast.add_argument("--sync", action="store_true")
 
     p_read = sub.add_parser("read")
     p_read.add_argument("--team", required=True)
     p_read.add_argument("--agent", required=True)
     p_read.add_argument("--unread-only", action="store_true")
     p_read.add_argument("--no-mark-read", action="store_true")
+    p_read.add_argument("--from", dest="sender", default="")
+    p_read.add_argument("--summary", default="")
+    p_read.add_argument("--since", default="", help="ISO timestamp, inclusive")
+    p_read.add_argument("--until", default="", help="ISO timestamp, inclusive")
+    p_read.add_argument(
+        "--cursor", type=int, default=0, help="Only messages with seq > cursor"
+    )
+    p_read.add_argument("--limit", type=int, default=0, help="0 means no limit")
+    p_read.add_argument(
+        "--latest", action="store_true", help="With --limit, keep the newest"
+    )
 
     p_shutdown = sub.add_parser("shutdown-request")
     p_shutdown.add_argument("--team", required=True)
     p_shutdown.add_argument("--recipient", required=True)
     p_shutdown.add_argument("--reason", default="")
+    p_shutdown.add_argument("--sync", action="store_true")
+
+    p_deliver = sub.add_parser("deliver", help="Run the team's delivery worker")
+    p_deliver.add_argument("--team", required=True)
+    p_deliver.add_argument(
+        "--idle-exit",
+        type=float,
+        default=WORKER_IDLE_EXIT_SECONDS,
+        help="Seconds without deliverable pushes before exiting",
+    )
+    p_deliver.add_argument("--poll-ms", type=int, default=WORKER_POLL_MS)
+
+    p_stop = sub.add_parser("stop-worker", help="Stop the team's delivery worker")
+    p_stop.add_argument("--team", required=True)
+    p_stop.add_argument("--timeout", type=float, default=10.0)
+
+    p_outbox = sub.add_parser("outbox", help="Queued pushes and delivery latency")
+    p_outbox.add_argument("--team", required=True)
+
+    p_gc = sub.add_parser("gc-blobs")
+    p_gc.add_argument("--team", required=True)
+    p_gc.add_argument("--grace-seconds", type=int, default=DEFAULT_GC_GRACE_SECONDS)
 
     return parser.parse_args()
 
 
 def main() -> int:
     args = parse_args()
+    profile_command("inbox.py", args.cmd, args.team)
     try:
         if args.cmd == "ensure":
             result = ensure(args.team, args.agent)
@@ -329,6 +446,7 @@ def main() -> int:
                 args.summary,
                 args.color,
                 not args.no_replace_summary,
+                sync=args.sync,
             )
         elif args.cmd == "broadcast":
             result = broadcast(
@@ -337,13 +455,34 @@ def main() -> int:
                 args.text,
                 args.summary,
                 not args.no_replace_summary,
+                sync=args.sync,
             )
         elif args.cmd == "read":
             result = read(
-                args.team, args.agent, args.unread_only, not args.no_mark_read
+                args.team,
+                args.agent,
+                args.unread_only,
+                not args.no_mark_read,
+                sender=args.sender,
+                summary=args.summary,
+                since=args.since,
+                until=args.until,
+                cursor=max(0, args.cursor),
+                limit=max(0, args.limit),
+                latest=args.latest,
             )
         elif args.cmd == "shutdown-request":
-            result = shutdown_request(args.team, args.recipient, args.reason)
+            result = shutdown_request(
+                args.team, args.recipient, args.reason, sync=args.sync
+            )
+        elif args.cmd == "deliver":
+            result = run_delivery(args.team, args.idle_exit, max(1, args.poll_ms))
+        elif args.cmd == "stop-worker":
+            result = stop_delivery(args.team, max(0.0, args.timeout))
+        elif args.cmd == "outbox":
+            result = outbox(args.team)
+        elif args.cmd == "gc-blobs":
+            result = gc_blobs(args.team, args.grace_seconds)
         else:
             raise ValueError(f"Unsupported command: {args.cmd}")
         emit(result)
@@ -0,0 +1,319 @@
+"""Indexed inbox storage.
+
+Inbox files stay plain JSON arrays (`[msg, msg, ...]`), but every message gets a
+per-inbox `seq` and a sidecar index (`inboxes/<agent>.idx`) records, per message,
+its byte span in the inbox file plus the fields reads filter on. Reads filter the
+index and decode only the messages they return.
+
+The index is JSON lines: a version header, one row per message, and stamp
+records holding the inbox file's size, mtime and inode plus the next seq.
+Appends touch neither file's existing bytes: the message is written over the
+inbox's closing `]`, and a row plus a fresh stamp are appended to the index, so
+a send costs the same at any inbox size. Rewrites (mark-read, upsert,
+rebuild) re-serialize both files.
+
+The index is trusted only while its last stamp matches the inbox file, so an
+out-of-band edit, or a crash between the two writes, just triggers a rebuild.
+Functions that write must be called with the inbox lock held.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+import profiling
+from common import (
+    ensure_inbox,
+    inbox_index_path,
+    inbox_path,
+    parse_timestamp_ms,
+    profile_label,
+    read_json,
+    write_bytes_atomic,
+)
+
+
+INDEX_VERSION = 2
+# Enough to hold an index's last line (a stamp record).
+_STAMP_TAIL = 512
+# Index entry layout: [seq, offset, length, from, summary, timestampMs, read]
+SEQ, OFFSET, LENGTH, SENDER, SUMMARY, TS_MS, READ = range(7)
+
+
+def _encode(message: dict) -> bytes:
+    # Matches json.dump(list, indent=None) byte for byte, element by element.
+    return json.dumps(message, ensure_ascii=True).encode("ascii")
+
+
+def _entry(message: dict, offset: int, length: int) -> list:
+    return [
+        int(message["seq"]),
+        offset,
+        length,
+        message.get("from"),
+        message.get("summary"),
+        parse_timestamp_ms(str(message.get("timestamp", ""))),
+        bool(message.get("read", False)),
+    ]
+
+
+def _serialize(parts: list[bytes]) -> bytes:
+    return b"[" + b", ".join(parts) + b"]\n"
+
+
+def _line(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=True).encode("ascii") + b"\n"
+
+
+def _stamp(path: Any, next_seq: int, count: int) -> dict:
+    stat = path.stat()
+    return {
+        "size": stat.st_size,
+        "mtimeNs": stat.st_mtime_ns,
+        "ino": stat.st_ino,
+        "nextSeq": next_seq,
+        "count": count,
+    }
+
+
+def _current(stamp: Any, path: Any) -> bool:
+    """Whether a stamp record still describes the inbox file at path."""
+    if not isinstance(stamp, dict) or "nextSeq" not in stamp:
+        return False
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    return (stamp.get("size"), stamp.get("mtimeNs"), stamp.get("ino")) == (
+        stat.st_size,
+        stat.st_mtime_ns,
+        stat.st_ino,
+    )
+
+
+def _store(team: str, agent: str, raw: bytes, entries: list, next_seq: int) -> dict:
+    path = inbox_path(team, agent)
+    write_bytes_atomic(path, raw)
+    stamp = _stamp(path, next_seq, len(entries))
+    lines = [_line({"version": INDEX_VERSION})]
+    lines.extend(_line(entry) for entry in entries)
+    lines.append(_line(stamp))
+    write_bytes_atomic(inbox_index_path(team, agent), b"".join(lines))
+    return {"version": INDEX_VERSION, **stamp, "entries": entries}
+
+
+def _last_stamp(team: str, agent: str) -> dict | None:
+    """The index's final stamp record, read from the file's tail only."""
+    try:
+        with inbox_index_path(team, agent).open("rb") as handle:
+            end = handle.seek(0, os.SEEK_END)
+            handle.seek(max(0, end - _STAMP_TAIL))
+            tail = handle.read()
+        stamp = json.loads(tail.rstrip(b"\n").rsplit(b"\n", 1)[-1])
+    except (OSError, ValueError):
+        return None
+    return stamp if isinstance(stamp, dict) and "count" in stamp else None
+
+
+def load_index(team: str, agent: str) -> dict | None:
+    """Return the index when it still describes the inbox file, else None."""
+    path = inbox_index_path(team, agent)
+    try:
+        with profiling.span("json.read", profile_label(path)) as span:
+            raw = path.read_bytes()
+            span["bytes"] = len(raw)
+        rows = [json.loads(line) for line in raw.splitlines()]
+    except (OSError, ValueError):
+        return None
+    if not rows or rows[0] != {"version": INDEX_VERSION}:
+        return None
+    entries = [row for row in rows[1:] if isinstance(row, list)]
+    stamp = rows[-1]
+    if not _current(stamp, inbox_path(team, agent)) or stamp["count"] != len(entries):
+        return None
+    return {"version": INDEX_VERSION, **stamp, "entries": entries}
+
+
+def _read_raw(team: str, agent: str) -> bytes:
+    path = ensure_inbox(team, agent)
+    with profiling.span("json.read", profile_label(path)) as span:
+        raw = path.read_bytes()
+        span["bytes"] = len(raw)
+    return raw
+
+
+def _parse_inbox(team: str, agent: str, raw: bytes) -> Any:
+    try:
+        return json.loads(raw) if raw.strip() else []
+    except ValueError:
+        # An append torn by a crash only overwrote bytes from the previous
+        # closing `]` on; the last stamp still has the size from before it.
+        stamp = _last_stamp(team, agent)
+        if stamp is None or not 2 < stamp["size"] <= len(raw):
+            raise
+        return json.loads(raw[: stamp["size"] - 2] + b"]")
+
+
+def rebuild(team: str, agent: str) -> dict:
+    """Re-serialize the inbox canonically, assigning seq to messages lacking one."""
+    messages = _parse_inbox(team, agent, _read_raw(team, agent))
+    if not isinstance(messages, list):
+        raise ValueError(f"Invalid inbox file: {inbox_path(team, agent)}")
+    messages = [item for item in messages if isinstance(item, dict)]
+    next_seq = 1 + max(
+        (int(m["seq"]) for m in messages if isinstance(m.get("seq"), int)),
+        default=0,
+    )
+    for message in messages:
+        if not isinstance(message.get("seq"), int):
+            message["seq"] = next_seq
+            next_seq += 1
+    parts: list[bytes] = []
+    entries: list = []
+    offset = 1
+    for message in messages:
+        part = _encode(message)
+        entries.append(_entry(message, offset, len(part)))
+        parts.append(part)
+        offset += len(part) + 2
+    return _store(team, agent, _serialize(parts), entries, next_seq)
+
+
+def open_index(team: str, agent: str) -> dict:
+    """Index for a locked inbox, rebuilt first when stale or missing."""
+    ensure_inbox(team, agent)
+    index = load_index(team, agent)
+    return index if index is not None else rebuild(team, agent)
+
+
+def fetch(team: str, agent: str, entries: list) -> list[dict]:
+    """Decode only the messages behind the given index entries."""
+    if not entries:
+        return []
+    path = inbox_path(team, agent)
+    messages = []
+    with profiling.span("json.read", profile_label(path)) as span:
+        total = 0
+        with path.open("rb") as handle:
+            for entry in entries:
+                handle.seek(entry[OFFSET])
+                chunk = handle.read(entry[LENGTH])
+                total += len(chunk)
+                messages.append(json.loads(chunk))
+        span["bytes"] = total
+    return messages
+
+
+def append(team: str, agent: str, message: dict) -> dict:
+    """Add a message in place, reading only the tail of the index."""
+    path = ensure_inbox(team, agent)
+    stamp = _last_stamp(team, agent)
+    if not _current(stamp, path):
+        open_index(team, agent)
+        stamp = _last_stamp(team, agent)
+    stored = dict(message, seq=stamp["nextSeq"])
+    part = _encode(stored)
+    # The canonical file ends in `]\n` (`[]\n` when empty): write over it.
+    sep = b", " if stamp["count"] else b""
+    data = sep + part + b"]\n"
+    offset = stamp["size"] - 2 + len(sep)
+    with profiling.span("json.write", profile_label(path), bytes=len(data)):
+        with path.open("r+b") as handle:
+            handle.seek(stamp["size"] - 2)
+            handle.write(data)
+    row = _entry(stored, offset, len(part))
+    new_stamp = _stamp(path, stamp["nextSeq"] + 1, stamp["count"] + 1)
+    with inbox_index_path(team, agent).open("ab") as handle:
+        handle.write(_line(row) + _line(new_stamp))
+    return stored
+
+
+def replace(team: str, agent: str, index: dict, updates: dict[int, dict]) -> dict:
+    """Rewrite the messages at the given index positions, keeping the rest verbatim."""
+    raw = _read_raw(team, agent)
+    parts: list[bytes] = []
+    entries: list = []
+    offset = 1
+    for pos, entry in enumerate(index["entries"]):
+        if pos in updates:
+            part = _encode(updates[pos])
+            new_entry = _entry(updates[pos], offset, len(part))
+        else:
+            part = raw[entry[OFFSET] : entry[OFFSET] + entry[LENGTH]]
+            new_entry = [entry[SEQ], offset, *entry[LENGTH:]]
+        parts.append(part)
+        entries.append(new_entry)
+        offset += len(part) + 2
+    return _store(team, agent, _serialize(parts), entries, index["nextSeq"])
+
+
+def upsert_by_summary(team: str, agent: str, message: dict) -> bool:
+    """Replace the latest unread message with the same from+summary, else append.
+
+    A replacement takes a fresh seq so cursor-based readers see it again.
+    """
+    index = open_index(team, agent)
+    target_from = message.get("from")
+    target_summary = message.get("summary")
+    if target_from and target_summary:
+        entries = index["entries"]
+        for pos in range(len(entries) - 1, -1, -1):
+            entry = entries[pos]
+            if (
+                entry[SENDER] == target_from
+                and entry[SUMMARY] == target_summary
+                and not entry[READ]
+            ):
+                item = fetch(team, agent, [entry])[0]
+                for key in ("text", "textRef", "textBytes"):
+                    item.pop(key, None)
+                item.update(message)
+                item["seq"] = index["nextSeq"]
+                index["nextSeq"] += 1
+                replace(team, agent, index, {pos: item})
+                return True
+    append(team, agent, message)
+    return False
+
+
+def mark_read(team: str, agent: str, index: dict, positions: list[int]) -> None:
+    updates: dict[int, dict] = {}
+    pending = [pos for pos in positions if not index["entries"][pos][READ]]
+    fetched = fetch(team, agent, [index["entries"][pos] for pos in pending])
+    for pos, item in zip(pending, fetched):
+        item["read"] = True
+        updates[pos] = item
+    if updates:
+        replace(team, agent, index, updates)
+
+
+def headers(team: str, agent: str) -> list[dict[str, Any]]:
+    """Lock-free view of routing fields for every message (no bodies)."""
+    index = load_index(team, agent)
+    if index is not None:
+        return [
+            {
+                "seq": entry[SEQ],
+                "from": entry[SENDER],
+                "summary": entry[SUMMARY],
+                "timestampMs": entry[TS_MS],
+                "read": entry[READ],
+            }
+            for entry in index["entries"]
+        ]
+    messages = read_json(inbox_path(team, agent), [])
+    if not isinstance(messages, list):
+        return []
+    return [
+        {
+            "seq": item.get("seq"),
+            "from": item.get("from"),
+            "summary": item.get("summary"),
+            "timestampMs": parse_timestamp_ms(str(item.get("timestamp", ""))),
+            "read": bool(item.get("read", False)),
+        }
+        for item in messages
+        if isinstance(item, dict)
+    ]
@@ -7,22 +7,37 @@
 from __future__ import annotations
 
 import argparse
+import statistics
 from collections import Counter
+from pathlib import Path
+from typing import Any
 
+import inbox_store
+from blobs import resolve_messages
 from doctor import check as doctor_check
+from inbox import send
 
 from common import (
     assert_lead_only,
+    autoscale_state_path,
     emit,
     file_lock,
-    inbox_path,
-    lock_path_for_team,
-    read_json,
-    write_json_atomic,
+    lock_path_for_inbox,
+    parse_timestamp_ms,
+    profile_command,
     load_config,
     list_tasks,
+    read_json,
+)
+from task_store import read_index, recent_changes, sorted_ids, task_transaction
+from tasks import open_blockers, update_task
+
+
+ASSIGNMENT_TEMPLATE = (
+    Path(__file__).resolve().parent.parent / "templates" / "task-assignment.md"
 )
-from tasks import update_task
+ASSIGN_POLICIES = ("round-robin", "least-loaded", "fastest-first")
+HISTORY_WINDOW = 5000
 
 
 def sync_done(
@@ -33,16 +48,15 @@ def sync_done(
     mark_read: bool,
 ) -> dict:
     assert_lead_only("sync-done", team)
-    path = inbox_path(team, "team-lead")
-    with file_lock(lock_path_for_team(team)):
-        messages = read_json(path, [])
+    with file_lock(lock_path_for_inbox(team, "team-lead")):
+        index = inbox_store.open_index(team, "team-lead")
+        entries = index["entries"]
         match_index = -1
-        for i in range(len(messages) - 1, -1, -1):
-            msg = messages[i]
+        for i in range(len(entries) - 1, -1, -1):
+            entry = entries[i]
             if (
-                isinstance(msg, dict)
-                and msg.get("from") == from_agent
-                and msg.get("summary") == summary
+                entry[inbox_store.SENDER] == from_agent
+                and entry[inbox_store.SUMMARY] == summary
             ):
                 match_index = i
                 break
@@ -52,10 +66,8 @@ def sync_done(
                 "matched": False,
                 "reason": f"No message from {from_agent!r} with summary {summary!r}",
             }
-        msg = messages[match_index]
-        if mark_read and isinstance(msg, dict):
-            msg["read"] = True
-            write_json_atomic(path, messages, indent=None)
+        if mark_read:
+            inbox_store.mark_read(team, "team-lead", index, [match_index])
 
     task = update_task(
         team=team,
@@ -93,15 +105,16 @@ def status_report(team: str, max_messages: int) -> dict:
         if str(task.get("status", "pending")) != "completed"
     )
 
-    with file_lock(lock_path_for_team(team)):
-        lead_messages = read_json(inbox_path(team, "team-lead"), [])
-
-    unread = [
-        msg
-        for msg in lead_messages
-        if isinstance(msg, dict) and not bool(msg.get("read", False))
-    ]
-    latest_unread = unread[-max_messages:] if max_messages > 0 else []
+    with file_lock(lock_path_for_inbox(team, "team-lead")):
+        index = inbox_store.open_index(team, "team-lead")
+        unread = [e for e in index["entries"] if not e[inbox_store.READ]]
+        latest_unread = (
+            resolve_messages(
+                team, inbox_store.fetch(team, "team-lead", unread[-max_messages:])
+            )
+            if max_messages > 0
+            else []
+        )
 
     health = doctor_check(team)
 
@@ -139,6 +152,178 @@ def status_report(team: str, max_messages: int) -> dict:
     }
 
 
+def completion_history(
+    team: str, window: int = HISTORY_WINDOW
+) -> tuple[dict[str, float], str]:
+    """Median start-to-completion ms per owner, and the most recent assignee.
+
+    Derived from the task change log: a task's clock starts when it turns
+    in_progress (or, failing that, when its current owner was set) and stops
+    when it is completed.
+    """
+    owners: dict[str, str] = {}
+    assigned_at: dict[str, int] = {}
+    started_at: dict[str, int] = {}
+    samples: dict[str, list[float]] = {}
+    done: set[str] = set()
+    last_assignee = ""
+    for row in recent_changes(team, window):
+        tid = str(row.get("id"))
+        task = row.get("task")
+        stamp = parse_timestamp_ms(str(row.get("ts", "")))
+        if not isinstance(task, dict) or stamp is None:
+            continue
+        owner = str(task.get("owner") or "")
+        status = task.get("status")
+        if owner and owners.get(tid) != owner:
+            assigned_at[tid] = stamp
+            started_at.pop(tid, None)
+            last_assignee = owner
+        owners[tid] = owner
+        if status == "in_progress" and tid not in started_at:
+            started_at[tid] = stamp
+        elif status == "completed" and owner and tid not in done:
+            done.add(tid)
+            start = started_at.get(tid, assigned_at.get(tid))
+            if start is not None:
+                samples.setdefault(owner, []).append(float(stamp - start))
+    latency = {owner: statistics.median(vals) for owner, vals in samples.items()}
+    return latency, last_assignee
+
+
+def render_assignment(task: dict[str, Any], owner: str) -> str:
+    metadata = task.get("metadata") if isinstance(task.get("metadata"), dict) else {}
+    expected = str(
+        metadata.get("expectedOutput")
+        or "Report completion to team-lead with summary worker_done."
+    )
+    template = ASSIGNMENT_TEMPLATE.read_text(encoding="utf-8")
+    return (
+        template.replace("{{TASK_ID}}", str(task.get("id")))
+        .replace("{{SUBJECT}}", str(task.get("subject") or ""))
+        .replace("{{OWNER}}", owner)
+        .replace("{{DESCRIPTION}}", str(task.get("description") or "-"))
+        .replace("{{EXPECTED_OUTPUT}}", expected)
+    )
+
+
+def assign(
+    team: str,
+    policy: str,
+    max_per_owner: int,
+    limit: int,
+    notify: bool,
+    dry_run: bool,
+) -> dict:
+    """Give ready, unassigned tasks to active teammates under one policy."""
+    assert_lead_only("assign", team)
+    if policy not in ASSIGN_POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}")
+    cfg = load_config(team)
+    # Teammates the autoscaler is retiring get no new work.
+    autoscale = read_json(autoscale_state_path(team), {})
+    retiring = autoscale.get("retiring", {}) if isinstance(autoscale, dict) else {}
+    candidates = sorted(
+        str(m.get("name"))
+        for m in cfg.get("members", [])
+        if isinstance(m, dict)
+        and m.get("name") != "team-lead"
+        and bool(m.get("isActive", False))
+        and m.get("name") not in retiring
+    )
+    index_tasks = read_index(team)["tasks"]
+    load = Counter(
+        str(entry.get("owner"))
+        for entry in index_tasks.values()
+        if entry.get("owner") and entry.get("status") in {"pending", "in_progress"}
+    )
+    ready = [
+        tid
+        for tid in sorted_ids(index_tasks)
+        if index_tasks[tid].get("status") == "pending"
+        and not index_tasks[tid].get("owner")
+        and not open_blockers(index_tasks, tid)
+    ]
+    latency, last_assignee = completion_history(team)
+    # Teammates without history are assumed to run at the team median.
+    default_latency = statistics.median(latency.values()) if latency else 1.0
+
+    def has_room(name: str) -> bool:
+        return max_per_owner <= 0 or load[name] < max_per_owner
+
+    rotation = candidates
+    if last_assignee in candidates:
+        pos = candidates.index(last_assignee) + 1
+        rotation = candidates[pos:] + candidates[:pos]
+
+    plan: list[tuple[str, str]] = []
+    for tid in ready:
+        if limit and len(plan) >= limit:
+            break
+        open_slots = [name for name in rotation if has_room(name)]
+        if not open_slots:
+            break
+        if policy == "round-robin":
+            owner = open_slots[0]
+            cut = rotation.index(owner) + 1
+            rotation = rotation[cut:] + rotation[:cut]
+        elif policy == "least-loaded":
+            owner = min(open_slots, key=lambda name: (load[name], name))
+        else:
+            owner = min(
+                open_slots,
+                key=lambda name: (
+                    (load[name] + 1) * latency.get(name, default_latency),
+                    name,
+                ),
+            )
+        load[owner] += 1
+        plan.append((tid, owner))
+
+    assigned: list[dict[str, Any]] = []
+    if not dry_run and plan:
+        with task_transaction(team) as txn:
+            for tid, owner in plan:
+                task = txn.load(tid)
+                if task.get("owner") or task.get("status") != "pending":
+                    continue
+                task["owner"] = owner
+                txn.save(task)
+                assigned.append({"taskId": tid, "owner": owner, "task": task})
+    else:
+        assigned = [{"taskId": tid, "owner": owner} for tid, owner in plan]
+
+    for item in assigned:
+        task = item.pop("task", None)
+        if task is None:
+            continue
+        item["notified"] = False
+        if notify:
+            result = send(
+                team,
+                "team-lead",
+                item["owner"],
+                render_assignment(task, item["owner"]),
+                f"task-assignment-{item['taskId']}",
+                "",
+                True,
+            )
+            item["notified"] = bool(
+                result.get("pushed_to_session") or result.get("push_queued")
+            )
+
+    placed = {item["taskId"] for item in assigned}
+    return {
+        "success": True,
+        "policy": policy,
+        "dryRun": dry_run,
+        "assigned": assigned,
+        "unassignedReady": [tid for tid in ready if tid not in placed],
+        "load": {name: load[name] for name in candidates},
+        "latencyMs": {name: round(ms) for name, ms in sorted(latency.items())},
+    }
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Lead automation helpers")
     sub = parser.add_subparsers(dest="cmd", required=True)
@@ -154,11 +339,25 @@ def parse_args() -> argparse.Namespace:
     p_report.add_argument("--team", required=True)
     p_report.add_argument("--max-messages", type=int, default=10)
 
+    p_assign = sub.add_parser("assign")
+    p_assign.add_argument("--team", required=True)
+    p_assign.add_argument("--policy", choices=ASSIGN_POLICIES, default="least-loaded")
+    p_assign.add_argument(
+        "--max-per-owner",
+        type=int,
+        default=1,
+        help="Open tasks a teammate may hold; 0 means no cap",
+    )
+    p_assign.add_argument("--limit", type=int, default=0, help="0 means no limit")
+    p_assign.add_argument("--no-notify", action="store_true")
+    p_assign.add_argument("--dry-run", action="store_true")
+
     return parser.parse_args()
 
 
 def main() -> int:
     args = parse_args()
+    profile_command("lead.py", args.cmd, args.team)
     try:
         if args.cmd == "sync-done":
             result = sync_done(
@@ -172,6 +371,15 @@ def main() -> int:
             result = status_report(
                 team=args.team, max_messages=max(0, int(args.max_messages))
             )
+        elif args.cmd == "assign":
+            result = assign(
+                team=args.team,
+                policy=args.policy,
+                max_per_owner=max(0, args.max_per_owner),
+                limit=max(0, args.limit),
+                notify=not args.no_notify,
+                dry_run=args.dry_run,
+            )
         else:
             raise ValueError(f"Unsupported command: {args.cmd}")
         emit(result)
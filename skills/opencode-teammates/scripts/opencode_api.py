@@ -1,22 +1,193 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import random
+import re
+import socket
+import time
 import urllib.error
 import urllib.request
+from pathlib import Path
+from typing import Any
+
+import profiling
+from common import claude_root, file_lock, read_json, write_json_atomic
+
+
+RETRIES_ENV = "OPENCODE_API_RETRIES"
+BACKOFF_ENV = "OPENCODE_API_BACKOFF_MS"
+BACKOFF_MAX_ENV = "OPENCODE_API_BACKOFF_MAX_MS"
+BREAKER_THRESHOLD_ENV = "OPENCODE_API_BREAKER_THRESHOLD"
+BREAKER_COOLDOWN_ENV = "OPENCODE_API_BREAKER_COOLDOWN_MS"
+TIMEOUT_ENV = "OPENCODE_API_TIMEOUT"
+
+# Process-local counters; the breaker file keeps the cross-process totals.
+COUNTERS = {
+    "requests": 0,
+    "retries": 0,
+    "failures": 0,
+    "shortCircuits": 0,
+}
 
 
 class OpenCodeAPIError(RuntimeError):
-    pass
+    def __init__(self, message: str, status: int | None = None, retry: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retry = retry
+
+
+class CircuitOpenError(OpenCodeAPIError):
+    """Raised without contacting the server while its breaker is open."""
 
 
 def server_url() -> str:
     return os.environ.get("OPENCODE_SERVER_URL", "http://127.0.0.1:4098").rstrip("/")
 
 
+def endpoint_label(method: str, path: str) -> str:
+    if path.startswith("/session/") and path != "/session/status":
+        path = re.sub(r"^/session/[^/]+", "/session/{id}", path)
+    return f"{method} {path}"
+
+
+def _env_number(name: str, default: float) -> float:
+    raw = os.environ.get(name, "").strip()
+    try:
+        value = float(raw) if raw else default
+    except ValueError:
+        return default
+    return value if value >= 0 else default
+
+
+def breaker_path(base: str) -> Path:
+    digest = hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+    return claude_root() / "opencode-breaker" / f"{digest}.json"
+
+
+def breaker_state(base: str = "") -> dict[str, Any]:
+    base = base or server_url()
+    state = read_json(breaker_path(base), {})
+    if not isinstance(state, dict):
+        state = {}
+    state.setdefault("server", base)
+    state.setdefault("consecutiveFailures", 0)
+    state.setdefault("openUntilMs", 0)
+    state.setdefault("counters", {})
+    return state
+
+
+def _update_breaker(base: str, ok: bool, retries: int) -> None:
+    """Record an outcome; only called when something beyond a clean success happened."""
+    path = breaker_path(base)
+    threshold = int(_env_number(BREAKER_THRESHOLD_ENV, 5))
+    cooldown_ms = int(_env_number(BREAKER_COOLDOWN_ENV, 30000))
+    with file_lock(path.with_suffix(".lock")):
+        state = breaker_state(base)
+        counters = state["counters"]
+        counters["retries"] = counters.get("retries", 0) + retries
+        now = int(time.time() * 1000)
+        state.pop("probeUntilMs", None)
+        if ok:
+            if state["consecutiveFailures"]:
+                counters["recoveries"] = counters.get("recoveries", 0) + 1
+            state["consecutiveFailures"] = 0
+            state["openUntilMs"] = 0
+        else:
+            counters["failures"] = counters.get("failures", 0) + 1
+            state["consecutiveFailures"] += 1
+            if threshold and state["consecutiveFailures"] >= threshold:
+                if state["openUntilMs"] <= now:
+                    counters["opens"] = counters.get("opens", 0) + 1
+                state["openUntilMs"] = now + cooldown_ms
+        write_json_atomic(path, state)
+
+
+def _admit(base: str, probe_lease_ms: int) -> bool:
+    """Let a call through a tripped breaker; True means it is the half-open probe.
+
+    Raises CircuitOpenError while the breaker is open, and once the cooldown
+    has passed, for every caller but the one holding the probe claim. The claim
+    lapses after probe_lease_ms in case its holder dies mid-request.
+    """
+    path = breaker_path(base)
+    with file_lock(path.with_suffix(".lock")):
+        state = breaker_state(base)
+        now = int(time.time() * 1000)
+        probing = state.get("probeUntilMs", 0) > now
+        if state["openUntilMs"] and (state["openUntilMs"] > now or probing):
+            counters = state["counters"]
+            counters["shortCircuits"] = counters.get("shortCircuits", 0) + 1
+            write_json_atomic(path, state)
+            COUNTERS["shortCircuits"] += 1
+            phase = "open" if state["openUntilMs"] > now else "half-open, probe running"
+            raise CircuitOpenError(
+                f"opencode server at {base} is failing; circuit {phase} after "
+                f"{state['consecutiveFailures']} consecutive errors"
+            )
+        if not state["openUntilMs"]:
+            return False
+        state["probeUntilMs"] = now + probe_lease_ms
+        write_json_atomic(path, state)
+        return True
+
+
 def _request(
-    method: str, path: str, body: dict | None = None, timeout: int = 20
+    method: str, path: str, body: dict | None = None, timeout: int = 0
 ) -> dict | list:
+    """Send with retries and jittered exponential backoff behind a circuit breaker.
+
+    Retries cover connection errors, 429 and 5xx; timeouts are retried only for
+    GET, since a timed-out POST may already have been applied. After
+    OPENCODE_API_BREAKER_THRESHOLD consecutive failed requests the breaker for
+    this server opens for OPENCODE_API_BREAKER_COOLDOWN_MS and calls fail fast
+    with CircuitOpenError. After the cooldown a single caller claims the
+    half-open probe and sends once, without retries; everyone else keeps
+    failing fast until the probe closes or reopens the breaker.
+    """
+    base = server_url()
+    timeout = timeout or int(_env_number(TIMEOUT_ENV, 20)) or 20
+    retries = int(_env_number(RETRIES_ENV, 2))
+    backoff_ms = _env_number(BACKOFF_ENV, 200)
+    backoff_max_ms = _env_number(BACKOFF_MAX_ENV, 2000)
+    COUNTERS["requests"] += 1
+
+    state = breaker_state(base)
+    probe = bool(state["openUntilMs"]) and _admit(base, (timeout + 5) * 1000)
+    if probe:
+        retries = 0
+
+    with profiling.span("http", endpoint_label(method, path)) as span:
+        span["ok"] = False
+        attempt = 0
+        while True:
+            try:
+                data = _send(method, path, body, timeout)
+            except OpenCodeAPIError as exc:
+                if not exc.retry or attempt >= retries:
+                    span["attempts"] = attempt + 1
+                    COUNTERS["failures"] += 1
+                    if exc.status is None or exc.status >= 500 or exc.status == 429:
+                        _update_breaker(base, ok=False, retries=attempt)
+                    elif probe:
+                        # The server answered, so it is back; the error is ours.
+                        _update_breaker(base, ok=True, retries=0)
+                    raise
+                delay = min(backoff_max_ms, backoff_ms * (2**attempt))
+                time.sleep(random.uniform(0, delay) / 1000.0)
+                attempt += 1
+                COUNTERS["retries"] += 1
+                continue
+            span["ok"] = True
+            span["attempts"] = attempt + 1
+            if attempt or probe or state["consecutiveFailures"]:
+                _update_breaker(base, ok=True, retries=attempt)
+            return data
+
+
+def _send(method: str, path: str, body: dict | None, timeout: int) -> dict | list:
     base = server_url()
     url = f"{base}{path}"
     payload = None if body is None else json.dumps(body).encode("utf-8")
@@ -33,10 +204,20 @@ def _request(
         except Exception:
             detail = ""
         raise OpenCodeAPIError(
-            f"opencode API {method} {path} failed ({exc.code}): {detail[:200]}"
+            f"opencode API {method} {path} failed ({exc.code}): {detail[:200]}",
+            status=exc.code,
+            retry=exc.code == 429 or exc.code >= 500,
         )
     except urllib.error.URLError as exc:
-        raise OpenCodeAPIError(f"cannot reach opencode server at {base}: {exc.reason}")
+        timed_out = isinstance(exc.reason, (socket.timeout, TimeoutError))
+        raise OpenCodeAPIError(
+            f"cannot reach opencode server at {base}: {exc.reason}",
+            retry=method == "GET" or not timed_out,
+        )
+    except (socket.timeout, TimeoutError) as exc:
+        raise OpenCodeAPIError(
+            f"opencode API {method} {path} timed out: {exc}", retry=method == "GET"
+        )
 
 
 def health() -> dict:
@@ -90,14 +271,25 @@ def delete_session(session_id: str) -> None:
     _request("DELETE", f"/session/{session_id}")
 
 
-def session_status(session_id: str) -> str:
-    data = _request("GET", "/session/status")
-    if not isinstance(data, dict):
-        return "unknown"
-    value = data.get(session_id)
+def _status_type(value: object) -> str:
     if isinstance(value, dict):
         state = value.get("type")
         return state if isinstance(state, str) else "unknown"
     if isinstance(value, str):
         return value
     return "unknown"
+
+
+def session_status(session_id: str) -> str:
+    data = _request("GET", "/session/status")
+    if not isinstance(data, dict):
+        return "unknown"
+    return _status_type(data.get(session_id))
+
+
+def session_statuses() -> dict[str, str]:
+    """Status of every session the server tracks, in one request."""
+    data = _request("GET", "/session/status")
+    if not isinstance(data, dict):
+        return {}
+    return {str(sid): _status_type(value) for sid, value in data.items()}
@@ -0,0 +1,133 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+
+"""Minimal local stand-in for the `opencode serve` endpoints used by opencode_api."""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, latency_ms: float, error_rate: float) -> None:
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.sessions: dict[str, list[dict]] = {}
+        self.prompts = 0
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+
+def make_handler(state: StubState) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: object) -> None:
+            return
+
+        def _reply(self, code: int, payload: object | None) -> None:
+            raw = b"" if payload is None else json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(raw)))
+            self.end_headers()
+            if raw:
+                self.wfile.write(raw)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("content-length") or 0)
+            if not length:
+                return {}
+            data = json.loads(self.rfile.read(length).decode("utf-8"))
+            return data if isinstance(data, dict) else {}
+
+        def _handle(self, method: str) -> None:
+            if state.latency_ms > 0:
+                time.sleep(state.latency_ms / 1000.0)
+            if state.error_rate > 0 and random.random() < state.error_rate:
+                self._reply(500, {"error": "stub failure"})
+                return
+            body = self._body() if method in {"POST", "PUT"} else {}
+            parts = [part for part in self.path.split("?")[0].split("/") if part]
+            action = parts[2] if len(parts) == 3 and parts[0] == "session" else ""
+
+            if method == "GET" and parts == ["global", "health"]:
+                self._reply(200, {"healthy": True, "version": "stub"})
+            elif method == "POST" and parts == ["session"]:
+                with state.lock:
+                    sid = f"ses_stub_{next(state.ids)}"
+                    state.sessions[sid] = []
+                self._reply(200, {"id": sid, "title": body.get("title", "")})
+            elif method == "GET" and parts == ["session", "status"]:
+                with state.lock:
+                    statuses = {sid: {"type": "idle"} for sid in state.sessions}
+                self._reply(200, statuses)
+            elif action == "prompt_async":
+                with state.lock:
+                    state.sessions.setdefault(parts[1], []).append(body)
+                    state.prompts += 1
+                self._reply(204, None)
+            elif action == "message":
+                self._reply(200, [])
+            elif action == "abort":
+                self._reply(200, True)
+            elif method == "DELETE" and len(parts) == 2 and parts[0] == "session":
+                with state.lock:
+                    state.sessions.pop(parts[1], None)
+                self._reply(200, True)
+            else:
+                self._reply(404, {"error": f"no stub route for {method} {self.path}"})
+
+        def do_GET(self) -> None:
+            self._handle("GET")
+
+        def do_POST(self) -> None:
+            self._handle("POST")
+
+        def do_DELETE(self) -> None:
+            self._handle("DELETE")
+
+    return Handler
+
+
+def start_stub(
+    port: int = 0, latency_ms: float = 0.0, error_rate: float = 0.0
+) -> tuple[ThreadingHTTPServer, StubState, str]:
+    """Serve the stub on a daemon thread; returns (server, state, base_url)."""
+    state = StubState(latency_ms, error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, bound_port = server.server_address[:2]
+    return server, state, f"http://{host}:{bound_port}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local opencode serve stub")
+    parser.add_argument("--port", type=int, default=4098)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, _, url = start_stub(args.port, args.latency_ms, args.error_rate)
+    print(json.dumps({"success": True, "url": url}))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
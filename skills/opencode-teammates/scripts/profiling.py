@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import atexit
+import contextlib
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+
+PROFILE_ENV = "OPENCODE_TEAM_PROFILE"
+
+_spans: list[dict[str, Any]] = []
+_command: dict[str, Any] = {}
+_flush_registered = False
+
+
+def enabled() -> bool:
+    value = os.environ.get(PROFILE_ENV, "").strip().lower()
+    return value not in {"", "0", "false", "no", "off"}
+
+
+def record(kind: str, name: str, ms: float, **fields: Any) -> None:
+    if not enabled():
+        return
+    item: dict[str, Any] = {"kind": kind, "name": name, "ms": round(ms, 3)}
+    item.update(fields)
+    _spans.append(item)
+
+
+@contextlib.contextmanager
+def span(kind: str, name: str, **fields: Any) -> Iterator[dict[str, Any]]:
+    """Time the enclosed block; callers can attach fields (bytes, ok) to the yield."""
+    extra: dict[str, Any] = dict(fields)
+    if not enabled():
+        yield extra
+        return
+    start = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        record(kind, name, (time.perf_counter() - start) * 1000, **extra)
+
+
+def begin_command(script: str, cmd: str, metrics_file: Path) -> None:
+    global _flush_registered
+    if not enabled() or _command:
+        return
+    _command.update(
+        {
+            "script": script,
+            "cmd": cmd,
+            "path": metrics_file,
+            "start": time.perf_counter(),
+        }
+    )
+    if not _flush_registered:
+        atexit.register(flush)
+        _flush_registered = True
+
+
+def end_command() -> None:
+    """Write the current command's spans so long-running loops can begin another."""
+    flush()
+    _command.clear()
+
+
+def flush() -> None:
+    if not _command:
+        return
+    path: Path = _command["path"]
+    record(
+        "command",
+        f"{_command['script']} {_command['cmd']}",
+        (time.perf_counter() - _command["start"]) * 1000,
+    )
+    if not path.parent.exists():
+        _spans.clear()
+        return
+    ts = datetime.now(timezone.utc).isoformat()
+    lines = []
+    for item in _spans:
+        row = {
+            "ts": ts,
+            "pid": os.getpid(),
+            "script": _command["script"],
+            "cmd": _command["cmd"],
+        }
+        row.update(item)
+        lines.append(json.dumps(row, ensure_ascii=True) + "\n")
+    _spans.clear()
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, "".join(lines).encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
@@ -185,6 +185,7 @@ BOOTSTRAP_FILE="$(mktemp)"
   --from-name team-lead \
   --to "$NAME" \
   --summary bootstrap \
+  --sync \
   --text "$WRAPPED_PROMPT" > "$BOOTSTRAP_FILE"
 
 BOOTSTRAP_PUSHED=$(BOOTSTRAP_FILE="$BOOTSTRAP_FILE" python3 - <<'PY'
@@ -0,0 +1,361 @@
+"""Task index and write transactions.
+
+`tasks/<team>/.index.json` caches the routing fields of every task (subject,
+status, owner, dependency edges) keyed by id, together with the task file's
+mtime. Readers refresh only entries whose file changed, so list filters and
+graph walks avoid parsing every task. All task writes go through
+`task_transaction`, which holds the tasks lock and commits the index once.
+The index also keeps an owner -> task ids map (`byOwner`), updated with every
+entry, so per-member operations touch only that member's tasks.
+
+Every committed mutation is also appended to `tasks/<team>/changes.jsonl` with a
+team-wide, monotonically increasing `seq` (the counter lives in the index), so
+pollers can ask for the deltas since the last seq they saw. Changes made behind
+the scripts' back are logged when the index refresh notices them. The log is
+compacted to its newest half past `CHANGE_LOG_MAX_BYTES`; readers whose seq
+predates the retained window get `reset` and should re-list.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import copy
+import json
+import os
+from typing import Any, Iterator
+
+import profiling
+from common import (
+    file_lock,
+    lock_path_for_tasks,
+    now_iso,
+    profile_label,
+    read_json,
+    task_changes_path,
+    task_index_path,
+    task_path,
+    tasks_dir,
+    write_bytes_atomic,
+    write_json_atomic,
+)
+
+
+INDEX_VERSION = 4
+INDEX_FIELDS = ("subject", "status", "owner", "blocks", "blockedBy")
+CHANGE_LOG_MAX_BYTES = 4 * 1024 * 1024
+_TAIL_CHUNK = 64 * 1024
+
+# (op, task id, task snapshot or None for deletes)
+Change = tuple[str, str, dict[str, Any] | None]
+
+
+def summarize(task: dict[str, Any], mtime_ns: int) -> dict[str, Any]:
+    entry: dict[str, Any] = {field: task.get(field) for field in INDEX_FIELDS}
+    entry["blocks"] = [str(x) for x in task.get("blocks") or []]
+    entry["blockedBy"] = [str(x) for x in task.get("blockedBy") or []]
+    metadata = task.get("metadata")
+    estimate = metadata.get("estimate") if isinstance(metadata, dict) else None
+    entry["estimate"] = estimate if isinstance(estimate, (int, float)) else None
+    entry["mtimeNs"] = mtime_ns
+    return entry
+
+
+def _task_files(team: str) -> dict[str, int]:
+    files: dict[str, int] = {}
+    tdir = tasks_dir(team)
+    if not tdir.exists():
+        return files
+    with os.scandir(tdir) as entries:
+        for item in entries:
+            stem, _, suffix = item.name.partition(".")
+            if suffix != "json" or not stem.isdigit():
+                continue
+            files[str(int(stem))] = item.stat().st_mtime_ns
+    return files
+
+
+def _set_entry(
+    index: dict[str, Any], tid: str, entry: dict[str, Any] | None
+) -> dict[str, Any] | None:
+    """Replace (or drop, with None) one index entry, keeping byOwner in step."""
+    by_owner: dict[str, list[str]] = index["byOwner"]
+    previous = index["tasks"].pop(tid, None)
+    old_owner = (previous or {}).get("owner")
+    new_owner = (entry or {}).get("owner")
+    if old_owner and old_owner != new_owner:
+        ids = [x for x in by_owner.get(old_owner, []) if x != tid]
+        if ids:
+            by_owner[old_owner] = ids
+        else:
+            by_owner.pop(old_owner, None)
+    if new_owner and new_owner != old_owner:
+        by_owner[new_owner] = sorted_ids(by_owner.get(new_owner, []) + [tid])
+    if entry is not None:
+        index["tasks"][tid] = entry
+    return previous
+
+
+def _refresh(team: str, index: dict[str, Any]) -> list[Change]:
+    """Bring index entries in line with task files on disk; return what changed."""
+    tasks = index["tasks"]
+    files = _task_files(team)
+    changes: list[Change] = []
+    for tid in list(tasks):
+        if tid not in files:
+            _set_entry(index, tid, None)
+            changes.append(("delete", tid, None))
+    for tid, mtime_ns in files.items():
+        entry = tasks.get(tid)
+        if entry is not None and entry.get("mtimeNs") == mtime_ns:
+            continue
+        task = read_json(task_path(team, tid), {})
+        if isinstance(task, dict):
+            _set_entry(index, tid, summarize(task, mtime_ns))
+            changes.append(("update" if entry else "create", tid, task))
+        elif _set_entry(index, tid, None) is not None:
+            changes.append(("delete", tid, None))
+    return changes
+
+
+def _reverse_rows(team: str) -> Iterator[dict[str, Any]]:
+    """Yield change-log rows newest first, reading the file backwards in chunks."""
+    path = task_changes_path(team)
+    if not path.exists():
+        return
+    with path.open("rb") as handle:
+        pos = handle.seek(0, os.SEEK_END)
+        carry = b""
+        while pos > 0:
+            step = min(_TAIL_CHUNK, pos)
+            pos -= step
+            handle.seek(pos)
+            lines = (handle.read(step) + carry).split(b"\n")
+            carry = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield json.loads(line)
+        if carry.strip():
+            yield json.loads(carry)
+
+
+def _log_size(team: str) -> int:
+    try:
+        return task_changes_path(team).stat().st_size
+    except OSError:
+        return 0
+
+
+def _append_changes(team: str, index: dict[str, Any], changes: list[Change]) -> None:
+    if not changes:
+        return
+    stamp = now_iso()
+    lines: list[bytes] = []
+    for op, tid, task in changes:
+        index["seq"] += 1
+        row: dict[str, Any] = {"seq": index["seq"], "ts": stamp, "op": op, "id": tid}
+        if task is not None:
+            row["task"] = task
+        lines.append(json.dumps(row, ensure_ascii=True).encode("ascii") + b"\n")
+    path = task_changes_path(team)
+    data = b"".join(lines)
+    with profiling.span("json.write", profile_label(path)) as span:
+        with path.open("ab") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        span["bytes"] = len(data)
+    size = _log_size(team)
+    if size > CHANGE_LOG_MAX_BYTES:
+        size = _compact(team, index)
+    index["logSize"] = size
+
+
+def _compact(team: str, index: dict[str, Any]) -> int:
+    """Keep the newest half of the log; older seqs fall out of the window."""
+    budget = CHANGE_LOG_MAX_BYTES // 2
+    kept: list[bytes] = []
+    used = 0
+    for row in _reverse_rows(team):
+        line = json.dumps(row, ensure_ascii=True).encode("ascii") + b"\n"
+        if kept and used + len(line) > budget:
+            break
+        kept.append(line)
+        used += len(line)
+    kept.reverse()
+    write_bytes_atomic(task_changes_path(team), b"".join(kept))
+    if kept:
+        index["logStart"] = json.loads(kept[0])["seq"]
+    return used
+
+
+def _sync_log(team: str, index: dict[str, Any], fresh: bool) -> None:
+    """Recover the seq counter when the log moved without this index seeing it."""
+    size = _log_size(team)
+    if not fresh and size == index.get("logSize"):
+        return
+    tail = next(_reverse_rows(team), None)
+    seq = max(int(index.get("seq", 0)), int(tail["seq"]) if tail else 0)
+    if fresh and index["tasks"]:
+        # Unknown history: burn a seq so every existing reader is told to reset.
+        seq += 1
+        index["logStart"] = seq + 1
+    elif fresh or not size:
+        index["logStart"] = seq + 1
+    index["seq"] = seq
+    index["logSize"] = size
+
+
+def _load_locked(team: str) -> dict[str, Any]:
+    index = read_json(task_index_path(team), None)
+    fresh = not isinstance(index, dict) or index.get("version") != INDEX_VERSION
+    if fresh:
+        index = {
+            "version": INDEX_VERSION,
+            "seq": 0,
+            "logStart": 1,
+            "tasks": {},
+            "byOwner": {},
+        }
+    changes = _refresh(team, index)
+    before = (index.get("seq"), index.get("logStart"), index.get("logSize"))
+    _sync_log(team, index, fresh)
+    if not fresh:
+        _append_changes(team, index, changes)
+    after = (index.get("seq"), index.get("logStart"), index.get("logSize"))
+    if changes or fresh or before != after:
+        write_json_atomic(task_index_path(team), index, indent=None)
+    return index
+
+
+def read_index(team: str) -> dict[str, Any]:
+    """Fresh index snapshot; takes the tasks lock briefly."""
+    with file_lock(lock_path_for_tasks(team)):
+        return _load_locked(team)
+
+
+def sorted_ids(ids: Any) -> list[str]:
+    return sorted((str(x) for x in ids), key=int)
+
+
+class TaskTransaction:
+    """Task writes made under one tasks-lock hold, with a single index commit."""
+
+    def __init__(self, team: str, index: dict[str, Any]) -> None:
+        self.team = team
+        self.index = index
+        self.tasks: dict[str, dict[str, Any]] = index["tasks"]
+        self.changes: dict[str, tuple[str, dict[str, Any] | None]] = {}
+        self.dirty = False
+
+    def next_id(self) -> str:
+        return str(max((int(tid) for tid in self.tasks), default=0) + 1)
+
+    def entry(self, task_id: str) -> dict[str, Any] | None:
+        return self.tasks.get(str(task_id))
+
+    def load(self, task_id: str) -> dict[str, Any]:
+        path = task_path(self.team, task_id)
+        if not path.exists():
+            raise FileNotFoundError(f"Task {task_id!r} not found")
+        data = read_json(path, {})
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid task file: {path}")
+        return data
+
+    def owned_by(self, owner: str) -> list[str]:
+        return list(self.index["byOwner"].get(owner, []))
+
+    def dependents(self, task_id: str) -> list[str]:
+        """Ids of tasks that list task_id in blocks or blockedBy."""
+        return sorted_ids(
+            tid
+            for tid, entry in self.tasks.items()
+            if task_id in entry["blockedBy"] or task_id in entry["blocks"]
+        )
+
+    def save(self, task: dict[str, Any]) -> None:
+        tid = str(task.get("id"))
+        path = task_path(self.team, tid)
+        op = "update" if tid in self.tasks else "create"
+        if self.changes.get(tid, ("",))[0] == "create":
+            op = "create"
+        write_json_atomic(path, task)
+        _set_entry(self.index, tid, summarize(task, path.stat().st_mtime_ns))
+        self.changes[tid] = (op, copy.deepcopy(task))
+        self.dirty = True
+
+    def delete(self, task_id: str) -> None:
+        tid = str(task_id)
+        task_path(self.team, tid).unlink(missing_ok=True)
+        _set_entry(self.index, tid, None)
+        if self.changes.get(tid, ("",))[0] == "create":
+            del self.changes[tid]
+        else:
+            self.changes[tid] = ("delete", None)
+        self.dirty = True
+
+    def commit(self) -> None:
+        if self.dirty:
+            changes = [(op, tid, task) for tid, (op, task) in self.changes.items()]
+            _append_changes(self.team, self.index, changes)
+            write_json_atomic(task_index_path(self.team), self.index, indent=None)
+            self.changes = {}
+            self.dirty = False
+
+
+@contextlib.contextmanager
+def task_transaction(team: str) -> Iterator[TaskTransaction]:
+    tasks_dir(team).mkdir(parents=True, exist_ok=True)
+    with file_lock(lock_path_for_tasks(team)):
+        txn = TaskTransaction(team, _load_locked(team))
+        try:
+            yield txn
+        finally:
+            # Files written before a failure are real; keep the index in step.
+            txn.commit()
+
+
+def recent_changes(team: str, limit: int) -> list[dict[str, Any]]:
+    """The newest `limit` change-log rows, oldest first."""
+    rows: list[dict[str, Any]] = []
+    with file_lock(lock_path_for_tasks(team)):
+        for row in _reverse_rows(team):
+            if len(rows) >= limit:
+                break
+            rows.append(row)
+    rows.reverse()
+    return rows
+
+
+def read_changes(team: str, since: int, limit: int = 0) -> dict[str, Any]:
+    """Change-log rows with seq > since, oldest first, read from the log's tail."""
+    with file_lock(lock_path_for_tasks(team)):
+        index = _load_locked(team)
+        head = int(index["seq"])
+        if since < int(index["logStart"]) - 1 or since > head:
+            return {
+                "seq": head,
+                "since": since,
+                "reset": True,
+                "changes": [],
+                "hasMore": False,
+                "nextSince": head,
+            }
+        rows: list[dict[str, Any]] = []
+        if since < head:
+            for row in _reverse_rows(team):
+                if int(row["seq"]) <= since:
+                    break
+                rows.append(row)
+    rows.reverse()
+    has_more = bool(limit) and len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+    return {
+        "seq": head,
+        "since": since,
+        "reset": False,
+        "changes": rows,
+        "hasMore": has_more,
+        "nextSince": rows[-1]["seq"] if has_more else head,
+    }
@@ -8,31 +8,38 @@ from __future__ import annotations
 
 import argparse
 import json
+import math
 from collections import deque
 from pathlib import Path
 from typing import Any
 
+try:
+    import yaml
+except ImportError:  # pragma: no cover - YAML plans are optional
+    yaml = None
+
 from common import (
     assert_team_scope,
     current_member_name,
     current_role,
     emit,
-    file_lock,
-    list_tasks,
     load_config,
-    lock_path_for_tasks,
-    next_task_id,
+    profile_command,
     read_json,
-    tasks_dir,
-    write_json_atomic,
+    task_path,
+)
+from task_store import (
+    TaskTransaction,
+    read_changes,
+    read_index,
+    sorted_ids,
+    task_transaction,
 )
 
 
 STATUS_ORDER = {"pending": 0, "in_progress": 1, "completed": 2}
-
-
-def task_path(team: str, task_id: str) -> Path:
-    return tasks_dir(team) / f"{task_id}.json"
+INDEXED_FIELDS = ("id", "subject", "status", "owner", "blocks", "blockedBy")
+TABLE_FIELDS = ["id", "status", "owner", "subject", "blockedBy"]
 
 
 def require_task(team: str, task_id: str) -> dict[str, Any]:
@@ -51,37 +58,25 @@ def parse_list_arg(value: str) -> list[str]:
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
-def dependency_map(team: str) -> dict[str, list[str]]:
-    graph: dict[str, list[str]] = {}
-    for task in list_tasks(team):
-        tid = str(task.get("id", ""))
-        graph[tid] = [str(dep) for dep in task.get("blockedBy", [])]
-    return graph
-
-
-def would_create_cycle(team: str, task_id: str, add_blocked_by: list[str]) -> bool:
-    graph = dependency_map(team)
-    graph.setdefault(task_id, [])
-    for dep in add_blocked_by:
-        graph[task_id].append(dep)
+def dependency_map(index_tasks: dict[str, dict[str, Any]]) -> dict[str, list[str]]:
+    return {tid: list(entry["blockedBy"]) for tid, entry in index_tasks.items()}
 
-    visited: set[str] = set()
-    stack: set[str] = set()
 
-    def dfs(node: str) -> bool:
-        if node in stack:
+def would_create_cycle(
+    graph: dict[str, list[str]], task_id: str, add_blocked_by: list[str]
+) -> bool:
+    """True when task_id is reachable from a new blocker via blockedBy edges."""
+    seen: set[str] = set()
+    queue = deque(add_blocked_by)
+    while queue:
+        node = queue.popleft()
+        if node == task_id:
             return True
-        if node in visited:
-            return False
-        visited.add(node)
-        stack.add(node)
-        for nxt in graph.get(node, []):
-            if dfs(nxt):
-                return True
-        stack.remove(node)
-        return False
-
-    return dfs(task_id)
+        if node in seen:
+            continue
+        seen.add(node)
+        queue.extend(graph.get(node, []))
+    return False
 
 
 def validate_status_transition(
@@ -111,23 +106,21 @@ def create_task(
     _ = load_config(team)
     if not subject.strip():
         raise ValueError("Task subject must not be empty")
-    tdir = tasks_dir(team)
-    tdir.mkdir(parents=True, exist_ok=True)
 
     metadata = json.loads(metadata_json) if metadata_json else None
-    task = {
-        "id": next_task_id(team),
-        "subject": subject,
-        "description": description,
-        "activeForm": active_form,
-        "status": "pending",
-        "blocks": [],
-        "blockedBy": [],
-        "owner": None,
-        "metadata": metadata,
-    }
-    with file_lock(lock_path_for_tasks(team)):
-        write_json_atomic(task_path(team, task["id"]), task)
+    with task_transaction(team) as txn:
+        task = {
+            "id": txn.next_id(),
+            "subject": subject,
+            "description": description,
+            "activeForm": active_form,
+            "status": "pending",
+            "blocks": [],
+            "blockedBy": [],
+            "owner": None,
+            "metadata": metadata,
+        }
+        txn.save(task)
     return task
 
 
@@ -145,9 +138,8 @@ def update_task(
 ) -> dict:
     _ = load_config(team)
     assert_team_scope(team)
-    path = task_path(team, task_id)
-    with file_lock(lock_path_for_tasks(team)):
-        task = require_task(team, task_id)
+    with task_transaction(team) as txn:
+        task = txn.load(task_id)
 
         if current_role() == "teammate":
             member = current_member_name()
@@ -174,10 +166,13 @@ def update_task(
                 raise PermissionError("Teammate cannot delete tasks")
 
         for ref in add_blocks + add_blocked_by:
-            _ = require_task(team, ref)
+            if txn.entry(ref) is None:
+                raise FileNotFoundError(f"Task {ref!r} not found")
             if ref == task_id:
                 raise ValueError("Task cannot depend on itself")
-        if add_blocked_by and would_create_cycle(team, task_id, add_blocked_by):
+        if add_blocked_by and would_create_cycle(
+            dependency_map(txn.tasks), task_id, add_blocked_by
+        ):
             raise ValueError("Dependency update would create a circular dependency")
 
         if subject:
@@ -202,19 +197,19 @@ def update_task(
 
         for dep in add_blocks:
             blocks.add(dep)
-            dep_task = require_task(team, dep)
+            dep_task = txn.load(dep)
             dep_blocked = set(str(item) for item in dep_task.get("blockedBy", []))
             dep_blocked.add(task_id)
             dep_task["blockedBy"] = sorted(dep_blocked, key=lambda x: int(x))
-            write_json_atomic(task_path(team, dep), dep_task)
+            txn.save(dep_task)
 
         for dep in add_blocked_by:
             blocked_by.add(dep)
-            dep_task = require_task(team, dep)
+            dep_task = txn.load(dep)
             dep_blocks = set(str(item) for item in dep_task.get("blocks", []))
             dep_blocks.add(task_id)
             dep_task["blocks"] = sorted(dep_blocks, key=lambda x: int(x))
-            write_json_atomic(task_path(team, dep), dep_task)
+            txn.save(dep_task)
 
         task["blocks"] = sorted(blocks, key=lambda x: int(x))
         task["blockedBy"] = sorted(blocked_by, key=lambda x: int(x))
@@ -234,30 +229,30 @@ def update_task(
         if status:
             validate_status_transition(team, task, status)
             if status == "deleted":
-                unlink_deleted_task(team, task_id)
+                unlink_deleted_task(txn, task_id)
                 task["status"] = "deleted"
                 return task
             task["status"] = status
 
             if status == "completed":
-                for other in list_tasks(team):
-                    oid = str(other.get("id"))
+                for oid in txn.dependents(task_id):
                     if oid == task_id:
                         continue
+                    other = txn.load(oid)
                     ob = [x for x in other.get("blockedBy", []) if str(x) != task_id]
                     if len(ob) != len(other.get("blockedBy", [])):
                         other["blockedBy"] = ob
-                        write_json_atomic(task_path(team, oid), other)
+                        txn.save(other)
 
-        write_json_atomic(path, task)
+        txn.save(task)
     return task
 
 
-def unlink_deleted_task(team: str, task_id: str) -> None:
-    for other in list_tasks(team):
-        oid = str(other.get("id"))
+def unlink_deleted_task(txn: TaskTransaction, task_id: str) -> None:
+    for oid in txn.dependents(task_id):
         if oid == task_id:
             continue
+        other = txn.load(oid)
         changed = False
         blocks = [x for x in other.get("blocks", []) if str(x) != task_id]
         blocked_by = [x for x in other.get("blockedBy", []) if str(x) != task_id]
@@ -268,8 +263,8 @@ def unlink_deleted_task(team: str, task_id: str) -> None:
             other["blockedBy"] = blocked_by
             changed = True
         if changed:
-            write_json_atomic(task_path(team, oid), other)
-    task_path(team, task_id).unlink(missing_ok=True)
+            txn.save(other)
+    txn.delete(task_id)
 
 
 def get_task(team: str, task_id: str) -> dict:
@@ -281,17 +276,329 @@ def get_task(team: str, task_id: str) -> dict:
 def reset_owner(team: str, owner: str) -> dict:
     count = 0
     _ = load_config(team)
-    with file_lock(lock_path_for_tasks(team)):
-        for task in list_tasks(team):
-            if task.get("owner") == owner:
-                task["owner"] = None
-                if task.get("status") != "completed":
-                    task["status"] = "pending"
-                write_json_atomic(task_path(team, str(task.get("id"))), task)
-                count += 1
+    with task_transaction(team) as txn:
+        for tid in txn.owned_by(owner):
+            task = txn.load(tid)
+            task["owner"] = None
+            if task.get("status") != "completed":
+                task["status"] = "pending"
+            txn.save(task)
+            count += 1
     return {"success": True, "reset": count}
 
 
+def load_plan(path: str) -> list[Any]:
+    plan_path = Path(path).expanduser()
+    text = plan_path.read_text(encoding="utf-8")
+    if plan_path.suffix.lower() in {".yaml", ".yml"}:
+        if yaml is None:
+            raise ValueError("YAML plans need PyYAML installed; use a JSON plan")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    specs = data.get("tasks") if isinstance(data, dict) else data
+    if not isinstance(specs, list):
+        raise ValueError("Plan must be a list of tasks or an object with 'tasks'")
+    return specs
+
+
+def import_plan(team: str, specs: list[Any]) -> dict:
+    """Create a whole task graph in one transaction after validating it in memory.
+
+    Each spec may carry a `key`; `blockedBy` entries name other keys in the plan
+    or ids of existing tasks.
+    """
+    cfg = load_config(team)
+    members = {m.get("name") for m in cfg.get("members", []) if isinstance(m, dict)}
+    keys: dict[str, int] = {}
+    for pos, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Plan entry {pos + 1} must be an object")
+        if not str(spec.get("subject") or "").strip():
+            raise ValueError(f"Plan entry {pos + 1} has an empty subject")
+        key = str(spec.get("key") or "").strip()
+        if key:
+            if key in keys:
+                raise ValueError(f"Duplicate plan key {key!r}")
+            keys[key] = pos
+        owner = spec.get("owner")
+        if owner and owner not in members:
+            raise ValueError(f"Owner {owner!r} not in team")
+        metadata = spec.get("metadata")
+        if metadata is not None and not isinstance(metadata, dict):
+            raise ValueError(f"Plan entry {pos + 1}: metadata must be an object")
+        if not isinstance(spec.get("blockedBy") or [], list):
+            raise ValueError(f"Plan entry {pos + 1}: blockedBy must be a list")
+
+    with task_transaction(team) as txn:
+        new_deps: list[set[int]] = []
+        old_deps: list[set[str]] = []
+        for pos, spec in enumerate(specs):
+            inside: set[int] = set()
+            outside: set[str] = set()
+            for raw in spec.get("blockedBy") or []:
+                ref = str(raw).strip()
+                if ref in keys:
+                    if keys[ref] == pos:
+                        raise ValueError("Task cannot depend on itself")
+                    inside.add(keys[ref])
+                elif txn.entry(ref) is not None:
+                    outside.add(ref)
+                else:
+                    raise ValueError(
+                        f"Plan entry {pos + 1}: unknown dependency {ref!r}"
+                    )
+            new_deps.append(inside)
+            old_deps.append(outside)
+
+        # Existing tasks never depend on new ones, so only plan edges can cycle.
+        dependents: list[list[int]] = [[] for _ in specs]
+        indegree = [len(deps) for deps in new_deps]
+        for pos, deps in enumerate(new_deps):
+            for dep in deps:
+                dependents[dep].append(pos)
+        queue = deque(pos for pos, degree in enumerate(indegree) if degree == 0)
+        visited = 0
+        while queue:
+            node = queue.popleft()
+            visited += 1
+            for nxt in dependents[node]:
+                indegree[nxt] -= 1
+                if indegree[nxt] == 0:
+                    queue.append(nxt)
+        if visited < len(specs):
+            stuck = [
+                str(specs[pos].get("key") or pos + 1)
+                for pos, degree in enumerate(indegree)
+                if degree
+            ]
+            raise ValueError(f"Plan has a circular dependency among: {stuck}")
+
+        first = int(txn.next_id())
+        ids = [str(first + pos) for pos in range(len(specs))]
+        extra_blocks: dict[str, list[str]] = {}
+        created: list[dict[str, Any]] = []
+        for pos, spec in enumerate(specs):
+            blocked_by = [ids[dep] for dep in new_deps[pos]] + list(old_deps[pos])
+            for ref in old_deps[pos]:
+                extra_blocks.setdefault(ref, []).append(ids[pos])
+            created.append(
+                {
+                    "id": ids[pos],
+                    "subject": str(spec["subject"]),
+                    "description": str(spec.get("description") or ""),
+                    "activeForm": str(spec.get("activeForm") or ""),
+                    "status": "pending",
+                    "blocks": sorted((ids[n] for n in dependents[pos]), key=int),
+                    "blockedBy": sorted(blocked_by, key=int),
+                    "owner": spec.get("owner") or None,
+                    "metadata": spec.get("metadata") or None,
+                }
+            )
+        for ref, blocked in extra_blocks.items():
+            dep_task = txn.load(ref)
+            dep_blocks = set(str(item) for item in dep_task.get("blocks", []))
+            dep_blocks.update(blocked)
+            dep_task["blocks"] = sorted(dep_blocks, key=int)
+            txn.save(dep_task)
+        for task in created:
+            txn.save(task)
+
+    return {
+        "success": True,
+        "created": len(created),
+        "ids": {key: ids[pos] for key, pos in keys.items()},
+        "tasks": [
+            {"id": t["id"], "subject": t["subject"], "blockedBy": t["blockedBy"]}
+            for t in created
+        ],
+    }
+
+
+def analyze_graph(
+    index_tasks: dict[str, dict[str, Any]], default_estimate: float
+) -> dict[str, Any]:
+    """Critical path and level widths over the tasks that are not completed.
+
+    Durations come from `metadata.estimate` (any positive number), else
+    default_estimate. Tasks on one topological level never depend on each
+    other, so a level's width is how many could run side by side.
+    """
+    remaining = {
+        tid: entry
+        for tid, entry in index_tasks.items()
+        if entry.get("status") in {"pending", "in_progress"}
+    }
+    deps = {
+        tid: [dep for dep in entry["blockedBy"] if dep in remaining]
+        for tid, entry in remaining.items()
+    }
+    dependents: dict[str, list[str]] = {tid: [] for tid in remaining}
+    for tid, blockers in deps.items():
+        for dep in blockers:
+            dependents[dep].append(tid)
+
+    def duration(tid: str) -> float:
+        estimate = remaining[tid].get("estimate")
+        return float(estimate) if estimate and estimate > 0 else default_estimate
+
+    indegree = {tid: len(blockers) for tid, blockers in deps.items()}
+    queue = deque(tid for tid in sorted_ids(remaining) if indegree[tid] == 0)
+    level: dict[str, int] = {}
+    finish: dict[str, float] = {}
+    via: dict[str, str] = {}
+    while queue:
+        tid = queue.popleft()
+        level[tid] = 1 + max((level[d] for d in deps[tid]), default=-1)
+        start = 0.0
+        for dep in deps[tid]:
+            if finish[dep] > start:
+                start = finish[dep]
+                via[tid] = dep
+        finish[tid] = start + duration(tid)
+        for nxt in dependents[tid]:
+            indegree[nxt] -= 1
+            if indegree[nxt] == 0:
+                queue.append(nxt)
+    if len(level) < len(remaining):
+        stuck = sorted_ids(tid for tid in remaining if tid not in level)
+        raise ValueError(f"Task graph has a circular dependency among: {stuck}")
+
+    widths = [0] * (max(level.values(), default=-1) + 1)
+    for value in level.values():
+        widths[value] += 1
+    path: list[str] = []
+    if finish:
+        node: str | None = max(sorted_ids(finish), key=lambda tid: finish[tid])
+        while node is not None:
+            path.append(node)
+            node = via.get(node)
+        path.reverse()
+    span = finish[path[-1]] if path else 0.0
+    work = sum((duration(tid) for tid in remaining), 0.0)
+    parallelism = work / span if span else 0.0
+    ready = [
+        tid
+        for tid, entry in remaining.items()
+        if entry.get("status") == "pending" and not deps[tid]
+    ]
+    max_width = max(widths, default=0)
+    return {
+        "remaining": len(remaining),
+        "inProgress": sum(
+            1 for e in remaining.values() if e.get("status") == "in_progress"
+        ),
+        "totalWork": round(work, 3),
+        "criticalPath": {"length": round(span, 3), "tasks": path},
+        "levelWidths": widths,
+        "maxWidth": max_width,
+        "readyWidth": len(ready),
+        "averageParallelism": round(parallelism, 3),
+        "recommendedConcurrency": min(max_width, math.ceil(parallelism)),
+    }
+
+
+def analyze(team: str, default_estimate: float) -> dict:
+    cfg = load_config(team)
+    if default_estimate <= 0:
+        raise ValueError("--default-estimate must be positive")
+    result = analyze_graph(read_index(team)["tasks"], default_estimate)
+    teammates = sum(
+        1
+        for m in cfg.get("members", [])
+        if isinstance(m, dict) and m.get("name") != "team-lead"
+    )
+    result["teammates"] = teammates
+    result["suggestedSpawn"] = max(0, result["recommendedConcurrency"] - teammates)
+    return result
+
+
+def list_changes(team: str, since: int, limit: int) -> dict:
+    _ = load_config(team)
+    if since < 0 or limit < 0:
+        raise ValueError("--since and --limit must be non-negative")
+    return read_changes(team, since, limit)
+
+
+def open_blockers(index_tasks: dict[str, dict[str, Any]], task_id: str) -> list[str]:
+    return [
+        dep
+        for dep in index_tasks[task_id]["blockedBy"]
+        if dep in index_tasks and index_tasks[dep].get("status") != "completed"
+    ]
+
+
+def list_filtered(
+    team: str,
+    statuses: list[str],
+    owner: str,
+    blocked: bool,
+    ready: bool,
+    fields: list[str],
+) -> list[dict[str, Any]]:
+    """Filter on the task index; parse task files only for non-indexed fields."""
+    _ = load_config(team)
+    for status in statuses:
+        if status not in STATUS_ORDER:
+            raise ValueError(f"Invalid status {status!r}")
+    index_tasks = read_index(team)["tasks"]
+    selected: list[str] = []
+    for tid in sorted_ids(index_tasks):
+        entry = index_tasks[tid]
+        status = str(entry.get("status") or "pending")
+        if statuses and status not in statuses:
+            continue
+        if owner == "unassigned":
+            if entry.get("owner"):
+                continue
+        elif owner and entry.get("owner") != owner:
+            continue
+        if blocked or ready:
+            is_blocked = bool(open_blockers(index_tasks, tid))
+            if blocked and not is_blocked:
+                continue
+            if ready and (status != "pending" or is_blocked):
+                continue
+        selected.append(tid)
+
+    if fields and all(field in INDEXED_FIELDS for field in fields):
+        return [
+            {f: tid if f == "id" else index_tasks[tid].get(f) for f in fields}
+            for tid in selected
+        ]
+    tasks: list[dict[str, Any]] = []
+    for tid in selected:
+        task = read_json(task_path(team, tid), {})
+        if isinstance(task, dict):
+            tasks.append({f: task.get(f) for f in fields} if fields else task)
+    return tasks
+
+
+def render_tasks(tasks: list[dict[str, Any]], fmt: str, fields: list[str]) -> str:
+    if fmt == "ndjson":
+        return "\n".join(json.dumps(task, ensure_ascii=True) for task in tasks)
+
+    def cell(value: Any) -> str:
+        if value is None or value == []:
+            return "-"
+        if isinstance(value, list):
+            return ",".join(str(item) for item in value)
+        if isinstance(value, dict):
+            return json.dumps(value, ensure_ascii=True)
+        return str(value)
+
+    columns = fields or TABLE_FIELDS
+    rows = [[cell(task.get(col)) for col in columns] for task in tasks]
+    widths = [
+        max([len(col)] + [len(row[i]) for row in rows])
+        for i, col in enumerate(columns)
+    ]
+    lines = ["  ".join(col.ljust(widths[i]) for i, col in enumerate(columns)).rstrip()]
+    for row in rows:
+        lines.append("  ".join(v.ljust(widths[i]) for i, v in enumerate(row)).rstrip())
+    return "\n".join(lines)
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Task state operations for teammate orchestration"
@@ -323,6 +630,33 @@ def parse_args() -> argparse.Namespace:
 
     p_list = sub.add_parser("list")
     p_list.add_argument("--team", required=True)
+    p_list.add_argument("--status", default="", help="Comma-separated statuses")
+    p_list.add_argument("--owner", default="", help="Member name or 'unassigned'")
+    readiness = p_list.add_mutually_exclusive_group()
+    readiness.add_argument("--blocked", action="store_true")
+    readiness.add_argument("--ready", action="store_true")
+    p_list.add_argument("--fields", default="", help="e.g. id,subject,status,owner")
+    p_list.add_argument(
+        "--format", choices=["json", "table", "ndjson"], default="json"
+    )
+
+    p_import = sub.add_parser("import")
+    p_import.add_argument("--team", required=True)
+    p_import.add_argument("--file", required=True, help="Plan in JSON or YAML")
+
+    p_analyze = sub.add_parser("analyze")
+    p_analyze.add_argument("--team", required=True)
+    p_analyze.add_argument(
+        "--default-estimate",
+        type=float,
+        default=1.0,
+        help="Duration for tasks without metadata.estimate",
+    )
+
+    p_changes = sub.add_parser("changes")
+    p_changes.add_argument("--team", required=True)
+    p_changes.add_argument("--since", type=int, default=0, help="Last seq seen")
+    p_changes.add_argument("--limit", type=int, default=0)
 
     p_reset = sub.add_parser("reset-owner")
     p_reset.add_argument("--team", required=True)
@@ -333,10 +667,11 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> int:
     args = parse_args()
+    profile_command("tasks.py", args.cmd, args.team)
     try:
         if current_role() == "teammate":
             assert_team_scope(args.team)
-            if args.cmd in {"create", "reset-owner"}:
+            if args.cmd in {"create", "import", "reset-owner"}:
                 raise PermissionError(f"Teammate sessions cannot run {args.cmd}")
         if args.cmd == "create":
             result = create_task(
@@ -362,8 +697,25 @@ def main() -> int:
         elif args.cmd == "get":
             result = get_task(args.team, args.id)
         elif args.cmd == "list":
-            _ = load_config(args.team)
-            result = {"tasks": list_tasks(args.team)}
+            fields = parse_list_arg(args.fields)
+            tasks = list_filtered(
+                args.team,
+                statuses=parse_list_arg(args.status),
+                owner=args.owner,
+                blocked=args.blocked,
+                ready=args.ready,
+                fields=fields,
+            )
+            if args.format != "json":
+                print(render_tasks(tasks, args.format, fields))
+                return 0
+            result = {"tasks": tasks}
+        elif args.cmd == "import":
+            result = import_plan(args.team, load_plan(args.file))
+        elif args.cmd == "analyze":
+            result = analyze(args.team, args.default_estimate)
+        elif args.cmd == "changes":
+            result = list_changes(args.team, args.since, args.limit)
         elif args.cmd == "reset-owner":
             result = reset_owner(args.team, args.owner)
         else:
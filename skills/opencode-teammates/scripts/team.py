@@ -9,8 +9,13 @@ from __future__ import annotations
 import argparse
 import os
 import re
-import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
+
+import inbox_store
+from delivery import stop_worker
 
 from opencode_api import OpenCodeAPIError, abort_session, delete_session
 
@@ -21,16 +26,19 @@ from common import (
     emit,
     ensure_dirs,
     file_lock,
+    inbox_dir,
     load_config,
-    lock_path_for_tasks,
     lock_path_for_team,
     new_session_id,
     now_ms,
-    read_json,
+    profile_command,
+    run_command,
     tasks_dir,
     validate_name,
     write_config,
 )
+from task_store import read_index
+from tasks import reset_owner
 
 
 def detect_tmux_anchor() -> tuple[str, str]:
@@ -39,17 +47,14 @@ def detect_tmux_anchor() -> tuple[str, str]:
     pane_from_env = os.environ.get("TMUX_PANE", "").strip()
     if pane_from_env:
         try:
-            pane_check = subprocess.run(
-                ["tmux", "display-message", "-p", "-t", pane_from_env, "#{pane_id}"],
-                check=False,
-                capture_output=True,
-                text=True,
+            pane_check = run_command(
+                ["tmux", "display-message", "-p", "-t", pane_from_env, "#{pane_id}"]
             )
             if (
                 pane_check.returncode == 0
                 and pane_check.stdout.strip() == pane_from_env
             ):
-                window = subprocess.run(
+                window = run_command(
                     [
                         "tmux",
                         "display-message",
@@ -57,28 +62,15 @@ def detect_tmux_anchor() -> tuple[str, str]:
                         "-t",
                         pane_from_env,
                         "#{window_id}",
-                    ],
-                    check=False,
-                    capture_output=True,
-                    text=True,
+                    ]
                 )
                 if window.returncode == 0 and window.stdout.strip():
                     return window.stdout.strip(), pane_from_env
         except Exception:
             pass
     try:
-        window = subprocess.run(
-            ["tmux", "display-message", "-p", "#{window_id}"],
-            check=False,
-            capture_output=True,
-            text=True,
-        )
-        pane = subprocess.run(
-            ["tmux", "display-message", "-p", "#{pane_id}"],
-            check=False,
-            capture_output=True,
-            text=True,
-        )
+        window = run_command(["tmux", "display-message", "-p", "#{window_id}"])
+        pane = run_command(["tmux", "display-message", "-p", "#{pane_id}"])
     except Exception:
         return "", ""
     window_id = window.stdout.strip() if window.returncode == 0 else ""
@@ -185,6 +177,8 @@ def delete_team(team: str) -> dict:
             f"Cannot delete {team!r}: {len(teammates)} teammate(s) still active"
         )
 
+    # A delivery worker still running would recreate outbox files mid-delete.
+    stop_worker(team)
     for root in (config_path(team).parent, tasks_dir(team)):
         if root.exists():
             for child in sorted(root.glob("**/*"), reverse=True):
@@ -206,6 +200,73 @@ def list_teams() -> dict:
     return {"teams": teams}
 
 
+def team_summary(team: str) -> dict[str, Any]:
+    """Counts for one team from the task index and the inbox indexes."""
+    cfg = load_config(team)
+    members = [m for m in cfg.get("members", []) if isinstance(m, dict)]
+    teammates = [m for m in members if m.get("name") != "team-lead"]
+
+    statuses: Counter[str] = Counter()
+    if tasks_dir(team).exists():
+        for entry in read_index(team)["tasks"].values():
+            statuses[str(entry.get("status") or "pending")] += 1
+
+    unread: dict[str, int] = {}
+    indexed = 0
+    if inbox_dir(team).exists():
+        for path in sorted(inbox_dir(team).glob("*.json")):
+            agent = path.stem
+            index = inbox_store.load_index(team, agent)
+            if index is not None:
+                indexed += 1
+                count = sum(
+                    1 for entry in index["entries"] if not entry[inbox_store.READ]
+                )
+            else:
+                count = sum(
+                    1 for h in inbox_store.headers(team, agent) if not h["read"]
+                )
+            if count:
+                unread[agent] = count
+    return {
+        "team": team,
+        "members": {
+            "total": len(members),
+            "teammates": len(teammates),
+            "activeTeammates": sum(1 for m in teammates if m.get("isActive")),
+        },
+        "tasks": {"total": sum(statuses.values()), "byStatus": dict(statuses)},
+        "unread": {"total": sum(unread.values()), "byAgent": unread},
+        "inboxIndexHits": indexed,
+    }
+
+
+def overview(workers: int) -> dict:
+    teams = list_teams()["teams"]
+
+    def safe_summary(team: str) -> dict[str, Any]:
+        try:
+            return team_summary(team)
+        except Exception as exc:
+            return {"team": team, "error": str(exc)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(teams)))) as pool:
+        summaries = list(pool.map(safe_summary, teams))
+
+    statuses: Counter[str] = Counter()
+    totals = {"members": 0, "activeTeammates": 0, "tasks": 0, "unread": 0}
+    for summary in summaries:
+        if "error" in summary:
+            continue
+        totals["members"] += summary["members"]["total"]
+        totals["activeTeammates"] += summary["members"]["activeTeammates"]
+        totals["tasks"] += summary["tasks"]["total"]
+        totals["unread"] += summary["unread"]["total"]
+        statuses.update(summary["tasks"]["byStatus"])
+    totals["byStatus"] = dict(statuses)
+    return {"teams": summaries, "totals": totals}
+
+
 def add_member(
     team: str,
     name: str,
@@ -278,21 +339,7 @@ def remove_member(
 
     reset_count = 0
     if reset_tasks:
-        with file_lock(lock_path_for_tasks(team)):
-            for task_file in tasks_dir(team).glob("*.json"):
-                try:
-                    int(task_file.stem)
-                except ValueError:
-                    continue
-                task = read_json(task_file, {})
-                if task.get("owner") == name:
-                    task["owner"] = None
-                    if task.get("status") != "completed":
-                        task["status"] = "pending"
-                    from common import write_json_atomic
-
-                    write_json_atomic(task_file, task)
-                    reset_count += 1
+        reset_count = reset_owner(team, name)["reset"]
 
     session_cleanup = "skipped"
     if cleanup_session and session_id:
@@ -360,6 +407,9 @@ def parse_args() -> argparse.Namespace:
 
     sub.add_parser("list")
 
+    p_overview = sub.add_parser("overview")
+    p_overview.add_argument("--workers", type=int, default=8)
+
     p_add = sub.add_parser("add-member")
     p_add.add_argument("--team", required=True)
     p_add.add_argument("--name", required=True)
@@ -394,6 +444,7 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> int:
     args = parse_args()
+    profile_command("team.py", args.cmd, getattr(args, "team", ""))
     try:
         if args.cmd in {
             "create",
@@ -414,6 +465,8 @@ def main() -> int:
             result = load_config(args.team)
         elif args.cmd == "list":
             result = list_teams()
+        elif args.cmd == "overview":
+            result = overview(args.workers)
         elif args.cmd == "add-member":
             result = add_member(
                 team=args.team,
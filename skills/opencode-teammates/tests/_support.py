@@ -0,0 +1,20 @@
+"""
+Shared helpers for the opencode-teammates script tests
+"""
+import contextlib
+import os
+import tempfile
+from pathlib import Path
+
+
+@contextlib.contextmanager
+def team_home(**env):
+    """Throwaway OPENCODE_TEAM_HOME plus extra environment; restores os.environ."""
+    previous = dict(os.environ)
+    with tempfile.TemporaryDirectory() as home:
+        os.environ.update(env, OPENCODE_TEAM_HOME=home)
+        try:
+            yield Path(home)
+        finally:
+            os.environ.clear()
+            os.environ.update(previous)
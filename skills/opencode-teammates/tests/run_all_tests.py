@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Run all opencode-teammates script tests
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+TEST_FILES = [
+    "test_blobs.py",
+    "test_inbox_store.py",
+    "test_task_store.py",
+    "test_task_import.py",
+    "test_breaker.py",
+    "test_delivery.py",
+]
+
+
+def main():
+    test_dir = Path(__file__).parent
+    failed = []
+    for test_file in TEST_FILES:
+        print(f"\n{'=' * 60}\nRunning: {test_file}\n{'=' * 60}")
+        result = subprocess.run([sys.executable, str(test_dir / test_file)])
+        if result.returncode != 0:
+            failed.append(test_file)
+
+    print(f"\n{'=' * 60}\nTEST SUMMARY\n{'=' * 60}")
+    for test_file in TEST_FILES:
+        status = "❌ FAILED" if test_file in failed else "✅ PASSED"
+        print(f"{status}: {test_file}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
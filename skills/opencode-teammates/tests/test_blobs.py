@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test blob storage and resolution of large message bodies
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import blobs
+
+
+def test_large_body_round_trip():
+    """Large texts are stored once and resolved back to text"""
+    with team_home():
+        text = "x" * (blobs.DEFAULT_BLOB_THRESHOLD + 1)
+        body = blobs.message_body("t", text)
+        assert set(body) == {"textRef", "textBytes"}
+        assert blobs.message_body("t", text)["textRef"] == body["textRef"]
+        [resolved] = blobs.resolve_messages("t", [{"from": "a", **body}])
+        assert resolved == {"from": "a", "text": text}
+
+
+def test_missing_blob_is_marked():
+    """A garbage-collected blob is reported, not passed off as empty text"""
+    with team_home():
+        message = {"from": "a", "textRef": "0" * 64, "textBytes": 5}
+        [resolved] = blobs.resolve_messages("t", [message])
+        assert "text" not in resolved
+        assert resolved["textMissing"] is True
+        assert resolved["textRef"] == message["textRef"]
+
+
+def test_malformed_ref_is_not_a_path():
+    """Refs that are not sha256 digests never reach the filesystem"""
+    with team_home() as home:
+        secret = home / "secret.txt"
+        secret.write_text("do not read")
+        for ref in ("../../secret", str(secret.with_suffix("")), "A" * 64):
+            [resolved] = blobs.resolve_messages("t", [{"textRef": ref}])
+            assert resolved == {"textRef": ref, "textMissing": True}
+
+
+if __name__ == "__main__":
+    test_large_body_round_trip()
+    test_missing_blob_is_marked()
+    test_malformed_ref_is_not_a_path()
+    print("\n✅ All blob tests passed!")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test opencode API retries and the circuit breaker's open / half-open transitions
+"""
+import contextlib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import opencode_api
+from opencode_api import CircuitOpenError, OpenCodeAPIError
+
+SETTINGS = {
+    "OPENCODE_SERVER_URL": "http://127.0.0.1:9",
+    opencode_api.RETRIES_ENV: "0",
+    opencode_api.BACKOFF_ENV: "0",
+    opencode_api.BREAKER_THRESHOLD_ENV: "2",
+    opencode_api.BREAKER_COOLDOWN_ENV: "100",
+}
+
+
+def breaker_home(**overrides):
+    """team_home with the breaker settings above, plus overrides."""
+    return team_home(**{**SETTINGS, **overrides})
+
+
+@contextlib.contextmanager
+def server(*outcomes):
+    """Replace the HTTP layer: each call pops the next status (200 means success)."""
+    calls = []
+    pending = list(outcomes)
+
+    def send(method, path, body, timeout):
+        calls.append(path)
+        status = pending.pop(0)
+        if status != 200:
+            raise OpenCodeAPIError(
+                f"HTTP {status}", status=status, retry=status == 429 or status >= 500
+            )
+        return {"healthy": True}
+
+    original = opencode_api._send
+    opencode_api._send = send
+    try:
+        yield calls
+    finally:
+        opencode_api._send = original
+
+
+def fails(exc_type):
+    try:
+        opencode_api.health()
+    except exc_type as exc:
+        return exc
+    raise AssertionError(f"expected {exc_type.__name__}")
+
+
+def state():
+    return opencode_api.breaker_state()
+
+
+def test_opens_after_threshold_and_short_circuits():
+    """Consecutive 5xx failures open the breaker; open calls never reach the server"""
+    with breaker_home(), server(503, 503) as calls:
+        fails(OpenCodeAPIError)
+        assert state()["openUntilMs"] == 0
+        fails(OpenCodeAPIError)
+        assert state()["openUntilMs"] > time.time() * 1000
+        assert state()["counters"]["opens"] == 1
+
+        exc = fails(CircuitOpenError)
+        assert "circuit open after 2" in str(exc)
+        assert len(calls) == 2
+        assert state()["counters"]["shortCircuits"] == 1
+
+
+def test_half_open_trial_success_closes():
+    """After the cooldown one trial call goes through and a success resets"""
+    with breaker_home(), server(500, 500, 200) as calls:
+        fails(OpenCodeAPIError)
+        fails(OpenCodeAPIError)
+        time.sleep(0.15)
+        assert opencode_api.health() == {"healthy": True}
+        assert len(calls) == 3
+        after = state()
+        assert after["consecutiveFailures"] == 0 and after["openUntilMs"] == 0
+        assert after["counters"]["recoveries"] == 1
+
+
+def test_half_open_trial_failure_reopens():
+    """A failed trial reopens the breaker for another cooldown"""
+    with breaker_home(), server(500, 500, 500) as calls:
+        fails(OpenCodeAPIError)
+        fails(OpenCodeAPIError)
+        time.sleep(0.15)
+        fails(OpenCodeAPIError)
+        assert len(calls) == 3
+        assert state()["counters"]["opens"] == 2
+        fails(CircuitOpenError)
+        assert len(calls) == 3
+
+
+def test_half_open_admits_a_single_probe_without_retries():
+    """While one caller probes, others still fail fast; the probe never retries"""
+    seen = []
+
+    def probe(method, path, body, timeout):
+        seen.append(path)
+        # A second caller arriving mid-probe must not reach the server.
+        seen.append(fails(CircuitOpenError))
+        raise OpenCodeAPIError("HTTP 503", status=503, retry=True)
+
+    with breaker_home(**{opencode_api.RETRIES_ENV: "3"}):
+        with server(*[500] * 8):
+            fails(OpenCodeAPIError)
+            fails(OpenCodeAPIError)
+        time.sleep(0.15)
+        original = opencode_api._send
+        opencode_api._send = probe
+        try:
+            fails(OpenCodeAPIError)
+        finally:
+            opencode_api._send = original
+        assert len(seen) == 2 and "half-open" in str(seen[1])
+        assert state()["counters"]["opens"] == 2
+        assert "probeUntilMs" not in state()
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    """4xx responses are the caller's problem, not the server's health"""
+    with breaker_home(), server(404, 404, 404) as calls:
+        for _ in range(3):
+            exc = fails(OpenCodeAPIError)
+            assert exc.status == 404 and not exc.retry
+        assert len(calls) == 3
+        assert state()["consecutiveFailures"] == 0
+
+
+def test_retries_count_as_one_failure():
+    """Retried 5xx responses within one request add a single breaker failure"""
+    with breaker_home(**{opencode_api.RETRIES_ENV: "2"}), server(502, 502, 502) as calls:
+        fails(OpenCodeAPIError)
+        assert len(calls) == 3
+        assert state()["consecutiveFailures"] == 1
+        assert state()["counters"]["retries"] == 2
+
+
+if __name__ == "__main__":
+    test_opens_after_threshold_and_short_circuits()
+    test_half_open_trial_success_closes()
+    test_half_open_trial_failure_reopens()
+    test_half_open_admits_a_single_probe_without_retries()
+    test_client_errors_do_not_trip_the_breaker()
+    test_retries_count_as_one_failure()
+    print("\n✅ All breaker tests passed!")
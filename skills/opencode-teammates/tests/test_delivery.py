@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test push delivery: coalescing, delivery modes, dead letters, and stopping the worker
+"""
+import contextlib
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import blobs
+import delivery
+from common import dead_letter_path, delivery_stop_path, ensure_dirs, write_config
+from opencode_api import CircuitOpenError, OpenCodeAPIError
+
+MEMBER = {"name": "worker-1", "opencodeSessionId": "ses_1", "agentType": "build"}
+
+
+@contextlib.contextmanager
+def team(**env):
+    """team_home with a one-teammate team and no coalescing wait."""
+    with team_home(OPENCODE_TEAM_COALESCE_MS="0", **env) as home:
+        ensure_dirs("t")
+        write_config("t", {"name": "t", "members": [{"name": "team-lead"}, MEMBER]})
+        yield home
+
+
+@contextlib.contextmanager
+def sessions(*errors):
+    """Record prompt_async calls instead of sending them; raise `errors` first."""
+    prompts = []
+    pending = list(errors)
+
+    def prompt_async(session_id, text, agent="build", model=""):
+        if pending:
+            raise pending.pop(0)
+        prompts.append((session_id, text))
+
+    original = delivery.prompt_async
+    delivery.prompt_async = prompt_async
+    try:
+        yield prompts
+    finally:
+        delivery.prompt_async = original
+
+
+def test_queued_pushes_coalesce_into_one_prompt():
+    """Everything queued for a recipient goes out as one ordered prompt"""
+    with team(), sessions() as prompts:
+        delivery.enqueue("t", "worker-1", {"text": "first"})
+        delivery.enqueue("t", "worker-1", {"text": "second"})
+        result = delivery.deliver("t", MEMBER, 0)
+        assert result["pushes"] == 1 and len(result["delivered"]) == 2
+        text = prompts[0][1]
+        assert text.startswith("2 queued messages")
+        assert text.index("first") < text.index("second")
+        assert delivery.pending("t", "worker-1") == []
+
+
+def test_same_key_replaces_queued_push():
+    with team(), sessions() as prompts:
+        delivery.enqueue("t", "worker-1", {"text": "old status"}, key="lead:status")
+        delivery.enqueue("t", "worker-1", {"text": "new status"}, key="lead:status")
+        delivery.deliver("t", MEMBER, 0)
+        assert prompts == [("ses_1", "new status")]
+
+
+def test_large_body_is_queued_by_ref():
+    """Queued items hold the blob ref, which gc keeps until the push resolves it"""
+    text = "x" * (blobs.DEFAULT_BLOB_THRESHOLD + 1)
+    with team(), sessions() as prompts:
+        body = blobs.message_body("t", text)
+        delivery.enqueue("t", "worker-1", body)
+        [item] = delivery.pending("t", "worker-1")
+        assert "text" not in item and item["textRef"] == body["textRef"]
+        assert blobs.gc("t", grace_seconds=0)["deleted"] == 0
+
+        delivery.deliver("t", MEMBER, 0)
+        assert prompts == [("ses_1", text)]
+        assert blobs.gc("t", grace_seconds=0)["deleted"] == 1
+
+
+def test_missing_blob_is_dead_lettered():
+    with team(), sessions() as prompts:
+        delivery.enqueue("t", "worker-1", {"textRef": "0" * 64, "textBytes": 5})
+        delivery.enqueue("t", "worker-1", {"text": "after"})
+        result = delivery.deliver("t", MEMBER, 0)
+        assert result["deadLettered"] == 1 and prompts == [("ses_1", "after")]
+
+
+def test_manual_mode_only_queues():
+    """OPENCODE_TEAM_DELIVERY=manual never spawns a worker or pushes inline"""
+    with team(OPENCODE_TEAM_DELIVERY="manual"), sessions() as prompts:
+        result = delivery.push("t", MEMBER, {"text": "hello"})
+        assert result == {"pushed": False, "queued": True, "batched": 0}
+        assert prompts == [] and len(delivery.pending("t", "worker-1")) == 1
+        assert delivery.outbox_status("t")["workerRunning"] is False
+
+        totals = delivery.run_worker("t", idle_exit=0.0, poll_ms=1)
+        assert totals["delivered"] == 1 and prompts == [("ses_1", "hello")]
+
+
+def test_sync_mode_pushes_inline():
+    with team(OPENCODE_TEAM_DELIVERY="sync"), sessions() as prompts:
+        result = delivery.push("t", MEMBER, {"text": "hello"})
+        assert result["pushed"] is True and prompts == [("ses_1", "hello")]
+
+
+def test_rejected_push_is_dead_lettered():
+    """A 4xx batch leaves the queue at once and shows up in outbox status"""
+    rejected = OpenCodeAPIError("bad request", status=400)
+    with team(), sessions(rejected) as prompts:
+        delivery.enqueue("t", "worker-1", {"text": "poison"})
+        totals = delivery.run_worker("t", idle_exit=0.0, poll_ms=1)
+        assert totals["deadLettered"] == 1 and prompts == []
+        assert delivery.pending("t", "worker-1") == []
+
+        dead = delivery.outbox_status("t")["deadLetters"]["worker-1"]
+        assert dead["count"] == 1 and dead["lastError"] == "bad request"
+
+        delivery.enqueue("t", "worker-1", {"text": "next"})
+        delivery.run_worker("t", idle_exit=0.0, poll_ms=1)
+        assert prompts == [("ses_1", "next")]
+
+
+def test_sync_push_reports_dead_lettered_item_as_not_queued():
+    rejected = OpenCodeAPIError("gone", status=404)
+    with team(), sessions(rejected):
+        result = delivery.push("t", MEMBER, {"text": "hello"}, sync=True)
+        assert result["pushed"] is False and result["queued"] is False
+        assert delivery.outbox_status("t")["deadLetters"]["worker-1"]["count"] == 1
+
+
+def test_transient_failures_dead_letter_after_attempts():
+    """Retryable errors back off, then give up after DEAD_LETTER_ATTEMPTS"""
+    attempts, base = delivery.DEAD_LETTER_ATTEMPTS, delivery.RETRY_BASE_MS
+    delivery.DEAD_LETTER_ATTEMPTS, delivery.RETRY_BASE_MS = 3, 1
+    errors = [CircuitOpenError("open")] + [
+        OpenCodeAPIError("unavailable", status=503, retry=True)
+    ] * 2
+    try:
+        with team(), sessions(*errors) as prompts:
+            delivery.enqueue("t", "worker-1", {"text": "flaky"})
+            totals = delivery.run_worker("t", idle_exit=0.0, poll_ms=1)
+            assert totals["failures"] == 3 and totals["deadLettered"] == 1
+            assert prompts == [] and delivery.pending("t", "worker-1") == []
+            assert dead_letter_path("t", "worker-1").exists()
+    finally:
+        delivery.DEAD_LETTER_ATTEMPTS, delivery.RETRY_BASE_MS = attempts, base
+
+
+def test_outbox_latency_uses_nearest_rank():
+    """Outbox percentiles match the doctor and bench definition"""
+    with team():
+        result = {"delivered": {"a"}, "pushes": 1, "latencyMs": [10, 20, 30, 40]}
+        delivery._record("t", "worker-1", {**result, "error": ""})
+        latency = delivery.outbox_status("t")["recipients"]["worker-1"]["latencyMs"]
+        assert (latency["p50"], latency["p95"], latency["max"]) == (20, 40, 40)
+
+
+def test_stop_worker():
+    """stop_worker ends a running worker and clears the stop request"""
+    with team(), sessions():
+        done = {}
+        worker = threading.Thread(
+            target=lambda: done.update(delivery.run_worker("t", 60.0, 5))
+        )
+        worker.start()
+        time.sleep(0.1)
+        result = delivery.stop_worker("t", timeout=5.0)
+        worker.join(5.0)
+        assert not worker.is_alive()
+        assert result["stopped"] is True and done["stopped"] is True
+        assert not delivery_stop_path("t").exists()
+        assert delivery.stop_worker("t")["stopped"] is False
+
+
+if __name__ == "__main__":
+    test_queued_pushes_coalesce_into_one_prompt()
+    test_same_key_replaces_queued_push()
+    test_large_body_is_queued_by_ref()
+    test_missing_blob_is_dead_lettered()
+    test_manual_mode_only_queues()
+    test_sync_mode_pushes_inline()
+    test_rejected_push_is_dead_lettered()
+    test_sync_push_reports_dead_lettered_item_as_not_queued()
+    test_transient_failures_dead_letter_after_attempts()
+    test_outbox_latency_uses_nearest_rank()
+    test_stop_worker()
+    print("\n✅ All delivery tests passed!")
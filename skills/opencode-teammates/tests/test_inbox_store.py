@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test the indexed inbox store: in-place appends, upserts, and index rebuilds
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import inbox_store
+from common import inbox_index_path, inbox_path
+
+
+def message(n, sender="worker", summary=None):
+    return {"from": sender, "text": f"message {n}", "summary": summary, "read": False}
+
+
+def read_back(team, agent):
+    index = inbox_store.open_index(team, agent)
+    return index, inbox_store.fetch(team, agent, index["entries"])
+
+
+def test_append_in_place():
+    """Appends keep earlier bytes and the file's inode, and the index stays valid"""
+    with team_home():
+        first = inbox_store.append("t", "lead", message(1))
+        path = inbox_path("t", "lead")
+        before = path.read_bytes()
+        inode = path.stat().st_ino
+        second = inbox_store.append("t", "lead", message(2))
+
+        raw = path.read_bytes()
+        assert raw.startswith(before[:-2])
+        assert path.stat().st_ino == inode
+        assert (first["seq"], second["seq"]) == (1, 2)
+        assert [m["text"] for m in json.loads(raw)] == ["message 1", "message 2"]
+
+        index = inbox_store.load_index("t", "lead")
+        assert index is not None and index["nextSeq"] == 3
+        fetched = inbox_store.fetch("t", "lead", index["entries"])
+        assert [m["seq"] for m in fetched] == [1, 2]
+
+
+def test_append_touches_only_the_index_tail():
+    """An append adds one row and one stamp to the index, rewriting nothing"""
+    with team_home():
+        for n in range(5):
+            inbox_store.append("t", "lead", message(n))
+        idx = inbox_index_path("t", "lead")
+        before = idx.read_bytes()
+        inbox_store.append("t", "lead", message(5))
+        after = idx.read_bytes()
+        assert after.startswith(before)
+        assert len(after[len(before) :].splitlines()) == 2
+
+
+def test_upsert_replaces_latest_unread():
+    """upsert_by_summary replaces a matching unread message with a fresh seq"""
+    with team_home():
+        inbox_store.append("t", "lead", message(1, summary="status"))
+        inbox_store.append("t", "lead", message(2, sender="other"))
+        assert inbox_store.upsert_by_summary("t", "lead", message(3, summary="status"))
+        assert not inbox_store.upsert_by_summary("t", "lead", message(4, summary="new"))
+
+        _, messages = read_back("t", "lead")
+        assert [(m["text"], m["seq"]) for m in messages] == [
+            ("message 3", 3),
+            ("message 2", 2),
+            ("message 4", 4),
+        ]
+
+
+def test_mark_read_then_append():
+    """Rewrites followed by in-place appends keep byte spans correct"""
+    with team_home():
+        for n in range(3):
+            inbox_store.append("t", "lead", message(n))
+        index = inbox_store.open_index("t", "lead")
+        inbox_store.mark_read("t", "lead", index, [0, 2])
+        inbox_store.append("t", "lead", message(3))
+
+        index, messages = read_back("t", "lead")
+        assert [m["read"] for m in messages] == [True, False, True, False]
+        assert [e[inbox_store.READ] for e in index["entries"]] == [
+            True,
+            False,
+            True,
+            False,
+        ]
+
+
+def test_rebuild_on_out_of_band_edit():
+    """Editing the inbox behind the index triggers a rebuild that assigns seq"""
+    with team_home():
+        inbox_store.append("t", "lead", message(1))
+        path = inbox_path("t", "lead")
+        messages = json.loads(path.read_bytes())
+        messages.append({"from": "human", "text": "hand-written", "read": False})
+        path.write_text(json.dumps(messages, indent=2))
+
+        assert inbox_store.load_index("t", "lead") is None
+        stored = inbox_store.append("t", "lead", message(3))
+        assert stored["seq"] == 3
+
+        _, messages = read_back("t", "lead")
+        assert [(m["text"], m["seq"]) for m in messages] == [
+            ("message 1", 1),
+            ("hand-written", 2),
+            ("message 3", 3),
+        ]
+
+
+def test_recovers_torn_append():
+    """A crash mid-append leaves a file the next rebuild can repair"""
+    with team_home():
+        inbox_store.append("t", "lead", message(1))
+        path = inbox_path("t", "lead")
+        size = path.stat().st_size
+        with path.open("r+b") as handle:
+            handle.seek(size - 2)
+            handle.write(b', {"from": "wor')
+
+        _, messages = read_back("t", "lead")
+        assert [m["text"] for m in messages] == ["message 1"]
+
+
+def test_old_index_format_is_rebuilt():
+    """A version 1 index (one JSON document) is replaced on first use"""
+    with team_home():
+        inbox_store.append("t", "lead", message(1))
+        inbox_index_path("t", "lead").write_text(json.dumps({"version": 1}))
+        assert inbox_store.load_index("t", "lead") is None
+        inbox_store.append("t", "lead", message(2))
+        _, messages = read_back("t", "lead")
+        assert [m["seq"] for m in messages] == [1, 2]
+
+
+if __name__ == "__main__":
+    test_append_in_place()
+    test_append_touches_only_the_index_tail()
+    test_upsert_replaces_latest_unread()
+    test_mark_read_then_append()
+    test_rebuild_on_out_of_band_edit()
+    test_recovers_torn_append()
+    test_old_index_format_is_rebuilt()
+    print("\n✅ All inbox store tests passed!")
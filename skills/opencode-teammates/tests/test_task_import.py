@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test tasks.py import: plan validation, cycle rejection, and links to existing tasks
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import tasks
+from common import ensure_dirs, tasks_dir, write_config
+
+
+def make_team(team="t"):
+    ensure_dirs(team)
+    write_config(team, {"name": team, "members": [{"name": "team-lead"}]})
+
+
+def rejects(specs, fragment):
+    try:
+        tasks.import_plan("t", specs)
+    except ValueError as exc:
+        assert fragment in str(exc), str(exc)
+    else:
+        raise AssertionError("import_plan accepted an invalid plan")
+
+
+def task_files():
+    return sorted(p.name for p in tasks_dir("t").glob("[0-9]*.json"))
+
+
+def test_import_links_plan_keys():
+    """Keys resolve to new ids, and blocks mirror blockedBy"""
+    with team_home():
+        make_team()
+        result = tasks.import_plan(
+            "t",
+            [
+                {"key": "design", "subject": "Design"},
+                {"key": "build", "subject": "Build", "blockedBy": ["design"]},
+                {"subject": "Ship", "blockedBy": ["build", "design"]},
+            ],
+        )
+        assert result["ids"] == {"design": "1", "build": "2"}
+        assert tasks.get_task("t", "1")["blocks"] == ["2", "3"]
+        assert tasks.get_task("t", "3")["blockedBy"] == ["1", "2"]
+
+
+def test_import_rejects_cycle():
+    """A cycle among plan keys is reported by key and nothing is written"""
+    with team_home():
+        make_team()
+        rejects(
+            [
+                {"key": "a", "subject": "A", "blockedBy": ["c"]},
+                {"key": "b", "subject": "B", "blockedBy": ["a"]},
+                {"key": "c", "subject": "C", "blockedBy": ["b"]},
+                {"key": "d", "subject": "D"},
+            ],
+            "circular dependency among: ['a', 'b', 'c']",
+        )
+        assert task_files() == []
+
+
+def test_import_rejects_self_dependency():
+    with team_home():
+        make_team()
+        rejects([{"key": "a", "subject": "A", "blockedBy": ["a"]}], "itself")
+        assert task_files() == []
+
+
+def test_import_rejects_bad_entries():
+    """Unknown refs, duplicate keys and unknown owners fail before any write"""
+    with team_home():
+        make_team()
+        rejects([{"subject": "A", "blockedBy": ["nope"]}], "unknown dependency")
+        rejects([{"key": "a", "subject": "A"}, {"key": "a", "subject": "B"}], "Dup")
+        rejects([{"subject": "A", "owner": "ghost"}], "not in team")
+        rejects([{"subject": "  "}], "empty subject")
+        assert task_files() == []
+
+
+def test_import_links_existing_tasks():
+    """Plan entries may depend on existing ids, which gain the new blocks"""
+    with team_home():
+        make_team()
+        tasks.create_task("t", "Existing", "", "", "")
+        tasks.import_plan("t", [{"subject": "New", "blockedBy": ["1"]}])
+        assert tasks.get_task("t", "1")["blocks"] == ["2"]
+        assert tasks.get_task("t", "2")["blockedBy"] == ["1"]
+
+
+if __name__ == "__main__":
+    test_import_links_plan_keys()
+    test_import_rejects_cycle()
+    test_import_rejects_self_dependency()
+    test_import_rejects_bad_entries()
+    test_import_links_existing_tasks()
+    print("\n✅ All task import tests passed!")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test the task change log: seq numbering, changes-since reads, and compaction
+"""
+import contextlib
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from _support import team_home
+
+import task_store
+from common import task_changes_path, task_index_path, task_path, write_json_atomic
+
+
+@contextlib.contextmanager
+def log_limit(max_bytes):
+    """Shrink the change log budget so a test can force compaction."""
+    previous = task_store.CHANGE_LOG_MAX_BYTES
+    task_store.CHANGE_LOG_MAX_BYTES = max_bytes
+    try:
+        yield
+    finally:
+        task_store.CHANGE_LOG_MAX_BYTES = previous
+
+
+def create(team, subject):
+    with task_store.task_transaction(team) as txn:
+        task = {"id": txn.next_id(), "subject": subject, "status": "pending"}
+        txn.save(task)
+    return task
+
+
+def update(team, task_id, **fields):
+    with task_store.task_transaction(team) as txn:
+        task = txn.load(task_id)
+        task.update(fields)
+        txn.save(task)
+
+
+def test_changes_since_returns_deltas_in_order():
+    """Each write gets the next seq; readers page through with nextSince"""
+    with team_home():
+        create("t", "a")
+        create("t", "b")
+        update("t", "1", status="in_progress")
+
+        result = task_store.read_changes("t", 0)
+        assert result["reset"] is False
+        assert [(r["seq"], r["op"], r["id"]) for r in result["changes"]] == [
+            (1, "create", "1"),
+            (2, "create", "2"),
+            (3, "update", "1"),
+        ]
+        assert result["changes"][2]["task"]["status"] == "in_progress"
+
+        page = task_store.read_changes("t", 0, limit=2)
+        assert page["hasMore"] is True and page["nextSince"] == 2
+        rest = task_store.read_changes("t", page["nextSince"])
+        assert [r["seq"] for r in rest["changes"]] == [3]
+        assert task_store.read_changes("t", 3)["changes"] == []
+
+
+def test_create_then_delete_in_one_transaction_is_not_logged():
+    """A task created and deleted under one lock hold leaves no log rows"""
+    with team_home():
+        create("t", "keep")
+        with task_store.task_transaction("t") as txn:
+            txn.save({"id": "2", "subject": "scratch", "status": "pending"})
+            txn.delete("2")
+        assert [r["id"] for r in task_store.read_changes("t", 0)["changes"]] == ["1"]
+
+
+def test_changes_since_across_compaction():
+    """Compaction keeps a contiguous tail; older cursors are told to reset"""
+    with team_home(), log_limit(4096):
+        create("t", "a")
+        for n in range(60):
+            update("t", "1", subject=f"a {n}", description="x" * 40)
+
+        index = json.loads(task_index_path("t").read_text())
+        assert task_changes_path("t").stat().st_size <= 4096
+        start = index["logStart"]
+        assert start > 1 and index["seq"] == 61
+
+        stale = task_store.read_changes("t", start - 2)
+        assert stale["reset"] is True and stale["nextSince"] == 61
+
+        edge = task_store.read_changes("t", start - 1)
+        assert edge["reset"] is False
+        assert [r["seq"] for r in edge["changes"]] == list(range(start, 62))
+
+        recent = task_store.read_changes("t", 59)
+        assert [r["subject"] for r in (c["task"] for c in recent["changes"])] == [
+            "a 58",
+            "a 59",
+        ]
+
+
+def test_out_of_band_edit_is_logged():
+    """A task file changed behind the scripts' back shows up as an update"""
+    with team_home():
+        create("t", "a")
+        path = task_path("t", "1")
+        write_json_atomic(path, {"id": "1", "subject": "edited", "status": "pending"})
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        rows = task_store.read_changes("t", 1)["changes"]
+        assert [(r["op"], r["task"]["subject"]) for r in rows] == [
+            ("update", "edited")
+        ]
+
+
+def test_lost_index_resets_existing_readers():
+    """Rebuilding the index burns a seq so earlier cursors re-list"""
+    with team_home():
+        create("t", "a")
+        create("t", "b")
+        task_index_path("t").unlink()
+
+        result = task_store.read_changes("t", 2)
+        assert result["reset"] is True and result["seq"] == 3
+        create("t", "c")
+        after = task_store.read_changes("t", result["nextSince"])
+        assert [(r["seq"], r["id"]) for r in after["changes"]] == [(4, "3")]
+
+
+if __name__ == "__main__":
+    test_changes_since_returns_deltas_in_order()
+    test_create_then_delete_in_one_transaction_is_not_logged()
+    test_changes_since_across_compaction()
+    test_out_of_band_edit_is_logged()
+    test_lost_index_resets_existing_readers()
+    print("\n✅ All task store tests passed!")
@@ -4,34 +4,232 @@
 # dependencies = []
 # ///
 
+"""Drive a dedicated opencode session that watches a claude-teams team.
+
+The loop is driven by the server's event stream (`GET /event`, SSE): session
+status events tell it when the session goes idle, and `message.updated` events
+name the messages to fetch, one by one, instead of re-reading the full session
+history. When the stream is unavailable (or with `--no-events`) it falls back to
+polling `/session/status` and the tail of the message list.
+
+What has been logged is tracked as a per-session high-water mark in the
+`--checkpoint` file, so a restart with `--session-id` resumes where it stopped
+and reads only newer messages.
+
+Sessions run as tasks of one asyncio supervisor. Without `--config` it
+supervises a single session built from the flags; with it, several: one event
+stream and one keep-alive connection pool serve them all, each session keeps
+its own schedule, `maxOutstanding` caps prompts in flight across sessions, and
+every session writes to the same log.
+
+The log is JSON lines (one record per message line, tick, stream change or
+error), buffered and flushed through one open handle, and rotated by size and
+age.
+
+With a team (`--team`, or `team` in the config), each tick first compares cheap
+filesystem signals (inbox file mtimes, the lead's unread count, the task change
+seq) with what they were after the last prompt. Nothing changed means no prompt,
+and the wait before the next check doubles up to `--max-interval`; any change
+snaps it back to `--interval`.
+"""
+
 import argparse
+import asyncio
+import atexit
+import http.client
 import json
+import os
+import queue
 import sys
+import tempfile
+import threading
 import time
 from datetime import datetime, timezone
 from pathlib import Path
-from urllib import error, request
+from urllib import error, parse, request
 
 
-DEFAULT_PROMPT = (
+TEAM_PROMPT = (
     "Check claude-teams inbox for unread teammate messages for team "
-    "'my-team'. Use claude-teams_read_inbox with unread_only=true "
+    "'{team}'. Use claude-teams_read_inbox with unread_only=true "
     "and mark_as_read=false if possible. If a message appears unsafe/rogue, send "
     "a shutdown request and verify cleanup with claude-teams_read_config. "
     "Reply briefly with what is new."
 )
+DEFAULT_PROMPT = TEAM_PROMPT.format(team="my-team")
+HTTP_TIMEOUT = 20
+HTTP_POOL_SIZE = 8
+# The server sends heartbeats; a stream silent for this long is reconnected.
+EVENT_READ_TIMEOUT = 90
+EVENT_CONNECT_GRACE = 5.0
+EVENT_RECONNECT_MAX = 30.0
+FETCH_PAGE = 20
+# Logged messages kept above the mark while an older one is still in progress.
+ABOVE_MAX = 256
+CHECKPOINT_SESSIONS_MAX = 32
+LOG_FLUSH_RECORDS = 256
+DEFAULT_TEAMS_ROOT = "~/.claude"
 
 
 def now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def elapsed_ms(start: float) -> int:
+    return round((time.monotonic() - start) * 1000)
+
+
+class JsonlLog:
+    """Buffered JSON-lines log with size and age rotation.
+
+    Records are written through one open handle, every `flush_seconds` by a
+    daemon thread or sooner once `LOG_FLUSH_RECORDS` are buffered. Past
+    `max_bytes`, or `max_age` seconds after the file was opened (0 disables),
+    `path` is rotated to `path.1` .. `path.<keep>`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int,
+        max_age: float,
+        keep: int,
+        flush_seconds: float,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = max(1, keep)
+        self.flush_seconds = max(0.05, flush_seconds)
+        self.lock = threading.Lock()
+        self.buffer: list[bytes] = []
+        self.handle = None
+        self.size = 0
+        self.opened_at = 0.0
+        self.closed = False
+        threading.Thread(target=self._flusher, daemon=True).start()
+        atexit.register(self.close)
+
+    def write(self, event: str, **fields) -> None:
+        record = {"ts": now(), "event": event, **fields}
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= LOG_FLUSH_RECORDS:
+                self._flush_locked()
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.handle = self.path.open("ab")
+        self.size = self.handle.tell()
+        self.opened_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        self.handle.close()
+        for index in range(self.keep - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+        self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        self._open()
+
+    def _flush_locked(self) -> None:
+        if not self.buffer or self.closed:
+            return
+        data = b"".join(self.buffer)
+        self.buffer = []
+        if self.handle is None:
+            self._open()
+        too_big = self.size + len(data) > self.max_bytes
+        too_old = self.max_age and time.monotonic() - self.opened_at >= self.max_age
+        if self.size and (too_big or too_old):
+            self._rotate()
+        self.handle.write(data)
+        self.handle.flush()
+        self.size += len(data)
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush_locked()
+
+    def _flusher(self) -> None:
+        while not self.closed:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self._flush_locked()
+            self.closed = True
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+
+class HTTPPool:
+    """Keep-alive connections to one server, shared by every thread and session."""
+
+    def __init__(self, scheme: str, netloc: str, size: int) -> None:
+        self.scheme = scheme
+        self.netloc = netloc
+        self.idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=HTTP_TIMEOUT)
+        return http.client.HTTPConnection(self.netloc, timeout=HTTP_TIMEOUT)
+
+    def request(self, method: str, path: str, data: bytes | None) -> bytes:
+        headers = {"content-type": "application/json"}
+        with self.slots:
+            try:
+                conn, reused = self.idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            while True:
+                try:
+                    conn.request(method, path, body=data, headers=headers)
+                    resp = conn.getresponse()
+                    raw = resp.read()
+                    break
+                except (
+                    http.client.RemoteDisconnected,
+                    BrokenPipeError,
+                    ConnectionResetError,
+                ):
+                    conn.close()
+                    # The server dropped an idle keep-alive connection.
+                    if not reused:
+                        raise
+                    conn, reused = self._connect(), False
+                except Exception:
+                    conn.close()
+                    raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self.idle.put(conn)
+        if resp.status >= 400:
+            url = f"{self.scheme}://{self.netloc}{path}"
+            raise error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        return raw
+
+
+_pools: dict[tuple[str, str], HTTPPool] = {}
+_pools_lock = threading.Lock()
+
+
 def http_json(method: str, url: str, body: dict | None = None) -> dict | list:
     data = None if body is None else json.dumps(body).encode("utf-8")
-    req = request.Request(url, data=data, method=method)
-    req.add_header("content-type", "application/json")
-    with request.urlopen(req, timeout=20) as resp:
-        raw = resp.read().decode("utf-8")
+    parts = parse.urlsplit(url)
+    with _pools_lock:
+        pool = _pools.get((parts.scheme, parts.netloc))
+        if pool is None:
+            pool = HTTPPool(parts.scheme, parts.netloc, HTTP_POOL_SIZE)
+            _pools[(parts.scheme, parts.netloc)] = pool
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    raw = pool.request(method, path, data).decode("utf-8")
     return json.loads(raw) if raw else {}
 
 
@@ -44,23 +242,28 @@ def create_session(base_url: str, title: str) -> str:
 
 def prompt_async(base_url: str, session_id: str, text: str) -> None:
     body = {"parts": [{"type": "text", "text": text}]}
-    req = request.Request(
-        f"{base_url}/session/{session_id}/prompt_async",
-        data=json.dumps(body).encode("utf-8"),
-        method="POST",
-    )
-    req.add_header("content-type", "application/json")
-    with request.urlopen(req, timeout=20):
-        return
+    http_json("POST", f"{base_url}/session/{session_id}/prompt_async", body)
 
 
-def get_messages(base_url: str, session_id: str) -> list[dict]:
-    payload = http_json("GET", f"{base_url}/session/{session_id}/message")
+def get_messages(base_url: str, session_id: str, limit: int = 0) -> list[dict]:
+    """Session messages, oldest first; with limit, only the newest `limit`."""
+    query = f"?limit={limit}" if limit > 0 else ""
+    payload = http_json("GET", f"{base_url}/session/{session_id}/message{query}")
     return payload if isinstance(payload, list) else []
 
 
+def get_message(base_url: str, session_id: str, message_id: str) -> dict:
+    payload = http_json(
+        "GET", f"{base_url}/session/{session_id}/message/{message_id}"
+    )
+    return payload if isinstance(payload, dict) else {}
+
+
 def get_session_state(base_url: str, session_id: str) -> str:
-    payload = http_json("GET", f"{base_url}/session/status")
+    return session_state(http_json("GET", f"{base_url}/session/status"), session_id)
+
+
+def session_state(payload: dict | list, session_id: str) -> str:
     if not isinstance(payload, dict):
         return "unknown"
     status = payload.get(session_id)
@@ -68,109 +271,831 @@ def get_session_state(base_url: str, session_id: str) -> str:
         state = status.get("type")
         if isinstance(state, str):
             return state
-    return "unknown"
+    # The server lists only sessions with work in progress.
+    return "idle" if session_id not in payload else "unknown"
+
+
+def message_key(info: dict) -> tuple[float, str]:
+    """Sort key matching the server's message order: creation time, then id."""
+    created = (info.get("time") or {}).get("created")
+    if not isinstance(created, (int, float)):
+        created = 0.0
+    return float(created), str(info.get("id") or "")
+
+
+def is_complete(info: dict) -> bool:
+    return info.get("role") != "assistant" or bool(
+        (info.get("time") or {}).get("completed")
+    )
+
+
+def messages_after(
+    base_url: str, session_id: str, mark: tuple[float, str] | None
+) -> list[dict]:
+    """Messages newer than mark, oldest first, reading only the tail of the list.
+
+    The limit window grows until it reaches back past the mark. Servers that
+    ignore `limit` return the whole list, which is filtered the same way.
+    """
+    if mark is None:
+        return get_messages(base_url, session_id)
+    limit = FETCH_PAGE
+    while True:
+        messages = get_messages(base_url, session_id, limit)
+        if len(messages) < limit or (
+            messages and message_key(messages[0].get("info", {})) <= mark
+        ):
+            break
+        limit *= 4
+    return [msg for msg in messages if message_key(msg.get("info", {})) > mark]
 
 
-def extract_lines(messages: list[dict], seen_message_ids: set[str]) -> list[str]:
-    lines: list[str] = []
+def extract_lines(messages: list[dict]) -> list[dict]:
+    """One log record per text part or tool call."""
+    lines: list[dict] = []
     for msg in messages:
         info = msg.get("info", {})
-        mid = info.get("id")
-        if not mid or mid in seen_message_ids:
-            continue
-        seen_message_ids.add(mid)
-        role = info.get("role", "unknown")
+        base = {"messageId": info.get("id"), "role": info.get("role", "unknown")}
         for part in msg.get("parts", []):
             ptype = part.get("type")
             if ptype == "text":
                 txt = (part.get("text") or "").strip()
                 if txt:
-                    lines.append(f"{role}: {txt}")
+                    lines.append({**base, "text": txt})
             elif ptype == "tool":
                 tool = part.get("tool", "tool")
                 state = part.get("state", {})
                 status = state.get("status", "unknown")
-                lines.append(f"{role}: tool {tool} ({status})")
+                lines.append({**base, "tool": tool, "status": status})
     return lines
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(
-        description="Experimental OpenCode teams orchestrator loop"
-    )
-    parser.add_argument("--base-url", default="http://127.0.0.1:4098")
-    parser.add_argument("--session-id", default="")
-    parser.add_argument("--title", default="claude-teams-orchestrator")
-    parser.add_argument("--interval", type=int, default=8)
-    parser.add_argument("--loops", type=int, default=0, help="0 means run forever")
-    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
-    parser.add_argument("--log", default="/tmp/opencode-teams-orchestrator.log")
-    args = parser.parse_args()
+def event_session_id(event: dict) -> str:
+    props = event.get("properties")
+    if not isinstance(props, dict):
+        return ""
+    for holder in (props, props.get("info"), props.get("part")):
+        if isinstance(holder, dict) and isinstance(holder.get("sessionID"), str):
+            return holder["sessionID"]
+    return ""
+
+
+class TeamSignals:
+    """Cheap view of a team's on-disk state, read without asking the model.
+
+    Covers inbox file mtimes and sizes, the lead's unread count (re-parsed only
+    when its inbox file changes), the task change seq from the task index and
+    the tasks directory mtime, which moves with every atomic task write even
+    before the index catches up.
+    """
+
+    def __init__(self, root: Path, team: str) -> None:
+        self.inboxes = root / "teams" / team / "inboxes"
+        self.tasks = root / "tasks" / team
+        self.unread_stamp: tuple[int, int] | None = None
+        self.unread = 0
+
+    def _lead_unread(self, stamp: tuple[int, int]) -> int:
+        if stamp != self.unread_stamp:
+            try:
+                messages = json.loads(
+                    (self.inboxes / "team-lead.json").read_text(encoding="utf-8")
+                )
+            except (OSError, ValueError):
+                messages = []
+            if not isinstance(messages, list):
+                messages = []
+            self.unread = sum(
+                1 for m in messages if isinstance(m, dict) and not m.get("read")
+            )
+            self.unread_stamp = stamp
+        return self.unread
+
+    def _task_seq(self) -> int:
+        try:
+            index = json.loads(
+                (self.tasks / ".index.json").read_text(encoding="utf-8")
+            )
+            return int(index["seq"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    def _tasks_mtime(self) -> int:
+        try:
+            return self.tasks.stat().st_mtime_ns
+        except OSError:
+            return 0
 
-    log_path = Path(args.log)
+    def read(self) -> dict:
+        inboxes: dict[str, tuple[int, int]] = {}
+        if self.inboxes.is_dir():
+            with os.scandir(self.inboxes) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        inboxes[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        lead = inboxes.get("team-lead.json")
+        return {
+            "inboxes": inboxes,
+            "unread": self._lead_unread(lead) if lead else 0,
+            "taskSeq": self._task_seq(),
+            "tasksMtime": self._tasks_mtime(),
+        }
 
+
+class Pacer:
+    """Tick spacing: `base` while the team changes, backing off while idle.
+
+    Without signals every tick prompts at the base interval. With signals a
+    tick prompts when they changed since the last prompt, or as a heartbeat
+    once `max_interval` has passed; otherwise it is skipped and the delay grows
+    by `factor`, up to `max_interval`.
+    """
+
+    def __init__(
+        self,
+        signals: TeamSignals | None,
+        base: float,
+        max_interval: float,
+        factor: float,
+    ) -> None:
+        self.signals = signals
+        self.base = base
+        self.max_interval = max(base, max_interval)
+        self.factor = max(1.0, factor)
+        self.delay = base
+        self.baseline: dict | None = None
+        self.last_prompt = 0.0
+        self.last_check = 0.0
+
+    def decide(self) -> str:
+        """Why this tick prompts (interval, first, changed, heartbeat) or `idle`."""
+        if self.signals is None:
+            return "interval"
+        if self.baseline is None:
+            return "first"
+        if self.signals.read() != self.baseline:
+            self.delay = self.base
+            return "changed"
+        if time.monotonic() - self.last_prompt >= self.max_interval:
+            return "heartbeat"
+        self.delay = min(self.max_interval, self.delay * self.factor)
+        return "idle"
+
+    def prompted(self) -> None:
+        """Take the baseline after the tick, so the session's own writes count."""
+        self.last_prompt = time.monotonic()
+        if self.signals is not None:
+            self.baseline = self.signals.read()
+
+    def changed(self, every: float) -> bool:
+        """Whether the signals moved off the baseline; checks at most every `every`."""
+        if self.signals is None or self.baseline is None:
+            return False
+        if time.monotonic() - self.last_check < every:
+            return False
+        self.last_check = time.monotonic()
+        return self.signals.read() != self.baseline
+
+    def summary(self) -> dict:
+        """Tick log fields: the next delay plus the signals prompts last saw."""
+        if self.signals is None:
+            return {}
+        fields: dict = {"delayS": round(self.delay, 3)}
+        if self.baseline is not None:
+            fields["unread"] = self.baseline["unread"]
+            fields["taskSeq"] = self.baseline["taskSeq"]
+        return fields
+
+
+def read_checkpoint(path: Path | None) -> dict:
+    if path is None or not path.exists():
+        return {}
     try:
-        _ = http_json("GET", f"{args.base_url}/global/health")
-    except Exception as exc:
-        print(f"server check failed: {exc}", file=sys.stderr)
-        return 1
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
 
-    session_id = args.session_id or create_session(args.base_url, args.title)
-    seen_message_ids: set[str] = set()
 
-    existing = get_messages(args.base_url, session_id)
-    for msg in existing:
-        mid = msg.get("info", {}).get("id")
-        if mid:
-            seen_message_ids.add(mid)
+def write_checkpoint(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump({**data, "version": 1}, handle)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
 
-    with log_path.open("a") as f:
-        f.write(f"{now()} started session={session_id}\n")
 
-    loop = 0
-    while True:
-        loop += 1
+class Checkpoint:
+    """Per-session high-water mark of logged messages, persisted as JSON.
+
+    Every message at or below `mark` (creation time, id) has been logged. The
+    mark only moves past completed messages; logged messages newer than one
+    still in progress are kept in `above` until the mark catches up, so the
+    state stays bounded by the messages in flight rather than the history.
+    """
+
+    def __init__(self, path: Path | None, session_id: str) -> None:
+        self.path = path
+        self.session_id = session_id
+        self.mark: tuple[float, str] | None = None
+        self.above: dict[str, tuple[float, str]] = {}
+        self.in_progress: dict[str, tuple[float, str]] = {}
+        self.dirty = False
+        entry = read_checkpoint(path).get("sessions", {}).get(session_id)
+        if isinstance(entry, dict) and isinstance(entry.get("mark"), list):
+            created, mid = entry["mark"]
+            self.mark = (float(created), str(mid))
+            for mid, key in (entry.get("above") or {}).items():
+                self.above[mid] = (float(key[0]), str(key[1]))
+
+    def seen(self, info: dict) -> bool:
+        key = message_key(info)
+        return (self.mark is not None and key <= self.mark) or key[1] in self.above
+
+    def start_at(self, info: dict) -> None:
+        """Treat everything up to and including info as already logged."""
+        self.mark = message_key(info)
+        self.dirty = True
+
+    def hold(self, info: dict) -> None:
+        """Note a message that is still in progress; the mark stays below it."""
+        self.in_progress[str(info.get("id"))] = message_key(info)
+
+    def logged(self, info: dict) -> None:
+        key = message_key(info)
+        self.in_progress.pop(key[1], None)
+        self.above[key[1]] = key
+        floor = min(self.in_progress.values(), default=None)
+        for mid, above_key in sorted(self.above.items(), key=lambda item: item[1]):
+            if floor is not None and above_key > floor and len(self.above) <= ABOVE_MAX:
+                break
+            del self.above[mid]
+            if self.mark is None or above_key > self.mark:
+                self.mark = above_key
+        # Only an overflowing `above` moves the mark past messages in flight.
+        mark = self.mark
+        self.in_progress = {
+            mid: key for mid, key in self.in_progress.items() if key > mark
+        }
+        self.dirty = True
+
+    def save(self) -> None:
+        if self.path is None or not self.dirty or self.mark is None:
+            return
+        data = read_checkpoint(self.path)
+        sessions = data.get("sessions")
+        if not isinstance(sessions, dict):
+            sessions = {}
+        sessions[self.session_id] = {
+            "mark": list(self.mark),
+            "above": {mid: list(key) for mid, key in self.above.items()},
+            "updatedAt": now(),
+        }
+        newest = sorted(sessions, key=lambda sid: sessions[sid].get("updatedAt", ""))
+        for sid in newest[:-CHECKPOINT_SESSIONS_MAX]:
+            del sessions[sid]
+        write_checkpoint(self.path, {**data, "sessions": sessions})
+        self.dirty = False
+
+
+class EventStream:
+    """Reads `GET /event` on a daemon thread and hands parsed events to `on_event`.
+
+    The supervisor routes them into its event loop. Reconnects with exponential
+    backoff; `connected` is clear while down.
+    """
+
+    def __init__(self, base_url: str, on_event) -> None:
+        self.url = f"{base_url}/event"
+        self.deliver = on_event
+        self.connected = threading.Event()
+        # Set once the first connection attempt has succeeded or failed.
+        self.settled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _read(self) -> None:
+        req = request.Request(self.url, headers={"accept": "text/event-stream"})
+        with request.urlopen(req, timeout=EVENT_READ_TIMEOUT) as resp:
+            self.connected.set()
+            self.settled.set()
+            data: list[str] = []
+            for raw in resp:
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith("data:"):
+                    data.append(line[5:].lstrip())
+                elif not line and data:
+                    try:
+                        event = json.loads("\n".join(data))
+                    except ValueError:
+                        event = None
+                    if isinstance(event, dict):
+                        self.deliver(event)
+                    data = []
+
+    def _run(self) -> None:
+        delay = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                self._read()
+            except Exception:
+                pass
+            self.settled.set()
+            if self.connected.is_set():
+                self.connected.clear()
+                self.deliver({"type": "stream.disconnected"})
+            if time.monotonic() - started > EVENT_RECONNECT_MAX:
+                delay = 1.0
+            time.sleep(delay)
+            delay = min(EVENT_RECONNECT_MAX, delay * 2)
+
+
+class Monitor:
+    """One orchestrator session, run as a task of the supervisor's event loop.
+
+    Events and status polls reach it on the loop thread; HTTP calls run in
+    worker threads (`asyncio.to_thread`) over the shared pool, so monitor
+    state is only ever touched from the loop.
+    """
+
+    def __init__(
+        self,
+        spec: dict,
+        prompts: asyncio.Semaphore,
+        base_url: str,
+        session_id: str,
+        stream: EventStream | None,
+        poll_seconds: float,
+        logger: JsonlLog,
+        checkpoint: Checkpoint,
+        pacer: Pacer,
+    ) -> None:
+        self.spec = spec
+        self.prompts = prompts
+        self.base_url = base_url
+        self.session_id = session_id
+        self.stream = stream
+        self.poll_seconds = poll_seconds
+        self.logger = logger
+        self.label = spec["name"]
+        self.pacer = pacer
+        self.state = "unknown"
+        self.checkpoint = checkpoint
+        self.wake = asyncio.Event()
+        # Messages announced by events, in arrival order, not yet logged.
+        self.announced: dict[str, dict] = {}
+        self.ready = False
+        self.activity = False
+        self.was_streaming = False
+        # Set when events may have been missed: re-read status and history once.
+        self.stale = False
+
+    def emit(self, event: str, **fields) -> None:
+        if self.label:
+            fields["name"] = self.label
+        self.logger.write(event, session=self.session_id, **fields)
+
+    def check_stream(self) -> bool:
+        """Whether the event stream is up; logs a change and marks a reconnect stale."""
+        live = self.stream is not None and self.stream.connected.is_set()
+        if live != self.was_streaming:
+            self.emit("stream", connected=live)
+            self.was_streaming = live
+            self.stale = live
+        return live
+
+    def handle(self, event: dict) -> None:
+        etype = event.get("type")
+        props = event.get("properties") or {}
+        sid = event_session_id(event)
+        if sid != self.session_id:
+            # Another session finishing a turn hints that the team moved; only
+            # team signals can confirm it, so without them it is ignored.
+            if (
+                sid
+                and etype in {"session.idle", "message.updated"}
+                and self.pacer.signals is not None
+            ):
+                self.activity = True
+                self.wake.set()
+            elif etype == "stream.disconnected":
+                self.wake.set()
+            return
+        self.wake.set()
+        if etype == "session.status":
+            status = props.get("status")
+            if isinstance(status, dict) and isinstance(status.get("type"), str):
+                self.state = status["type"]
+        elif etype == "session.idle":
+            self.state = "idle"
+        elif etype == "message.updated":
+            info = props.get("info") or {}
+            mid = info.get("id")
+            if isinstance(mid, str) and not self.checkpoint.seen(info):
+                self.announced[mid] = info
+                if is_complete(info):
+                    self.ready = True
+                else:
+                    self.checkpoint.hold(info)
+
+    def observe(self, statuses: dict | list) -> None:
+        self.state = session_state(statuses, self.session_id)
+        self.wake.set()
+
+    async def pause(self, timeout: float) -> None:
         try:
-            state = get_session_state(args.base_url, session_id)
-            if state == "busy":
-                with log_path.open("a") as f:
-                    f.write(f"{now()} tick busy\n")
-                if args.loops > 0 and loop >= args.loops:
-                    break
-                time.sleep(args.interval)
+            await asyncio.wait_for(self.wake.wait(), max(0.0, timeout))
+        except TimeoutError:
+            pass
+        self.wake.clear()
+
+    def plan_fetch(self, fallback: bool) -> tuple[bool, list[str]]:
+        """What to fetch next: (read the list back to the mark, message ids).
+
+        Announced messages are fetched by id; in fallback mode (no stream, or
+        events possibly missed) the list is read back to the checkpoint mark.
+        """
+        self.ready = False
+        if fallback and (not self.check_stream() or self.stale):
+            self.announced.clear()
+            self.stale = False
+            return True, []
+        ids = []
+        for mid, info in list(self.announced.items()):
+            if not is_complete(info) and self.state == "busy":
                 continue
+            del self.announced[mid]
+            if not self.checkpoint.seen(info):
+                ids.append(mid)
+        return False, ids
 
-            prompt_async(args.base_url, session_id, args.prompt)
+    def fetch(self, full: bool, ids: list[str]) -> list[dict]:
+        """HTTP only, so it can run off the event loop."""
+        if full:
+            return messages_after(self.base_url, self.session_id, self.checkpoint.mark)
+        return [get_message(self.base_url, self.session_id, mid) for mid in ids]
 
-            wait_start = time.time()
-            while time.time() - wait_start < max(10, args.interval * 2):
-                if get_session_state(args.base_url, session_id) != "busy":
-                    break
-                time.sleep(1)
+    def absorb(self, candidates: list[dict]) -> list[dict]:
+        done = []
+        for msg in candidates:
+            info = msg.get("info", {})
+            if self.checkpoint.seen(info):
+                continue
+            if is_complete(info):
+                done.append(msg)
+                self.checkpoint.logged(info)
+            else:
+                self.checkpoint.hold(info)
+        return extract_lines(done)
+
+    async def collect(self, fallback: bool) -> list[dict]:
+        """Log records for newly completed messages."""
+        full, ids = self.plan_fetch(fallback)
+        messages = await asyncio.to_thread(self.fetch, full, ids)
+        lines = self.absorb(messages)
+        self.checkpoint.save()
+        return lines
 
-            lines = extract_lines(
-                get_messages(args.base_url, session_id), seen_message_ids
+    async def rest(self, min_seconds: float) -> None:
+        """Wait out the pacer's delay, logging completed messages as they arrive.
+
+        Returns early (after min_seconds) once the team's signals change;
+        activity in another session only makes it check them right away.
+        """
+        start = time.monotonic()
+        self.activity = False
+        while (remaining := start + self.pacer.delay - time.monotonic()) > 0:
+            # Wake at least every poll period to look at the team's signals.
+            await self.pause(min(remaining, self.poll_seconds))
+            if self.ready and self.check_stream():
+                for line in await self.collect(fallback=False):
+                    self.emit("message", **line)
+            if time.monotonic() - start < min_seconds:
+                continue
+            every = 0.0 if self.activity else self.poll_seconds
+            self.activity = False
+            if self.pacer.changed(every):
+                return
+
+    async def tick(self) -> None:
+        """Prompt unless busy or idle, wait for the reply and log it with timings."""
+        spec = self.spec
+        start = time.monotonic()
+        try:
+            reason = self.pacer.decide()
+            if reason == "idle":
+                self.emit("tick", state="skipped", **self.pacer.summary())
+                return
+            if not self.check_stream() or self.stale:
+                self.state = await asyncio.to_thread(
+                    get_session_state, self.base_url, self.session_id
+                )
+            if self.state == "busy":
+                self.emit("tick", state="busy", tickMs=elapsed_ms(start))
+                return
+            # Held until the reply is in: caps prompts in flight.
+            async with self.prompts:
+                queued_ms = elapsed_ms(start)
+                sent = time.monotonic()
+                await asyncio.to_thread(
+                    prompt_async, self.base_url, self.session_id, spec["prompt"]
+                )
+                self.state = "busy"
+                deadline = sent + max(10, spec["interval"] * 2)
+                while self.state == "busy" and time.monotonic() < deadline:
+                    await self.pause(deadline - time.monotonic())
+                prompt_ms = elapsed_ms(sent)
+            lines = await self.collect(fallback=True)
+            self.pacer.prompted()
+            for line in lines:
+                self.emit("message", **line)
+            self.emit(
+                "tick",
+                state=self.state,
+                reason=reason,
+                queuedMs=queued_ms,
+                promptMs=prompt_ms,
+                tickMs=elapsed_ms(start),
+                lines=len(lines),
+                **self.pacer.summary(),
             )
-            with log_path.open("a") as f:
-                if lines:
-                    for line in lines:
-                        f.write(f"{now()} {line}\n")
-                else:
-                    f.write(f"{now()} tick no-new-messages\n")
         except error.HTTPError as exc:
-            with log_path.open("a") as f:
-                f.write(f"{now()} http-error {exc.code}\n")
+            self.emit("error", status=exc.code, tickMs=elapsed_ms(start))
         except Exception as exc:
-            with log_path.open("a") as f:
-                f.write(f"{now()} error {exc}\n")
+            self.emit("error", error=str(exc), tickMs=elapsed_ms(start))
 
-        if args.loops > 0 and loop >= args.loops:
-            break
-        time.sleep(args.interval)
+    async def run(self) -> None:
+        spec = self.spec
+        self.emit("started")
+        loop = 0
+        while True:
+            loop += 1
+            await self.tick()
+            if spec["loops"] > 0 and loop >= spec["loops"]:
+                break
+            await self.rest(spec["minInterval"])
+        self.emit("stopped")
+
+
+def load_config(path: Path, args: argparse.Namespace) -> dict:
+    """Supervisor config; command-line flags supply the defaults."""
+    config = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(config, dict) or not isinstance(config.get("sessions"), list):
+        raise ValueError("config must be an object with a 'sessions' list")
+    names: set[str] = set()
+    for spec in config["sessions"]:
+        name = spec.get("name") if isinstance(spec, dict) else None
+        if not isinstance(name, str) or not name or name in names:
+            raise ValueError("every session needs a unique 'name'")
+        names.add(name)
+    return with_defaults(config, args)
+
+
+def single_config(args: argparse.Namespace) -> dict:
+    """A one-session config from the command-line flags.
+
+    The session has no name: its records carry none, and it is resumed only
+    through --session-id, never by name from the checkpoint.
+    """
+    spec = {
+        "name": "",
+        "team": args.team,
+        "prompt": args.prompt or TEAM_PROMPT.format(team=args.team or "my-team"),
+        "title": args.title,
+        "sessionId": args.session_id,
+    }
+    return with_defaults({"sessions": [spec]}, args)
+
+
+def with_defaults(config: dict, args: argparse.Namespace) -> dict:
+    config.setdefault("baseUrl", args.base_url)
+    config.setdefault("log", args.log)
+    config.setdefault("checkpoint", args.checkpoint)
+    config.setdefault("events", not args.no_events)
+    config.setdefault("pollSeconds", args.poll_seconds)
+    config.setdefault("maxOutstanding", args.max_outstanding)
+    config.setdefault("teamsRoot", args.teams_root)
+    if int(config["maxOutstanding"]) < 1:
+        raise ValueError("maxOutstanding must be at least 1")
+    for spec in config["sessions"]:
+        name = spec["name"]
+        team = spec.get("team")
+        spec.setdefault(
+            "prompt",
+            TEAM_PROMPT.format(team=team) if team else args.prompt or DEFAULT_PROMPT,
+        )
+        spec.setdefault("title", f"{args.title}-{name}")
+        spec.setdefault("sessionId", "")
+        spec.setdefault("interval", args.interval)
+        spec.setdefault("minInterval", args.min_interval)
+        spec.setdefault("loops", args.loops)
+        spec.setdefault("maxInterval", args.max_interval)
+        spec.setdefault("backoff", args.backoff)
+    return config
+
+
+def make_pacer(
+    root: str, team: str, interval: float, max_interval: float, factor: float
+) -> Pacer:
+    signals = TeamSignals(Path(root).expanduser(), team) if team else None
+    return Pacer(signals, interval, max_interval, factor)
+
+
+def resolve_session(base_url: str, spec: dict, known: str) -> tuple[str, bool]:
+    """(session id, resumed) for one config entry; creates a session if needed."""
+    if spec["sessionId"]:
+        return spec["sessionId"], True
+    if known:
+        try:
+            http_json("GET", f"{base_url}/session/{known}")
+            return known, True
+        except error.HTTPError as exc:
+            if exc.code != 404:
+                raise
+    return create_session(base_url, spec["title"]), False
+
+
+async def supervise(config: dict, logger: JsonlLog) -> dict[str, str]:
+    base_url = config["baseUrl"]
+    checkpoint_path = Path(config["checkpoint"]) if config["checkpoint"] else None
+    poll_seconds = max(0.1, float(config["pollSeconds"]))
+    loop = asyncio.get_running_loop()
+    monitors: list[Monitor] = []
 
-    with log_path.open("a") as f:
-        f.write(f"{now()} stopped session={session_id}\n")
-    print(session_id)
+    def route(event: dict) -> None:
+        for monitor in monitors:
+            monitor.handle(event)
+
+    stream = None
+    if config["events"]:
+        stream = EventStream(
+            base_url, on_event=lambda event: loop.call_soon_threadsafe(route, event)
+        )
+        await asyncio.to_thread(stream.settled.wait, EVENT_CONNECT_GRACE)
+
+    prompts = asyncio.Semaphore(int(config["maxOutstanding"]))
+    known = read_checkpoint(checkpoint_path).get("names") or {}
+    for spec in config["sessions"]:
+        previous = known.get(spec["name"]) if spec["name"] else ""
+        session_id, resumed = await asyncio.to_thread(
+            resolve_session, base_url, spec, str(previous or "")
+        )
+        checkpoint = Checkpoint(checkpoint_path, session_id)
+        if resumed and checkpoint.mark is None:
+            newest = await asyncio.to_thread(get_messages, base_url, session_id, 1)
+            if newest:
+                checkpoint.start_at(newest[-1].get("info", {}))
+                checkpoint.save()
+        monitor = Monitor(
+            spec,
+            prompts,
+            base_url,
+            session_id,
+            stream,
+            poll_seconds,
+            logger,
+            checkpoint,
+            make_pacer(
+                config["teamsRoot"],
+                spec.get("team") or "",
+                spec["interval"],
+                spec["maxInterval"],
+                spec["backoff"],
+            ),
+        )
+        monitor.was_streaming = stream is not None and stream.connected.is_set()
+        monitors.append(monitor)
+    sessions = {monitor.label: monitor.session_id for monitor in monitors}
+    named = {name: sid for name, sid in sessions.items() if name}
+    if checkpoint_path is not None and named:
+        data = read_checkpoint(checkpoint_path)
+        write_checkpoint(checkpoint_path, {**data, "names": {**known, **named}})
+
+    mode = "events" if stream is not None and stream.connected.is_set() else "polling"
+    logger.write("supervisor.started", sessions=sessions, mode=mode)
+
+    async def poll_status() -> None:
+        # One status request per period serves every session while polling.
+        while True:
+            await asyncio.sleep(poll_seconds)
+            if stream is not None and stream.connected.is_set():
+                continue
+            try:
+                statuses = await asyncio.to_thread(
+                    http_json, "GET", f"{base_url}/session/status"
+                )
+            except Exception:
+                continue
+            for monitor in monitors:
+                monitor.observe(statuses)
+
+    poller = asyncio.create_task(poll_status())
+    try:
+        await asyncio.gather(*(monitor.run() for monitor in monitors))
+    finally:
+        poller.cancel()
+        logger.write("supervisor.stopped")
+    return sessions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Experimental OpenCode teams orchestrator loop"
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:4098")
+    parser.add_argument("--session-id", default="")
+    parser.add_argument("--title", default="claude-teams-orchestrator")
+    parser.add_argument("--interval", type=int, default=8)
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=2.0,
+        help="Earliest next tick when the team's signals change (needs --team)",
+    )
+    parser.add_argument(
+        "--poll-seconds",
+        type=float,
+        default=1.0,
+        help="Status poll period when the event stream is unavailable",
+    )
+    parser.add_argument(
+        "--no-events", action="store_true", help="Poll instead of using /event"
+    )
+    parser.add_argument("--loops", type=int, default=0, help="0 means run forever")
+    parser.add_argument("--prompt", default="", help="Defaults to the inbox check")
+    parser.add_argument(
+        "--team", default="", help="Watch this team's files and skip idle ticks"
+    )
+    parser.add_argument("--teams-root", default=DEFAULT_TEAMS_ROOT)
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=300.0,
+        help="Backoff ceiling and heartbeat prompt period for an idle team",
+    )
+    parser.add_argument(
+        "--backoff", type=float, default=2.0, help="Delay factor per idle tick"
+    )
+    parser.add_argument("--log", default="/tmp/opencode-teams-orchestrator.jsonl")
+    parser.add_argument(
+        "--log-max-bytes", type=int, default=10 * 1024 * 1024, help="Rotate size"
+    )
+    parser.add_argument(
+        "--log-rotate-hours", type=float, default=24.0, help="0 disables"
+    )
+    parser.add_argument("--log-keep", type=int, default=5, help="Rotated files")
+    parser.add_argument("--log-flush-seconds", type=float, default=1.0)
+    parser.add_argument(
+        "--checkpoint",
+        default="/tmp/opencode-teams-orchestrator.checkpoint.json",
+        help="Per-session high-water mark of logged messages; empty disables",
+    )
+    parser.add_argument(
+        "--config", default="", help="JSON file of sessions to supervise together"
+    )
+    parser.add_argument(
+        "--max-outstanding",
+        type=int,
+        default=2,
+        help="With --config, prompts in flight across all sessions",
+    )
+    args = parser.parse_args()
+
+    try:
+        config = load_config(Path(args.config), args) if args.config else None
+    except (OSError, ValueError) as exc:
+        print(f"invalid config: {exc}", file=sys.stderr)
+        return 1
+    if config is None:
+        config = single_config(args)
+    logger = JsonlLog(
+        Path(config["log"]),
+        args.log_max_bytes,
+        args.log_rotate_hours * 3600,
+        args.log_keep,
+        args.log_flush_seconds,
+    )
+
+    try:
+        _ = http_json("GET", f"{config['baseUrl']}/global/health")
+    except Exception as exc:
+        print(f"server check failed: {exc}", file=sys.stderr)
+        return 1
+
+    try:
+        sessions = asyncio.run(supervise(config, logger))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        logger.close()
+    print(sessions[""] if not args.config else json.dumps(sessions))
     return 0
 
 